@@ -1,16 +1,17 @@
 from __future__ import annotations
 
 import json
-from typing import Any, Optional
+from typing import Any, Optional, Union
 
 from sqlalchemy.orm import Session
 
+from app.auth import AuthUser
 from app.models import AuditLog, User
 
 
 def log_event(
     db: Session,
-    user: Optional[User],
+    user: Optional[Union[User, AuthUser]],
     action: str,
     entity_type: str,
     entity_id: Optional[str] = None,
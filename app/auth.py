@@ -4,17 +4,34 @@ import base64
 import hashlib
 import hmac
 import os
-from typing import Optional
+import threading
+import time
+from typing import Any, Dict, NamedTuple, Optional, Tuple
 
-from sqlalchemy import select
+from sqlalchemy import bindparam, func, lambda_stmt, select
 from sqlalchemy.orm import Session
 
-from app.models import User
+from app.models import Role, User, role_flag_for
 
 
 _PBKDF2_ITERATIONS = 200_000
 
 
+class AuthUser(NamedTuple):
+    """Read-only view of the columns the per-request auth path needs."""
+
+    id: int
+    username: str
+    role: Optional[str]
+    business_id: Optional[int]
+    is_active: bool
+    must_change_password: bool
+
+    @property
+    def role_flag(self) -> Role:
+        return role_flag_for(self.role)
+
+
 def hash_password(password: str) -> str:
     salt = os.urandom(16)
     dk = hashlib.pbkdf2_hmac(
@@ -52,6 +69,83 @@ def get_user_by_username(db: Session, username: str) -> Optional[User]:
     return db.scalar(select(User).where(User.username == u))
 
 
+_AUTH_USER_COLUMNS = (
+    User.id,
+    User.username,
+    User.role,
+    User.business_id,
+    User.is_active,
+    User.must_change_password,
+)
+
+_AUTH_USER_BY_USERNAME = lambda_stmt(
+    lambda: select(*_AUTH_USER_COLUMNS).where(User.username == bindparam("username"))
+)
+_ADMIN_USER_BY_USERNAME = lambda_stmt(
+    lambda: select(*_AUTH_USER_COLUMNS).where(
+        User.username == bindparam("username"),
+        func.lower(User.role) == "admin",
+        User.is_active.is_(True),
+    )
+)
+
+
+def _to_auth_user(row) -> AuthUser:
+    return AuthUser(
+        id=int(row.id),
+        username=row.username,
+        role=row.role,
+        business_id=int(row.business_id) if row.business_id is not None else None,
+        is_active=bool(row.is_active),
+        must_change_password=bool(row.must_change_password),
+    )
+
+
+# Short-lived per-process cache for the session user lookup, which runs on
+# every request. Entries hold plain AuthUser tuples tagged with the engine they
+# came from; user-mutation endpoints call invalidate_user().
+_USER_CACHE_TTL_SECONDS = 2.0
+_USER_CACHE_MAXSIZE = 4096
+_user_cache: Dict[str, Tuple[float, Any, AuthUser]] = {}
+_user_cache_lock = threading.Lock()
+
+
+def invalidate_user(username: Optional[str] = None) -> None:
+    with _user_cache_lock:
+        if username is None:
+            _user_cache.clear()
+        else:
+            _user_cache.pop((username or "").strip(), None)
+
+
+def get_user_auth(db: Session, username: str) -> Optional[AuthUser]:
+    u = (username or "").strip()
+    if not u:
+        return None
+    bind = db.get_bind()
+    now = time.monotonic()
+    cached = _user_cache.get(u)
+    if cached is not None and cached[0] > now and cached[1] is bind:
+        return cached[2]
+    row = db.execute(_AUTH_USER_BY_USERNAME, {"username": u}).first()
+    if row is None:
+        return None
+    user = _to_auth_user(row)
+    with _user_cache_lock:
+        if len(_user_cache) >= _USER_CACHE_MAXSIZE:
+            _user_cache.clear()
+        _user_cache[u] = (now + _USER_CACHE_TTL_SECONDS, bind, user)
+    return user
+
+
+def get_admin_user_by_username(db: Session, username: str) -> Optional[AuthUser]:
+    u = (username or "").strip()
+    if not u:
+        return None
+    row = db.execute(_ADMIN_USER_BY_USERNAME, {"username": u}).first()
+    return _to_auth_user(row) if row is not None else None
+
+
 def authenticate(db: Session, username: str, password: str) -> Optional[User]:
     user = get_user_by_username(db, username)
     if user is None or not user.is_active:
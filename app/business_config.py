@@ -4,6 +4,7 @@ import configparser
 import json
 import os
 import re
+import time
 from pathlib import Path
 from typing import Dict, List, Optional, Tuple
 
@@ -79,7 +80,12 @@ class BusinessConfig(BaseModel):
     purchase: PurchaseConfig = Field(default_factory=PurchaseConfig)
 
 
-_cached_configs: Dict[str, Tuple[BusinessConfig, str, float]] = {}
+# key -> (config, path, file mtime, monotonic time of the last path/mtime check)
+_cached_configs: Dict[str, Tuple[BusinessConfig, str, float, float]] = {}
+
+# Within this window a cached config is returned without touching the
+# filesystem; after it, the path and mtime are checked again.
+_CONFIG_RECHECK_SECONDS = 5.0
 
 
 def load_business_config(business_code: Optional[str] = None) -> BusinessConfig:
@@ -87,6 +93,11 @@ def load_business_config(business_code: Optional[str] = None) -> BusinessConfig:
 
     key = (business_code or "").strip().lower()
 
+    now = time.monotonic()
+    cached = _cached_configs.get(key)
+    if cached is not None and now - cached[3] < _CONFIG_RECHECK_SECONDS:
+        return cached[0]
+
     base_path = os.getenv("BUSINESS_CONFIG_PATH", "app/business_config.conf")
     base = Path(base_path)
 
@@ -126,14 +137,14 @@ def load_business_config(business_code: Optional[str] = None) -> BusinessConfig:
     except Exception:
         mtime = 0.0
 
-    cached = _cached_configs.get(key)
     if cached is not None:
-        cfg_cached, cached_path, cached_mtime = cached
+        cfg_cached, cached_path, cached_mtime, _checked_at = cached
         if cached_path == path_str and float(cached_mtime or 0.0) == float(mtime or 0.0):
+            _cached_configs[key] = (cfg_cached, cached_path, cached_mtime, now)
             return cfg_cached
     if not path.exists():
         cfg0 = BusinessConfig()
-        _cached_configs[key] = (cfg0, path_str, mtime)
+        _cached_configs[key] = (cfg0, path_str, mtime, now)
         return cfg0
 
     if path.suffix.lower() == ".json":
@@ -142,7 +153,7 @@ def load_business_config(business_code: Optional[str] = None) -> BusinessConfig:
             cfg_json = BusinessConfig.model_validate(data)
         else:
             cfg_json = BusinessConfig.parse_obj(data)
-        _cached_configs[key] = (cfg_json, path_str, mtime)
+        _cached_configs[key] = (cfg_json, path_str, mtime, now)
         return cfg_json
 
     parser = configparser.ConfigParser()
@@ -327,5 +338,5 @@ def load_business_config(business_code: Optional[str] = None) -> BusinessConfig:
     if cfg.locations.default_pos not in {p.code for p in cfg.locations.pos}:
         cfg.locations.default_pos = cfg.locations.pos[0].code
 
-    _cached_configs[key] = (cfg, path_str, mtime)
+    _cached_configs[key] = (cfg, path_str, mtime, now)
     return cfg
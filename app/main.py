@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+import asyncio
 import os
 import sys
 import time
@@ -33,7 +34,9 @@ from app.routers import (
     ui_transfers,
     ui_users,
 )
+from app.db import engine
 from app.migrations import run_startup_tasks
+from app.services.inventory_service import run_monthly_financials_refresher
 from app.utils import get_session_secret
 
 
@@ -41,7 +44,14 @@ from app.utils import get_session_secret
 async def lifespan(app: FastAPI) -> AsyncGenerator[None, None]:
     """Lifecycle manager para FastAPI."""
     run_startup_tasks()
+    refresher = None
+    if os.getenv("MONTHLY_FINANCIALS_VIEW", "0") == "1" and engine.dialect.name == "postgresql":
+        refresher = asyncio.create_task(
+            run_monthly_financials_refresher(float(os.getenv("MONTHLY_FINANCIALS_REFRESH_SECONDS", "300")))
+        )
     yield
+    if refresher is not None:
+        refresher.cancel()
 
 
 app = FastAPI(title="Inventario", lifespan=lifespan)
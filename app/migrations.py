@@ -25,6 +25,105 @@ from app.models import (
 
 _LATEST_SCHEMA_VERSION = 2
 
+# Índices compuestos para las consultas de FIFO e informes. create_all solo los
+# crea en tablas nuevas; en BD existentes se crean aquí.
+_QUERY_INDEXES = (
+    "CREATE INDEX IF NOT EXISTS ix_im_product_date_id ON inventory_movements(product_id, movement_date, id)",
+    "CREATE INDEX IF NOT EXISTS ix_im_type_date ON inventory_movements(type, movement_date)",
+    "CREATE INDEX IF NOT EXISTS ix_lot_remaining ON inventory_lots(product_id, received_at, id) WHERE qty_remaining > 0",
+)
+
+
+# Índice de expresión por día UTC; la expresión debe coincidir con app.models.utc_day.
+_DAY_INDEXES = {
+    "sqlite": "CREATE INDEX IF NOT EXISTS ix_im_type_day ON inventory_movements(type, date(movement_date))",
+    "postgresql": (
+        "CREATE INDEX IF NOT EXISTS ix_im_type_day ON inventory_movements"
+        "(type, CAST((movement_date AT TIME ZONE 'UTC') AS DATE))"
+    ),
+}
+
+
+# Resumen mensual materializado (solo PostgreSQL) para el panel; ver
+# app.services.inventory_service._MONTHLY_FINANCIALS_ENABLED. El índice único
+# es obligatorio para REFRESH ... CONCURRENTLY. Solo se crea con
+# MONTHLY_FINANCIALS_VIEW=1; el refresco lo programa app.main, no el arranque.
+_MONTHLY_FINANCIALS_DDL = (
+    "CREATE MATERIALIZED VIEW IF NOT EXISTS monthly_financials AS"
+    " SELECT m.business_id, m.location_id, m.product_id,"
+    " to_char((m.movement_date AT TIME ZONE 'UTC'), 'YYYY-MM') AS year_month,"
+    " sum(CASE WHEN m.type = 'purchase' THEN m.quantity ELSE 0 END) AS qty_purchased,"
+    " sum(CASE WHEN m.type = 'purchase' THEN m.quantity * coalesce(m.unit_cost, 0) ELSE 0 END) AS purchases_value,"
+    " sum(CASE WHEN m.type = 'sale' THEN abs(m.quantity) ELSE 0 END) AS qty_sold,"
+    " sum(CASE WHEN m.type = 'sale' THEN m.line_revenue ELSE 0 END) AS sales_value,"
+    " sum(CASE WHEN m.type = 'sale' THEN coalesce(a.cogs, 0) ELSE 0 END) AS cogs_value"
+    " FROM inventory_movements m"
+    " LEFT JOIN (SELECT movement_id, sum(quantity * unit_cost) AS cogs"
+    " FROM movement_allocations GROUP BY movement_id) a ON a.movement_id = m.id"
+    " WHERE m.type IN ('purchase', 'sale')"
+    " GROUP BY 1, 2, 3, 4",
+    "CREATE UNIQUE INDEX IF NOT EXISTS ux_monthly_financials"
+    " ON monthly_financials(business_id, location_id, product_id, year_month)",
+)
+
+
+def _ensure_monthly_financials(conn) -> None:
+    for ddl in _MONTHLY_FINANCIALS_DDL:
+        conn.exec_driver_sql(ddl)
+
+
+# En PostgreSQL ix_im_type_date cubre además las columnas que suman los informes
+# (debe coincidir con app.models.InventoryMovement.__table_args__).
+_PG_TYPE_DATE_INCLUDE = "business_id, location_id, product_id, quantity, unit_cost, unit_price, line_revenue"
+# El stock por producto y el recorrido FIFO leen solo estas columnas de los lotes vivos.
+_PG_LOT_REMAINING_INCLUDE = "business_id, location_id, qty_remaining, unit_cost"
+
+
+# En PostgreSQL estos dos se crean directamente con INCLUDE (ver
+# _ensure_covering_type_date_index / _ensure_covering_lot_index); crearlos aquí
+# sin INCLUDE obligaría a construirlos dos veces.
+_PG_COVERING_QUERY_INDEXES = ("ix_im_type_date", "ix_lot_remaining")
+
+
+def _ensure_query_indexes(conn) -> None:
+    for ddl in _QUERY_INDEXES:
+        if conn.dialect.name == "postgresql" and any(f" {name} ON " in ddl for name in _PG_COVERING_QUERY_INDEXES):
+            continue
+        conn.exec_driver_sql(ddl)
+    day_ddl = _DAY_INDEXES.get(conn.dialect.name)
+    if day_ddl:
+        conn.exec_driver_sql(day_ddl)
+
+
+def _ensure_covering_type_date_index(conn) -> None:
+    indexdef = conn.exec_driver_sql(
+        "SELECT indexdef FROM pg_indexes WHERE tablename = 'inventory_movements' AND indexname = 'ix_im_type_date'"
+    ).scalar()
+    if indexdef is not None:
+        if "INCLUDE" in indexdef.upper():
+            return
+        # Índice antiguo sin INCLUDE: se reconstruye.
+        conn.exec_driver_sql("DROP INDEX ix_im_type_date")
+    conn.exec_driver_sql(
+        "CREATE INDEX ix_im_type_date ON inventory_movements(type, movement_date) "
+        f"INCLUDE ({_PG_TYPE_DATE_INCLUDE})"
+    )
+
+
+def _ensure_covering_lot_index(conn) -> None:
+    indexdef = conn.exec_driver_sql(
+        "SELECT indexdef FROM pg_indexes WHERE tablename = 'inventory_lots' AND indexname = 'ix_lot_remaining'"
+    ).scalar()
+    if indexdef is not None:
+        if "INCLUDE" in indexdef.upper():
+            return
+        # Índice antiguo sin INCLUDE: se reconstruye.
+        conn.exec_driver_sql("DROP INDEX ix_lot_remaining")
+    conn.exec_driver_sql(
+        "CREATE INDEX ix_lot_remaining ON inventory_lots(product_id, received_at, id) "
+        f"INCLUDE ({_PG_LOT_REMAINING_INCLUDE}) WHERE qty_remaining > 0"
+    )
+
 
 def _ensure_schema_version_table(conn) -> None:
     dialect = conn.dialect.name
@@ -200,6 +299,21 @@ def _run_sqlite_schema_migrations() -> int:
                 "ALTER TABLE inventory_movements ADD COLUMN location_id INTEGER"
             )
 
+        # table_info omite las columnas generadas; table_xinfo las incluye.
+        mv_xcols = {
+            row[1]
+            for row in conn.exec_driver_sql(
+                "PRAGMA table_xinfo(inventory_movements)"
+            ).fetchall()
+        }
+        if "line_revenue" not in mv_xcols:
+            # SQLite solo permite añadir columnas generadas VIRTUAL con ALTER TABLE;
+            # las BD nuevas la crean STORED desde el modelo.
+            conn.exec_driver_sql(
+                "ALTER TABLE inventory_movements ADD COLUMN line_revenue NUMERIC(18, 4) "
+                "GENERATED ALWAYS AS (abs(quantity) * coalesce(unit_price, 0)) VIRTUAL"
+            )
+
         try:
             conn.exec_driver_sql(
                 "CREATE INDEX IF NOT EXISTS ix_inventory_movements_location_id ON inventory_movements(location_id)"
@@ -226,6 +340,8 @@ def _run_sqlite_schema_migrations() -> int:
                 "No se pudo crear el índice para inventory_lots.location_id."
             ) from e
 
+        _ensure_query_indexes(conn)
+
         if schema_version < 1:
             _set_schema_version(conn, 1)
             schema_version = 1
@@ -360,6 +476,16 @@ def _run_postgresql_schema_migrations() -> int:
                 "No se pudo crear la columna location_id en inventory_movements."
             ) from e
 
+        try:
+            conn.exec_driver_sql(
+                "ALTER TABLE inventory_movements ADD COLUMN IF NOT EXISTS line_revenue NUMERIC(18, 4) "
+                "GENERATED ALWAYS AS (abs(quantity) * coalesce(unit_price, 0)) STORED"
+            )
+        except SQLAlchemyError as e:
+            raise RuntimeError(
+                "No se pudo crear la columna line_revenue en inventory_movements."
+            ) from e
+
         try:
             exists = conn.exec_driver_sql(
                 "SELECT 1 FROM information_schema.columns WHERE table_name='inventory_lots' AND column_name='location_id'"
@@ -376,6 +502,24 @@ def _run_postgresql_schema_migrations() -> int:
                 "No se pudo crear la columna location_id en inventory_lots."
             ) from e
 
+        _ensure_query_indexes(conn)
+
+        try:
+            _ensure_covering_type_date_index(conn)
+        except SQLAlchemyError as e:
+            raise RuntimeError("No se pudo crear el índice ix_im_type_date con INCLUDE.") from e
+
+        try:
+            _ensure_covering_lot_index(conn)
+        except SQLAlchemyError as e:
+            raise RuntimeError("No se pudo crear el índice ix_lot_remaining con INCLUDE.") from e
+
+        if os.getenv("MONTHLY_FINANCIALS_VIEW", "0") == "1":
+            try:
+                _ensure_monthly_financials(conn)
+            except SQLAlchemyError as e:
+                raise RuntimeError("No se pudo crear la vista monthly_financials.") from e
+
         if schema_version < 1:
             _set_schema_version(conn, 1)
             schema_version = 1
@@ -471,6 +615,25 @@ def _sync_locations_from_config(db: "Session", business: Business) -> None:
     db.commit()
 
 
+def _upsert_business(db: "Session", code: str, name: str) -> Business:
+    """
+    Crea o actualiza un negocio por código en una sola sentencia
+    (INSERT ... ON CONFLICT (code) DO UPDATE ... RETURNING), sin carrera entre
+    procesos que arrancan a la vez.
+    """
+    if db.get_bind().dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+
+    stmt = dialect_insert(Business).values(code=code, name=name)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[Business.code],
+        set_={"name": stmt.excluded.name},
+    ).returning(Business)
+    return db.scalars(stmt, execution_options={"populate_existing": True}).one()
+
+
 def _run_seed_and_backfill() -> None:
     db = get_session()
     try:
@@ -479,14 +642,7 @@ def _run_seed_and_backfill() -> None:
         def ensure_business(code: str, name: str) -> Business:
             c = (code or "").strip()
             n = (name or "").strip() or c
-            existing_b = db.scalar(select(Business).where(Business.code == c))
-            if existing_b is None:
-                existing_b = Business(code=c, name=n)
-                db.add(existing_b)
-                db.flush()
-            else:
-                existing_b.name = n
-            return existing_b
+            return _upsert_business(db, c, n)
 
         default_business = ensure_business("recambios", "Recambios")
         ensure_business("ropa", "Ropa")
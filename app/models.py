@@ -1,10 +1,13 @@
 from __future__ import annotations
 
 from datetime import datetime
+from enum import IntFlag
 from typing import Optional
 
-from sqlalchemy import Boolean, DateTime, ForeignKey, Integer, Numeric, String, Text, func
+from sqlalchemy import Boolean, Computed, Date, DateTime, ForeignKey, Index, Integer, Numeric, String, Text, func, text
+from sqlalchemy.ext.compiler import compiles
 from sqlalchemy.orm import Mapped, mapped_column
+from sqlalchemy.sql.functions import FunctionElement
 
 from app.db import Base
 
@@ -20,6 +23,24 @@ class Business(Base):
     )
 
 
+class Role(IntFlag):
+    NONE = 0
+    ADMIN = 1
+    OWNER = 2
+    OPERATOR = 4
+
+
+_ROLE_FLAGS: dict[str, Role] = {
+    "admin": Role.ADMIN,
+    "owner": Role.OWNER,
+    "operator": Role.OPERATOR,
+}
+
+
+def role_flag_for(role: Optional[str]) -> Role:
+    return _ROLE_FLAGS.get((role or "").lower(), Role.NONE)
+
+
 class User(Base):
     __tablename__ = "users"
 
@@ -36,6 +57,10 @@ class User(Base):
         DateTime(timezone=True), server_default=func.now(), index=True
     )
 
+    @property
+    def role_flag(self) -> Role:
+        return role_flag_for(self.role)
+
 
 class Customer(Base):
     __tablename__ = "customers"
@@ -181,6 +206,11 @@ class InventoryMovement(Base):
     unit_price: Mapped[Optional[float]] = mapped_column(
         Numeric(14, 4, asdecimal=False), nullable=True
     )
+    # Sale-line revenue, summed by every sales report.
+    line_revenue: Mapped[float] = mapped_column(
+        Numeric(18, 4, asdecimal=False),
+        Computed("abs(quantity) * coalesce(unit_price, 0)", persisted=True),
+    )
     movement_date: Mapped[datetime] = mapped_column(
         DateTime(timezone=True), server_default=func.now(), index=True
     )
@@ -189,6 +219,68 @@ class InventoryMovement(Base):
         DateTime(timezone=True), server_default=func.now(), index=True
     )
 
+    __table_args__ = (
+        # FIFO rebuilds and per-product reads filter by product and walk by date.
+        Index("ix_im_product_date_id", "product_id", "movement_date", "id"),
+        # Reports filter sales (or another type) over a date window. On
+        # PostgreSQL the measured columns ride along for index-only scans.
+        Index(
+            "ix_im_type_date",
+            "type",
+            "movement_date",
+            postgresql_include=[
+                "business_id",
+                "location_id",
+                "product_id",
+                "quantity",
+                "unit_cost",
+                "unit_price",
+                "line_revenue",
+            ],
+        ),
+    )
+
+
+class utc_day(FunctionElement):
+    """Calendar day (UTC) of a timestamp, rendered so it can back an expression index."""
+
+    type = Date()
+    name = "utc_day"
+    inherit_cache = True
+
+
+@compiles(utc_day)
+def _compile_utc_day(element, compiler, **kw):
+    return "date(%s)" % compiler.process(element.clauses, **kw)
+
+
+@compiles(utc_day, "postgresql")
+def _compile_utc_day_pg(element, compiler, **kw):
+    # date(timestamptz) depends on the session TimeZone and cannot be indexed.
+    return "CAST((%s AT TIME ZONE 'UTC') AS DATE)" % compiler.process(element.clauses, **kw)
+
+
+class utc_month(FunctionElement):
+    """Calendar month (UTC) of a timestamp as a 'YYYY-MM' string."""
+
+    type = String()
+    name = "utc_month"
+    inherit_cache = True
+
+
+@compiles(utc_month)
+def _compile_utc_month(element, compiler, **kw):
+    return "strftime('%%Y-%%m', %s)" % compiler.process(element.clauses, **kw)
+
+
+@compiles(utc_month, "postgresql")
+def _compile_utc_month_pg(element, compiler, **kw):
+    return "to_char((%s AT TIME ZONE 'UTC'), 'YYYY-MM')" % compiler.process(element.clauses, **kw)
+
+
+# Daily sales grouping (dashboard series, sale-day counts) groups by this expression.
+Index("ix_im_type_day", InventoryMovement.type, utc_day(InventoryMovement.movement_date))
+
 
 class MoneyExtraction(Base):
     __tablename__ = "money_extractions"
@@ -210,6 +302,18 @@ class MoneyExtraction(Base):
 
 class InventoryLot(Base):
     __tablename__ = "inventory_lots"
+    __table_args__ = (
+        # FIFO walks read only lots with stock left, in receipt order.
+        Index(
+            "ix_lot_remaining",
+            "product_id",
+            "received_at",
+            "id",
+            postgresql_include=["business_id", "location_id", "qty_remaining", "unit_cost"],
+            sqlite_where=text("qty_remaining > 0"),
+            postgresql_where=text("qty_remaining > 0"),
+        ),
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True)
     business_id: Mapped[Optional[int]] = mapped_column(
@@ -1,13 +1,15 @@
 from __future__ import annotations
 
-from datetime import datetime
+from datetime import datetime, timezone
 import unicodedata
 from typing import Optional
 
-from sqlalchemy import String, case, cast, func, select
-from sqlalchemy.orm import Session
+from sqlalchemy import Float, String, bindparam, case, cast, func, insert, literal, select, tuple_, update
+from sqlalchemy.orm import Session, defer
+from sqlalchemy.orm.attributes import set_committed_value
 
 from app.models import AuditLog, InventoryLot, InventoryMovement, Location, MovementAllocation, Product
+from app.utils import month_range
 
 
 def _normalize_text(text: str) -> str:
@@ -26,6 +28,22 @@ def _query_match(query: str, sku: str, name: str) -> bool:
     return (q in sku_n) or (q in name_n)
 
 
+def _movement_month(year: int, month: str) -> tuple:
+    # A date range rather than EXTRACT() on the column, so the date indexes apply.
+    start, end = month_range(datetime(int(year), int(month), 1, tzinfo=timezone.utc))
+    return InventoryMovement.movement_date >= start, InventoryMovement.movement_date < end
+
+
+def _stock_sum():
+    # Summed as double precision so psycopg hands back a float, not a Decimal
+    # that the column type would then convert.
+    return cast(func.coalesce(func.sum(InventoryLot.qty_remaining), 0), Float)
+
+
+# Above this many rows, allocations are written with COPY on PostgreSQL.
+_COPY_MIN_ROWS = 500
+
+
 class InventoryRepository:
     def __init__(self, db: Session, business_id: Optional[int] = None):
         self._db = db
@@ -42,9 +60,131 @@ class InventoryRepository:
     def add_allocation(self, allocation: MovementAllocation) -> None:
         self._db.add(allocation)
 
+    def add_allocations(self, rows: list[dict]) -> None:
+        if not rows:
+            return
+        conn = self._db.connection()
+        if conn.dialect.name == "postgresql" and len(rows) > _COPY_MIN_ROWS:
+            self._copy_allocations(conn, rows)
+            return
+        self._db.execute(insert(MovementAllocation), rows)
+
+    @staticmethod
+    def _copy_allocations(conn, rows: list[dict]) -> None:
+        # COPY checks locks, permissions and types once per operation, not per row.
+        cursor = conn.connection.cursor()
+        try:
+            with cursor.copy(
+                f"COPY {MovementAllocation.__tablename__} (movement_id, lot_id, quantity, unit_cost) FROM STDIN"
+            ) as copy:
+                for row in rows:
+                    copy.write_row((row["movement_id"], row["lot_id"], row["quantity"], row["unit_cost"]))
+        finally:
+            cursor.close()
+
+    def add_lots(self, rows: list[dict]) -> list[int]:
+        """Insert lots in one statement and return their ids in `rows` order."""
+        if not rows:
+            return []
+        stmt = insert(InventoryLot).returning(InventoryLot.id, sort_by_parameter_order=True)
+        return list(self._db.scalars(stmt, rows))
+
+    def consume_lots(self, takes: list[tuple[int, float]]) -> None:
+        """Subtract `(lot_id, quantity)` takes from the lots' remaining stock."""
+        if not takes:
+            return
+        # Relative UPDATE in one executemany; the ORM lots are not marked dirty.
+        self._db.execute(
+            update(InventoryLot.__table__)
+            .where(InventoryLot.__table__.c.id == bindparam("lot_id"))
+            .values(qty_remaining=InventoryLot.__table__.c.qty_remaining - bindparam("delta")),
+            [{"lot_id": lot_id, "delta": take} for lot_id, take in takes],
+        )
+        self._sync_loaded_lots(takes)
+
+    def _sync_loaded_lots(self, takes: list[tuple[int, float]]) -> None:
+        # Lots already loaded in the session keep a consistent value.
+        for lot_id, take in takes:
+            lot = self._db.identity_map.get(Session.identity_key(InventoryLot, lot_id))
+            if lot is not None and "qty_remaining" in lot.__dict__:
+                set_committed_value(lot, "qty_remaining", float(lot.qty_remaining) - take)
+
+    def allocate_fifo(self, product_id: int, location_id: Optional[int], movement_id: int, quantity: float) -> float:
+        """Allocate up to `quantity` units to `movement_id` from the FIFO lots, set-based.
+
+        A running total over the FIFO lots picks the lots and their takes. On
+        PostgreSQL one statement decrements the lots and inserts an allocation
+        for each lot actually decremented; elsewhere the allocations are inserted
+        first and the lots decremented by what was inserted. Returns the quantity allocated, which is less than
+        `quantity` when stock runs short; on PostgreSQL that includes lots a
+        concurrent transaction drained after the ranking snapshot.
+        """
+        filters = self._fifo_filters(product_id, location_id)
+        ranked = (
+            select(
+                InventoryLot.id.label("lot_id"),
+                InventoryLot.unit_cost.label("unit_cost"),
+                InventoryLot.qty_remaining.label("qty_remaining"),
+                (
+                    func.sum(InventoryLot.qty_remaining).over(order_by=(InventoryLot.received_at, InventoryLot.id))
+                    - InventoryLot.qty_remaining
+                ).label("qty_before"),
+            )
+            .where(*filters)
+            .subquery("ranked")
+        )
+        need = bindparam("need", quantity, type_=Float) - ranked.c.qty_before
+        take = case((ranked.c.qty_remaining < need, ranked.c.qty_remaining), else_=need)
+        alloc_table = MovementAllocation.__table__
+        alloc_columns = ["movement_id", "lot_id", "quantity", "unit_cost"]
+        if self._db.get_bind().dialect.name == "postgresql":
+            # Writable CTE: the guarded UPDATE decrements the picked lots and the
+            # allocations are inserted from what it returned, in one round-trip.
+            # The UPDATE re-checks each lot against its latest committed version,
+            # so a lot drained by a concurrent sale is neither decremented nor
+            # allocated instead of going negative.
+            picks = (
+                select(ranked.c.lot_id, take.label("take"), ranked.c.unit_cost)
+                .where(need > 0)
+                .subquery("picks")
+            )
+            lots = InventoryLot.__table__
+            decremented = (
+                update(lots)
+                .where(lots.c.id == picks.c.lot_id, lots.c.qty_remaining >= picks.c.take)
+                .values(qty_remaining=lots.c.qty_remaining - picks.c.take)
+                .returning(lots.c.id, picks.c.take, lots.c.unit_cost)
+                .cte("decremented")
+            )
+            takes = self._db.execute(
+                insert(alloc_table)
+                .from_select(
+                    alloc_columns,
+                    select(literal(movement_id), decremented.c.id, decremented.c.take, decremented.c.unit_cost),
+                )
+                .returning(alloc_table.c.lot_id, alloc_table.c.quantity)
+            ).all()
+            self._sync_loaded_lots([(lot_id, float(qty)) for lot_id, qty in takes])
+        else:
+            takes = self._db.execute(
+                insert(alloc_table)
+                .from_select(
+                    alloc_columns,
+                    select(literal(movement_id), ranked.c.lot_id, take, ranked.c.unit_cost)
+                    .where(need > 0)
+                    .order_by(ranked.c.qty_before),
+                )
+                .returning(alloc_table.c.lot_id, alloc_table.c.quantity)
+            ).all()
+            self.consume_lots([(lot_id, float(qty)) for lot_id, qty in takes])
+        return sum(float(qty) for _, qty in takes)
+
     def stock_for_product_id(self, product_id: int, location_id: Optional[int] = None) -> float:
-        stmt = select(func.coalesce(func.sum(InventoryLot.qty_remaining), 0)).where(
-            InventoryLot.product_id == product_id
+        # Lots never go below zero, so the sum only needs the live ones, which
+        # the partial ix_lot_remaining index serves without touching spent lots.
+        stmt = select(_stock_sum()).where(
+            InventoryLot.product_id == product_id,
+            InventoryLot.qty_remaining > 0,
         )
         stmt = stmt.where(InventoryLot.business_id == self._business_id)
         if location_id is not None:
@@ -52,82 +192,168 @@ class InventoryRepository:
         total = self._db.scalar(stmt)
         return float(total or 0)
 
-    def fifo_lots_for_product_id(self, product_id: int, location_id: Optional[int] = None) -> list[InventoryLot]:
-        stmt = (
-            select(InventoryLot)
+    def product_with_stock(
+        self, sku: str, location_id: Optional[int] = None, *, lock: bool = False
+    ) -> Optional[tuple[Product, float]]:
+        """The product for `sku` and its stock, read in one statement.
+
+        With `lock`, the product row is taken FOR UPDATE on PostgreSQL so that
+        concurrent stock-decrementing writes on the same product run one after
+        the other.
+        """
+        # Mutations and stock reads never touch the display-only columns; they
+        # stay deferred and load on first access if anything needs them.
+        product_stmt = (
+            select(Product)
+            .options(defer(Product.category), defer(Product.image_url))
+            .where(Product.sku == sku.strip(), Product.business_id == self._business_id)
+        )
+        if lock and self._db.get_bind().dialect.name == "postgresql":
+            # A statement that waited on the row lock reads everything else from
+            # its pre-wait snapshot, so the stock is read once the lock is held.
+            product = self._db.scalar(product_stmt.with_for_update())
+            if product is None:
+                return None
+            return product, self.stock_for_product_id(product.id, location_id)
+        stock = (
+            select(_stock_sum())
             .where(
-                InventoryLot.product_id == product_id,
+                InventoryLot.product_id == Product.id,
                 InventoryLot.qty_remaining > 0,
+                InventoryLot.business_id == self._business_id,
+                True if location_id is None else (InventoryLot.location_id == location_id),
             )
+            .correlate(Product)
+            .scalar_subquery()
         )
-        stmt = stmt.where(InventoryLot.business_id == self._business_id)
+        row = self._db.execute(product_stmt.add_columns(stock)).first()
+        if row is None:
+            return None
+        return row[0], float(row[1] or 0)
+
+    def _fifo_filters(self, product_id: int, location_id: Optional[int]) -> list:
+        filters = [
+            InventoryLot.product_id == product_id,
+            InventoryLot.qty_remaining > 0,
+            InventoryLot.business_id == self._business_id,
+        ]
         if location_id is not None:
-            stmt = stmt.where(InventoryLot.location_id == location_id)
-        return list(
-            self._db.scalars(
-                stmt.order_by(InventoryLot.received_at, InventoryLot.id)
+            filters.append(InventoryLot.location_id == location_id)
+        return filters
+
+    def fifo_lots_for_product_id(
+        self, product_id: int, location_id: Optional[int] = None, *, up_to: Optional[float] = None
+    ) -> list[InventoryLot]:
+        filters = self._fifo_filters(product_id, location_id)
+        fifo_order = (InventoryLot.received_at, InventoryLot.id)
+        stmt = select(InventoryLot).where(*filters)
+        if up_to is not None:
+            # Only the lots a FIFO walk for `up_to` units can reach: those whose
+            # preceding lots hold less than that in total.
+            before = (
+                select(
+                    InventoryLot.id.label("lot_id"),
+                    (func.sum(InventoryLot.qty_remaining).over(order_by=fifo_order) - InventoryLot.qty_remaining).label(
+                        "qty_before"
+                    ),
+                )
+                .where(*filters)
+                .subquery()
             )
-        )
+            stmt = stmt.join(before, before.c.lot_id == InventoryLot.id).where(before.c.qty_before < up_to)
+        return list(self._db.scalars(stmt.order_by(*fifo_order)))
 
     def stock_list(
-        self, query: str = "", location_id: Optional[int] = None
-    ) -> list[tuple[str, str, Optional[str], str, float, float, int, Optional[float], Optional[float], Optional[float]]]:
+        self, query: str = "", location_id: Optional[int] = None, *, sales_since: Optional[datetime] = None
+    ) -> list[tuple[str, str, Optional[str], str, float, float, int, Optional[float], Optional[float], Optional[float], float]]:
+        """Stock per product; the last field is the average daily sales over 30 days since `sales_since`."""
         q = query.strip()
 
-        qty_subq = (
-            select(func.coalesce(func.sum(InventoryLot.qty_remaining), 0))
+        # The text match is accent-insensitive, which LIKE is not, so it runs
+        # in Python over the bare catalog first; the aggregates below then
+        # only cover the matching products.
+        product_ids: Optional[list[int]] = None
+        if q:
+            catalog = self._db.execute(
+                select(Product.id, Product.sku, Product.name).where(Product.business_id == self._business_id)
+            )
+            product_ids = [pid for pid, sku, name in catalog if _query_match(q, str(sku or ""), str(name or ""))]
+            if not product_ids:
+                return []
+
+        # One aggregate pass per source, joined by product, instead of a
+        # correlated subquery per product row.
+        stock = (
+            select(
+                InventoryLot.product_id.label("product_id"),
+                _stock_sum().label("qty"),
+            )
             .where(
-                InventoryLot.product_id == Product.id,
+                InventoryLot.qty_remaining > 0,
                 InventoryLot.business_id == self._business_id,
+                True if location_id is None else (InventoryLot.location_id == location_id),
+                True if product_ids is None else InventoryLot.product_id.in_(product_ids),
             )
-            .correlate(Product)
-            .scalar_subquery()
+            .group_by(InventoryLot.product_id)
+            .subquery("stock")
         )
-        if location_id is not None:
-            qty_subq = (
-                select(func.coalesce(func.sum(InventoryLot.qty_remaining), 0))
-                .where(
-                    InventoryLot.product_id == Product.id,
-                    InventoryLot.location_id == location_id,
-                    InventoryLot.business_id == self._business_id,
-                )
-                .correlate(Product)
-                .scalar_subquery()
+        purchase_cost = (
+            select(
+                InventoryMovement.product_id.label("product_id"),
+                func.min(InventoryMovement.unit_cost).label("min_purchase_cost"),
             )
-        min_purchase_cost_subq = (
-            select(func.min(InventoryMovement.unit_cost))
             .where(
-                InventoryMovement.product_id == Product.id,
                 InventoryMovement.type == "purchase",
                 InventoryMovement.business_id == self._business_id,
+                True if product_ids is None else InventoryMovement.product_id.in_(product_ids),
             )
-            .correlate(Product)
-            .scalar_subquery()
+            .group_by(InventoryMovement.product_id)
+            .subquery("purchase_cost")
         )
 
+        sales_30d = None
+        if sales_since is not None:
+            sales_30d = (
+                select(
+                    InventoryMovement.product_id.label("product_id"),
+                    (cast(func.sum(func.abs(InventoryMovement.quantity)), Float) / 30.0).label("avg_daily"),
+                )
+                .where(
+                    InventoryMovement.type == "sale",
+                    InventoryMovement.movement_date >= sales_since,
+                    InventoryMovement.business_id == self._business_id,
+                    True if location_id is None else (InventoryMovement.location_id == location_id),
+                    True if product_ids is None else InventoryMovement.product_id.in_(product_ids),
+                )
+                .group_by(InventoryMovement.product_id)
+                .subquery("sales_30d")
+            )
+
         stmt = (
             select(
                 Product.sku,
                 Product.name,
                 Product.category,
                 Product.unit_of_measure,
-                qty_subq.label("qty"),
+                func.coalesce(stock.c.qty, 0).label("qty"),
                 Product.min_stock,
                 Product.lead_time_days,
-                min_purchase_cost_subq.label("min_purchase_cost"),
+                purchase_cost.c.min_purchase_cost,
                 Product.default_purchase_cost,
                 Product.default_sale_price,
+                literal(0.0) if sales_30d is None else sales_30d.c.avg_daily,
             )
             .select_from(Product)
+            .outerjoin(stock, stock.c.product_id == Product.id)
+            .outerjoin(purchase_cost, purchase_cost.c.product_id == Product.id)
+        )
+        if sales_30d is not None:
+            stmt = stmt.outerjoin(sales_30d, sales_30d.c.product_id == Product.id)
+        stmt = stmt.where(
+            Product.business_id == self._business_id,
+            True if product_ids is None else Product.id.in_(product_ids),
         )
-        stmt = stmt.where(Product.business_id == self._business_id)
         rows = self._db.execute(stmt.order_by(Product.name)).all()
-        if q:
-            rows = [
-                (sku, name, category, uom, qty, min_stock, lead_time_days, min_purchase_cost, default_purchase_cost, default_sale_price)
-                for sku, name, category, uom, qty, min_stock, lead_time_days, min_purchase_cost, default_purchase_cost, default_sale_price in rows
-                if _query_match(q, str(sku or ""), str(name or ""))
-            ]
         return [
             (
                 sku,
@@ -140,8 +366,9 @@ class InventoryRepository:
                 float(min_purchase_cost) if min_purchase_cost is not None else None,
                 float(default_purchase_cost) if default_purchase_cost is not None else None,
                 float(default_sale_price) if default_sale_price is not None else None,
+                float(avg_daily or 0),
             )
-            for sku, name, category, uom, qty, min_stock, lead_time_days, min_purchase_cost, default_purchase_cost, default_sale_price in rows
+            for sku, name, category, uom, qty, min_stock, lead_time_days, min_purchase_cost, default_purchase_cost, default_sale_price, avg_daily in rows
         ]
 
     def recent_purchases(
@@ -183,10 +410,7 @@ class InventoryRepository:
         if end_date:
             stmt = stmt.where(InventoryMovement.movement_date < end_date)
         if month and year:
-            stmt = stmt.where(
-                func.extract('year', InventoryMovement.movement_date) == year,
-                func.extract('month', InventoryMovement.movement_date) == int(month)
-            )
+            stmt = stmt.where(*_movement_month(year, month))
         rows = list(self._db.execute(stmt).all())
         if q:
             rows = [r for r in rows if _query_match(q, str(r[2] or ""), str(r[3] or ""))]
@@ -214,22 +438,12 @@ class InventoryRepository:
             select(
                 InventoryMovement.id,
                 InventoryMovement.movement_date,
-                Product.sku,
-                Product.name,
-                Product.unit_of_measure,
-                Product.image_url,
-                func.abs(InventoryMovement.quantity),
+                InventoryMovement.product_id,
+                InventoryMovement.location_id,
+                InventoryMovement.quantity,
                 InventoryMovement.unit_price,
-                Location.name,
-                lot_codes_expr,
             )
-            .select_from(InventoryMovement)
-            .join(Product, Product.id == InventoryMovement.product_id)
-            .outerjoin(Location, Location.id == InventoryMovement.location_id)
-            .outerjoin(MovementAllocation, MovementAllocation.movement_id == InventoryMovement.id)
-            .outerjoin(InventoryLot, InventoryLot.id == MovementAllocation.lot_id)
             .where(InventoryMovement.type == "sale")
-            .group_by(InventoryMovement.id, Product.id, Location.id)
             .order_by(InventoryMovement.movement_date.desc(), InventoryMovement.id.desc())
             .limit(prefetch_limit)
         )
@@ -241,10 +455,31 @@ class InventoryRepository:
         if end_date:
             stmt = stmt.where(InventoryMovement.movement_date < end_date)
         if month and year:
-            stmt = stmt.where(
-                func.extract('year', InventoryMovement.movement_date) == year,
-                func.extract('month', InventoryMovement.movement_date) == int(month)
+            stmt = stmt.where(*_movement_month(year, month))
+        # Lot codes are aggregated for the page of sales only, not for every
+        # sale ahead of the LIMIT.
+        page = stmt.subquery("page")
+        stmt = (
+            select(
+                page.c.id,
+                page.c.movement_date,
+                Product.sku,
+                Product.name,
+                Product.unit_of_measure,
+                Product.image_url,
+                func.abs(page.c.quantity),
+                page.c.unit_price,
+                Location.name,
+                lot_codes_expr,
             )
+            .select_from(page)
+            .join(Product, Product.id == page.c.product_id)
+            .outerjoin(Location, Location.id == page.c.location_id)
+            .outerjoin(MovementAllocation, MovementAllocation.movement_id == page.c.id)
+            .outerjoin(InventoryLot, InventoryLot.id == MovementAllocation.lot_id)
+            .group_by(page.c.id, page.c.movement_date, page.c.quantity, page.c.unit_price, Product.id, Location.id)
+            .order_by(page.c.movement_date.desc(), page.c.id.desc())
+        )
         rows = list(self._db.execute(stmt).all())
         if q:
             rows = [r for r in rows if _query_match(q, str(r[2] or ""), str(r[3] or ""))]
@@ -259,7 +494,9 @@ class InventoryRepository:
         start_date: Optional[datetime] = None,
         end_date: Optional[datetime] = None,
         limit: Optional[int] = 100,
+        before: Optional[tuple[datetime, int]] = None,
     ) -> list[tuple]:
+        """Movements newest first; `before` is the (movement_date, id) of the last row of the previous page."""
         q = (query or "").strip()
         prefetch_limit = None if limit is None else (max(int(limit or 0) * 10, 500) if q else int(limit or 0))
         username_sq = (
@@ -320,6 +557,13 @@ class InventoryRepository:
         if end_date:
             stmt = stmt.where(InventoryMovement.movement_date < end_date)
 
+        if before is not None:
+            # Keyset page: seeks along the (movement_date, id) order instead of
+            # skipping an OFFSET of rows.
+            stmt = stmt.where(
+                tuple_(InventoryMovement.movement_date, InventoryMovement.id) < tuple_(before[0], int(before[1]))
+            )
+
         if prefetch_limit is not None:
             stmt = stmt.limit(prefetch_limit)
         rows = list(self._db.execute(stmt).all())
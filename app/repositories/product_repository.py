@@ -1,7 +1,7 @@
 from __future__ import annotations
 
 import unicodedata
-from typing import Optional
+from typing import Iterable, Optional
 
 from sqlalchemy import select
 from sqlalchemy.orm import Session
@@ -29,6 +29,13 @@ class ProductRepository:
         stmt = select(Product).where(Product.sku == sku, Product.business_id == self._business_id)
         return self._db.scalar(stmt)
 
+    def get_by_skus(self, skus: Iterable[str]) -> dict[str, Product]:
+        wanted = {sku.strip() for sku in skus}
+        if not wanted:
+            return {}
+        stmt = select(Product).where(Product.sku.in_(wanted), Product.business_id == self._business_id)
+        return {product.sku: product for product in self._db.scalars(stmt)}
+
     def list(self) -> list[Product]:
         stmt = select(Product).where(Product.business_id == self._business_id)
         return list(self._db.scalars(stmt.order_by(Product.id)))
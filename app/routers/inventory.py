@@ -4,8 +4,8 @@ from fastapi import APIRouter, Depends, Request
 from sqlalchemy.orm import Session
 
 from app.audit import log_event
+from app.auth import AuthUser
 from app.deps import session_dep
-from app.models import User
 from app.security import require_active_business_id
 from app.schemas import (
     AdjustmentCreate,
@@ -17,7 +17,7 @@ from app.schemas import (
     TransferCreate,
     TransferResult,
 )
-from app.security import require_user_api
+from app.security import require_user_api_dep
 from app.services.inventory_service import InventoryService
 
 router = APIRouter(tags=["inventory"])
@@ -31,7 +31,7 @@ def inventory_service_dep(request: Request, db: Session = Depends(session_dep))
 @router.post("/movements/purchase", response_model=MovementResult)
 def create_purchase(
     payload: PurchaseCreate,
-    user: User = Depends(require_user_api),
+    user: AuthUser = Depends(require_user_api_dep),
     service: InventoryService = Depends(inventory_service_dep),
 ) -> MovementResult:
     result = service.purchase(payload)
@@ -49,7 +49,7 @@ def create_purchase(
 @router.post("/movements/return-supplier-lot", response_model=MovementResult)
 def create_supplier_return_lot(
     payload: SupplierReturnLotCreate,
-    user: User = Depends(require_user_api),
+    user: AuthUser = Depends(require_user_api_dep),
     service: InventoryService = Depends(inventory_service_dep),
 ) -> MovementResult:
     result = service.supplier_return_by_lot(payload)
@@ -71,7 +71,7 @@ def create_supplier_return_lot(
 @router.post("/movements/transfer", response_model=TransferResult)
 def create_transfer(
     payload: TransferCreate,
-    user: User = Depends(require_user_api),
+    user: AuthUser = Depends(require_user_api_dep),
     service: InventoryService = Depends(inventory_service_dep),
 ) -> TransferResult:
     result = service.transfer(payload)
@@ -95,7 +95,7 @@ def create_transfer(
 @router.post("/movements/sale", response_model=MovementResult)
 def create_sale(
     payload: SaleCreate,
-    user: User = Depends(require_user_api),
+    user: AuthUser = Depends(require_user_api_dep),
     service: InventoryService = Depends(inventory_service_dep),
 ) -> MovementResult:
     result = service.sale(payload)
@@ -113,7 +113,7 @@ def create_sale(
 @router.post("/movements/adjustment", response_model=MovementResult)
 def create_adjustment(
     payload: AdjustmentCreate,
-    user: User = Depends(require_user_api),
+    user: AuthUser = Depends(require_user_api_dep),
     service: InventoryService = Depends(inventory_service_dep),
 ) -> MovementResult:
     result = service.adjustment(payload)
@@ -131,7 +131,7 @@ def create_adjustment(
 @router.get("/stock/{sku}", response_model=StockRead)
 def get_stock(
     sku: str,
-    user: User = Depends(require_user_api),
+    user: AuthUser = Depends(require_user_api_dep),
     service: InventoryService = Depends(inventory_service_dep),
 ) -> StockRead:
     return service.stock(sku)
@@ -139,7 +139,7 @@ def get_stock(
 
 @router.get("/stock", response_model=list[StockRead])
 def list_stock(
-    user: User = Depends(require_user_api),
+    user: AuthUser = Depends(require_user_api_dep),
     service: InventoryService = Depends(inventory_service_dep),
 ) -> list[StockRead]:
     return service.stock_list()
@@ -4,10 +4,10 @@ from fastapi import APIRouter, Depends, Request
 from sqlalchemy.orm import Session
 
 from app.audit import log_event
+from app.auth import AuthUser
 from app.deps import session_dep
-from app.models import User
 from app.schemas import ProductCreate, ProductRead
-from app.security import require_active_business_id, require_user_api
+from app.security import require_active_business_id, require_user_api_dep
 from app.services.product_service import ProductService
 
 router = APIRouter(tags=["products"])
@@ -21,7 +21,7 @@ def product_service_dep(request: Request, db: Session = Depends(session_dep)) ->
 @router.post("/products", response_model=ProductRead)
 def create_product(
     payload: ProductCreate,
-    user: User = Depends(require_user_api),
+    user: AuthUser = Depends(require_user_api_dep),
     service: ProductService = Depends(product_service_dep),
 ) -> ProductRead:
     created = service.create(payload)
@@ -38,7 +38,7 @@ def create_product(
 
 @router.get("/products", response_model=list[ProductRead])
 def list_products(
-    user: User = Depends(require_user_api),
+    user: AuthUser = Depends(require_user_api_dep),
     service: ProductService = Depends(product_service_dep),
 ) -> list[ProductRead]:
     return [ProductRead.model_validate(p) for p in service.list()]
@@ -9,10 +9,10 @@ from sqlalchemy.orm import Session
 
 from app.audit import log_event
 from app.auth import authenticate
-from app.auth import hash_password
+from app.auth import hash_password, invalidate_user
 from app.deps import session_dep
 from app.models import Business, User
-from app.security import get_current_user_from_session
+from app.security import get_current_user_from_session, remember_session_user
 
 from .ui_common import ensure_admin, templates
 
@@ -40,7 +40,7 @@ def login_submit(
             status_code=401,
         )
 
-    request.session["username"] = user.username
+    remember_session_user(request.session, user)
     request.session["last_activity"] = int(time.time())
     # Only set session business_id for admins (they can switch businesses)
     # Owners and operators use their user.business_id directly (no switching)
@@ -125,8 +125,9 @@ def must_change_password_submit(
     row.password_hash = hash_password(new_password)
     row.must_change_password = False
     db.commit()
+    invalidate_user(row.username)
     db.refresh(row)
-    request.session["username"] = row.username
+    remember_session_user(request.session, row)
     if (row.role or "").lower() != "admin":
         try:
             request.session.pop("active_business_id", None)
@@ -115,7 +115,7 @@ def _home_charts_context(
     profit_items: list[dict]
     if start_dt is None and end_dt is None:
         chart_start, chart_end = month_range(now)
-        _summary, profit_items = inventory_service.monthly_profit_report(now=now, location_id=location_id)
+        profit_items = inventory_service.monthly_profit_by_product(now=now, location_id=location_id)
         month_label = _month_label_es(now)
     else:
         now_dt = now
@@ -409,7 +409,7 @@ def tab_home(
 
     now = datetime.now(timezone.utc)
     start, end = month_range(now)
-    _summary, profit_items = inventory_service.monthly_profit_report(now=now, location_id=selected_location_id)
+    profit_items = inventory_service.monthly_profit_by_product(now=now, location_id=selected_location_id)
 
     month_label = _month_label_es(now)
 
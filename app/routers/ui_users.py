@@ -8,7 +8,7 @@ from sqlalchemy import select
 from sqlalchemy.orm import Session
 
 from app.audit import log_event
-from app.auth import hash_password
+from app.auth import hash_password, invalidate_user
 from app.deps import session_dep
 from app.models import Business, User
 from app.security import get_current_user_from_session
@@ -187,11 +187,14 @@ def user_update(
         response.headers["X-Modal-Keep"] = "1"
         return response
 
+    previous_username = user.username
     user.username = username
     user.role = role_norm
     user.business_id = int(business_id) if business_id else None
     user.is_active = bool(is_active)
     db.commit()
+    invalidate_user(previous_username)
+    invalidate_user(username)
 
     if current_user is not None:
         log_event(
@@ -249,6 +252,7 @@ def user_delete(
     username = user.username
     db.delete(user)
     db.commit()
+    invalidate_user(username)
 
     if current_user is not None:
         log_event(
@@ -312,6 +316,7 @@ def user_reset_password(
     user.password_hash = hash_password(new_password)
     user.must_change_password = bool(must_change)
     db.commit()
+    invalidate_user(user.username)
 
     if current_user is not None:
         log_event(
@@ -1,33 +1,77 @@
 from __future__ import annotations
 
-from typing import Optional
+from types import MappingProxyType
+from typing import Any, Dict, Mapping, Optional
 
 from fastapi import Depends, HTTPException, Request
-from sqlalchemy import select
+from sqlalchemy import bindparam, lambda_stmt, select
 from sqlalchemy.orm import Session
 
-from app.auth import get_user_by_username
+from app.auth import AuthUser, get_admin_user_by_username, get_user_auth
 from app.deps import session_dep
-from app.models import Business, User
+from app.models import Business, Role, User
 
 
-def get_current_user_from_session(db: Session, request: Request) -> Optional[User]:
-    session = getattr(request, "session", None)
+# Shared read-only stand-in for requests without a session, so the auth helpers
+# never allocate a throwaway dict.
+_EMPTY_SESSION: Mapping[str, Any] = MappingProxyType({})
+
+# Business lookups run on every request; lambda_stmt keeps their compiled
+# form in SQLAlchemy's statement cache instead of rebuilding it per call.
+_BUSINESS_ID_BY_ID = lambda_stmt(lambda: select(Business.id).where(Business.id == bindparam("bid")))
+_BUSINESS_CODE_BY_ID = lambda_stmt(lambda: select(Business.code).where(Business.id == bindparam("bid")))
+_FIRST_BUSINESS_ID = lambda_stmt(lambda: select(Business.id).order_by(Business.id.asc()).limit(1))
+
+# Default (first) business id per database URL. Businesses are only created at
+# startup and never deleted, so once resolved the value is stable.
+_default_business_ids: Dict[str, int] = {}
+
+# Roles pinned to their own business (no switching).
+_OWNER_OPERATOR = frozenset({"owner", "operator"})
+_FULL_DASHBOARD = Role.ADMIN | Role.OWNER
+
+# Bump to make every session issued before a change fall back to the DB path.
+SESSION_SCHEMA_VERSION = 1
+
+
+def _default_business_id(db: Session) -> Optional[int]:
+    # Keyed by the URL with the password masked so it never lingers here.
+    key = db.get_bind().url.render_as_string(hide_password=True)
+    cached = _default_business_ids.get(key)
+    if cached is not None:
+        return cached
+    bid = db.scalar(_FIRST_BUSINESS_ID)
+    if bid is None:
+        return None
+    _default_business_ids[key] = int(bid)
+    return int(bid)
+
+
+def _request_session(request: Request) -> Mapping[str, Any]:
+    # SessionMiddleware stores the session as a plain dict in the ASGI scope.
+    return request.scope.get("session") or _EMPTY_SESSION
+
+
+def remember_session_user(session: Dict[str, Any], user: User | AuthUser) -> None:
+    # Owners and operators are pinned to their business; keeping it in the
+    # signed session lets require_active_business_id skip the user lookup.
+    session["username"] = user.username
+    session["role"] = (user.role or "").lower()
+    session["business_id"] = int(user.business_id) if user.business_id is not None else None
+    session["schema_version"] = SESSION_SCHEMA_VERSION
+
+
+def get_current_user_from_session(db: Session, request: Request) -> Optional[AuthUser]:
+    session = _request_session(request)
     if not session:
         return None
     username = session.get("username")
     if not username:
         return None
-    user = get_user_by_username(db, str(username))
+    user = get_user_auth(db, str(username))
     if user is None or not user.is_active:
-        try:
-            session.clear()
-        except Exception:
-            try:
-                session.pop("username", None)
-                session.pop("active_business_id", None)
-            except Exception:
-                pass
+        # A username implies a real Starlette session dict, never _EMPTY_SESSION.
+        session.clear()
         return None
     return user
 
@@ -38,27 +82,22 @@ def get_active_business_id(db: Session, request: Request) -> Optional[int]:
         return None
 
     role = (user.role or "").lower()
-    
+    session = _request_session(request)
+
     # Owners and Operators always use their assigned business_id (cannot switch)
-    if role in ("owner", "operator"):
-        session = getattr(request, "session", None)
-        if session is not None:
-            try:
-                session.pop("active_business_id", None)
-            except Exception:
-                pass
+    if role in _OWNER_OPERATOR:
+        session.pop("active_business_id", None)
         result = int(user.business_id) if user.business_id is not None else None
         print(f"[DEBUG] get_active_business_id - User: {user.username}, Role: {role}, user.business_id: {user.business_id}, returning: {result}")
         return result
     
     # Admins can use session to switch between businesses
     if role == "admin":
-        session = getattr(request, "session", None) or {}
         raw = session.get("active_business_id")
         if raw is not None:
             try:
                 bid = int(raw)
-                if db.get(Business, bid) is not None:
+                if db.scalar(_BUSINESS_ID_BY_ID, {"bid": bid}) is not None:
                     print(f"[DEBUG] get_active_business_id - Admin {user.username} using session bid: {bid}")
                     return bid
             except Exception:
@@ -70,13 +109,9 @@ def get_active_business_id(db: Session, request: Request) -> Optional[int]:
             return int(user.business_id)
         
         # Last resort for admins: use first available business
-        first_business = db.scalar(select(Business).order_by(Business.id.asc()).limit(1))
-        if first_business is not None:
-            bid = int(first_business.id)
-            try:
-                session["active_business_id"] = bid
-            except Exception:
-                pass
+        bid = _default_business_id(db)
+        if bid is not None:
+            session["active_business_id"] = bid
             print(f"[DEBUG] get_active_business_id - Admin {user.username} using first business: {bid}")
             return bid
     
@@ -85,72 +120,81 @@ def get_active_business_id(db: Session, request: Request) -> Optional[int]:
 
 
 def require_active_business_id(db: Session, request: Request) -> int:
+    session = _request_session(request)
+    if (
+        session.get("schema_version") == SESSION_SCHEMA_VERSION
+        and session.get("role") in _OWNER_OPERATOR
+        and session.get("business_id") is not None
+    ):
+        # The session value is only trusted while the (briefly cached) user
+        # still matches it: active, pinned role and the same business.
+        user = get_user_auth(db, str(session.get("username") or ""))
+        if (
+            user is not None
+            and user.is_active
+            and (user.role or "").lower() in _OWNER_OPERATOR
+            and user.business_id is not None
+            and int(user.business_id) == int(session["business_id"])
+        ):
+            return int(session["business_id"])
     bid = get_active_business_id(db, request)
     if bid is None:
         raise HTTPException(status_code=409, detail="Active business_id is required")
     return int(bid)
 
 
-def require_user_api(
-    request: Request,
-    db: Session = Depends(session_dep),
-) -> User:
+def require_user_api(request: Request, db: Session) -> AuthUser:
     user = get_current_user_from_session(db, request)
     if user is None:
         raise HTTPException(status_code=401, detail="Not authenticated")
     return user
 
 
-def require_admin_api(
-    request: Request,
-    db: Session = Depends(session_dep),
-) -> User:
-    user = require_user_api(request=request, db=db)
-    if (user.role or "").lower() != "admin":
-        raise HTTPException(status_code=403, detail="Admin required")
-    return user
+def require_admin_api(request: Request, db: Session) -> AuthUser:
+    username = _request_session(request).get("username")
+    if username:
+        admin = get_admin_user_by_username(db, str(username))
+        if admin is not None:
+            return admin
+    # Miss: resolve the session user only to tell 401 (and clear a stale
+    # session) apart from 403.
+    require_user_api(request, db)
+    raise HTTPException(status_code=403, detail="Admin required")
 
 
-def is_admin(user: Optional[User]) -> bool:
-    if user is None:
-        return False
-    return (user.role or "").lower() == "admin"
+# Route-level dependencies. The checks above stay plain functions so FastAPI
+# resolves a single session_dep node per request.
+def require_user_api_dep(request: Request, db: Session = Depends(session_dep)) -> AuthUser:
+    return require_user_api(request, db)
 
 
-def is_owner(user: Optional[User]) -> bool:
-    if user is None:
-        return False
-    return (user.role or "").lower() == "owner"
+def require_admin_api_dep(request: Request, db: Session = Depends(session_dep)) -> AuthUser:
+    return require_admin_api(request, db)
 
 
-def is_operator(user: Optional[User]) -> bool:
-    if user is None:
-        return False
-    return (user.role or "").lower() == "operator"
+def is_admin(user: Optional[User | AuthUser]) -> bool:
+    return bool(user is not None and user.role_flag & Role.ADMIN)
 
 
-def can_manage_users(user: Optional[User]) -> bool:
-    return is_admin(user)
+def is_owner(user: Optional[User | AuthUser]) -> bool:
+    return bool(user is not None and user.role_flag & Role.OWNER)
 
 
-def can_change_business(user: Optional[User]) -> bool:
-    return is_admin(user)
+def is_operator(user: Optional[User | AuthUser]) -> bool:
+    return bool(user is not None and user.role_flag & Role.OPERATOR)
 
 
-def can_view_activity(user: Optional[User]) -> bool:
-    return is_admin(user)
+# User management, business switching and the activity log are admin-only.
+can_manage_users = can_change_business = can_view_activity = is_admin
 
 
-def can_access_full_dashboard(user: Optional[User]) -> bool:
-    if user is None:
-        return False
-    role = (user.role or "").lower()
-    return role in ("admin", "owner")
+def can_access_full_dashboard(user: Optional[User | AuthUser]) -> bool:
+    return bool(user is not None and user.role_flag & _FULL_DASHBOARD)
 
 
 def get_active_business_code(db: Session, request: Request) -> Optional[str]:
     bid = get_active_business_id(db, request)
     if bid is None:
         return None
-    code = db.scalar(select(Business.code).where(Business.id == int(bid)))
+    code = db.scalar(_BUSINESS_CODE_BY_ID, {"bid": int(bid)})
     return (str(code).strip() if code is not None else None) or None
@@ -1,16 +1,25 @@
 from __future__ import annotations
 
+import asyncio
 import hashlib
 import math
+import os
 import re
-from datetime import datetime, timedelta, timezone
-from typing import Optional
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, Callable, Optional
 
 from fastapi import HTTPException
-from sqlalchemy import and_, case, delete, func, select
-from sqlalchemy.exc import IntegrityError
+from sqlalchemy import Date, Float, Integer, Row, String, and_, bindparam, case, cast, column, delete, event, func, or_, select, table, text, true
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
 from sqlalchemy.orm import Session, aliased
+from sqlalchemy.sql.elements import TextClause
 
+from app.db import SessionLocal, engine
 from app.models import (
     Business,
     InventoryLot,
@@ -20,6 +29,8 @@ from app.models import (
     MovementAllocation,
     OperatingExpense,
     Product,
+    utc_day,
+    utc_month,
 )
 from app.business_config import load_business_config
 from app.repositories.inventory_repository import InventoryRepository
@@ -36,7 +47,215 @@ from app.schemas import (
     TransferLineResult,
     TransferResult,
 )
-from app.utils import month_range as utils_month_range
+from app.utils import add_months, month_range as utils_month_range
+
+
+# Upper bound for literal id lists passed to IN (...).
+_ID_CHUNK_SIZE = 10_000
+
+# Decimal places of the quantity columns (Numeric(14, 4)).
+_QTY_SCALE = 4
+
+# Run independent report queries on separate connections. Only pays off when
+# each round-trip has network latency (remote PostgreSQL), never on SQLite.
+_PARALLEL_REPORT_QUERIES = os.getenv("PARALLEL_REPORT_QUERIES", "0") == "1"
+_PARALLEL_REPORT_WORKERS = 4
+
+# Serve monthly_overview from the monthly_financials materialized view
+# (PostgreSQL only, created by app.migrations). Commits that wrote movements or
+# allocations mark it stale; run_monthly_financials_refresher refreshes it
+# periodically while stale.
+_MONTHLY_FINANCIALS_ENABLED = os.getenv("MONTHLY_FINANCIALS_VIEW", "0") == "1"
+
+_monthly_financials = table(
+    "monthly_financials",
+    column("business_id", Integer),
+    column("location_id", Integer),
+    column("product_id", Integer),
+    column("year_month", String),
+    column("purchases_value", Float),
+    column("sales_value", Float),
+    column("cogs_value", Float),
+)
+_FINANCIALS_DIRTY = "monthly_financials_dirty"
+_FINANCIALS_TABLES = (InventoryMovement, MovementAllocation)
+_FINANCIALS_TABLE_NAMES = frozenset(m.__tablename__ for m in _FINANCIALS_TABLES)
+_FINANCIALS_TEXT_RE = re.compile(r"\b(?:%s)\b" % "|".join(sorted(_FINANCIALS_TABLE_NAMES)), re.IGNORECASE)
+# Set after a commit that touched movements/allocations; the scheduled refresher
+# (run_monthly_financials_refresher) clears it. Starts set so the first tick
+# catches up on writes made before this process started.
+_financials_stale = threading.Event()
+_financials_stale.set()
+
+
+def _track_financials_flush(session: Session, _flush_context) -> None:
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        if isinstance(obj, _FINANCIALS_TABLES):
+            session.info[_FINANCIALS_DIRTY] = True
+            return
+
+
+def _track_financials_execute(state) -> None:
+    stmt = state.statement
+    if isinstance(stmt, TextClause):
+        touched = _FINANCIALS_TEXT_RE.search(stmt.text) is not None
+    elif state.is_insert or state.is_update or state.is_delete:
+        touched = getattr(stmt.table, "name", None) in _FINANCIALS_TABLE_NAMES
+    else:
+        touched = False
+    if touched:
+        state.session.info[_FINANCIALS_DIRTY] = True
+
+
+def _mark_financials_stale_after_commit(session: Session) -> None:
+    if session.info.pop(_FINANCIALS_DIRTY, False):
+        _financials_stale.set()
+
+
+def _forget_financials_on_rollback(session: Session, _previous_transaction) -> None:
+    session.info.pop(_FINANCIALS_DIRTY, None)
+
+
+def refresh_monthly_financials(bind: Engine = engine) -> bool:
+    """REFRESH CONCURRENTLY the view if a commit marked it stale; True when it ran."""
+    if bind.dialect.name != "postgresql" or not _financials_stale.is_set():
+        return False
+    _financials_stale.clear()
+    try:
+        with bind.connect() as conn:
+            conn.exec_driver_sql("REFRESH MATERIALIZED VIEW CONCURRENTLY monthly_financials")
+            conn.commit()
+    except SQLAlchemyError:
+        # Retry on the next tick.
+        _financials_stale.set()
+        return False
+    return True
+
+
+async def run_monthly_financials_refresher(interval_seconds: float) -> None:
+    """Refresh the view every `interval_seconds` off the request path (started from the app lifespan)."""
+    while True:
+        await asyncio.sleep(interval_seconds)
+        await asyncio.to_thread(refresh_monthly_financials)
+
+
+if _MONTHLY_FINANCIALS_ENABLED:
+    event.listen(SessionLocal, "after_flush", _track_financials_flush)
+    event.listen(SessionLocal, "do_orm_execute", _track_financials_execute)
+    event.listen(SessionLocal, "after_commit", _mark_financials_stale_after_commit)
+    event.listen(SessionLocal, "after_soft_rollback", _forget_financials_on_rollback)
+
+
+def _lot_stamp(dt: datetime, *, seconds: bool = False) -> str:
+    """`%y%m%d%H%M[%S]` built from the fields, skipping strftime (called once per lot)."""
+    stamp = f"{dt.year % 100:02d}{dt.month:02d}{dt.day:02d}{dt.hour:02d}{dt.minute:02d}"
+    return f"{stamp}{dt.second:02d}" if seconds else stamp
+
+
+def _movement_read(mv: InventoryMovement) -> MovementRead:
+    """MovementRead from a flushed movement without re-running validation on typed columns."""
+    return MovementRead.model_construct(
+        id=mv.id,
+        product_id=mv.product_id,
+        location_id=mv.location_id,
+        type=mv.type,
+        quantity=float(mv.quantity),
+        unit_cost=None if mv.unit_cost is None else float(mv.unit_cost),
+        unit_price=None if mv.unit_price is None else float(mv.unit_price),
+        movement_date=mv.movement_date,
+        note=mv.note,
+    )
+
+
+def _float_sum(expr):
+    """SUM that yields 0.0 instead of NULL and a float on every dialect."""
+    return cast(func.coalesce(func.sum(expr), 0), Float)
+
+
+# Report statements are built once per shape and executed with bind
+# parameters (start, end, business_id, location_id).
+def _sale_period_filter(by_location: bool):
+    conds = [
+        InventoryMovement.movement_date >= bindparam("start"),
+        InventoryMovement.movement_date < bindparam("end"),
+        InventoryMovement.business_id == bindparam("business_id"),
+    ]
+    if by_location:
+        conds.append(InventoryMovement.location_id == bindparam("location_id"))
+    return and_(*conds)
+
+
+@lru_cache(maxsize=None)
+def _monthly_totals_stmts(by_location: bool):
+    month_key = utc_month(InventoryMovement.movement_date)
+    period_filter = _sale_period_filter(by_location)
+    # Purchases and sales come from the same rows: one grouped pass, one
+    # conditional sum per measure.
+    movements = (
+        select(
+            month_key,
+            _float_sum(
+                case(
+                    (
+                        InventoryMovement.type == "purchase",
+                        InventoryMovement.quantity * func.coalesce(InventoryMovement.unit_cost, 0),
+                    ),
+                    else_=0,
+                )
+            ),
+            _float_sum(case((InventoryMovement.type == "sale", InventoryMovement.line_revenue), else_=0)),
+        )
+        .where(InventoryMovement.type.in_(("purchase", "sale")), period_filter)
+        .group_by(month_key)
+    )
+    cogs = (
+        select(month_key, _float_sum(MovementAllocation.quantity * MovementAllocation.unit_cost))
+        .select_from(MovementAllocation)
+        .join(InventoryMovement, InventoryMovement.id == MovementAllocation.movement_id)
+        .where(InventoryMovement.type == "sale", period_filter)
+        .group_by(month_key)
+    )
+    return movements, cogs
+
+
+@lru_cache(maxsize=None)
+def _profit_items_stmt(by_location: bool):
+    src_mv = aliased(InventoryMovement)
+    loc = aliased(Location)
+    # Per-line arithmetic runs in SQL and every measure is cast to a float
+    # there (SQLite hands back ints for whole numbers), so the caller's loop
+    # only shapes the rows.
+    qty_col = func.coalesce(MovementAllocation.quantity, 0)
+    unit_price_col = func.coalesce(InventoryMovement.unit_price, 0)
+    unit_cost_col = func.coalesce(MovementAllocation.unit_cost, 0)
+    return (
+        select(
+            InventoryMovement.id.label("sale_movement_id"),
+            InventoryMovement.movement_date,
+            loc.code.label("location_code"),
+            loc.name.label("location_name"),
+            Product.sku,
+            Product.name,
+            Product.category,
+            InventoryLot.id.label("lot_id"),
+            InventoryLot.movement_id.label("source_movement_id"),
+            src_mv.type.label("source_movement_type"),
+            InventoryLot.lot_code,
+            cast(unit_cost_col, Float).label("unit_cost"),
+            cast(unit_price_col, Float).label("unit_price"),
+            cast(qty_col, Float).label("qty"),
+            cast(qty_col * unit_price_col, Float).label("sales"),
+            cast(qty_col * unit_cost_col, Float).label("cogs"),
+        )
+        .select_from(MovementAllocation)
+        .join(InventoryMovement, InventoryMovement.id == MovementAllocation.movement_id)
+        .outerjoin(loc, loc.id == InventoryMovement.location_id)
+        .join(Product, Product.id == InventoryMovement.product_id)
+        .join(InventoryLot, InventoryLot.id == MovementAllocation.lot_id)
+        .join(src_mv, src_mv.id == InventoryLot.movement_id)
+        .where(InventoryMovement.type == "sale", _sale_period_filter(by_location))
+        .order_by(InventoryMovement.movement_date.desc(), InventoryMovement.id.desc())
+    )
 
 
 class InventoryService:
@@ -46,6 +265,8 @@ class InventoryService:
             raise HTTPException(status_code=409, detail="business_id is required")
         self._business_id = int(business_id)
         self._business_code: Optional[str] = None
+        # Products looked up by sku during this service's (request's) lifetime.
+        self._product_cache: dict[str, Product] = {}
         self._products = ProductRepository(db, business_id=self._business_id)
         self._inventory = InventoryRepository(db, business_id=self._business_id)
 
@@ -54,11 +275,28 @@ class InventoryService:
         return self._db
 
     def _get_product(self, sku: str) -> Product:
-        product = self._products.get_by_sku(sku)
+        key = sku.strip()
+        product = self._product_cache.get(key)
         if product is None:
-            raise HTTPException(status_code=404, detail="Product not found")
+            product = self._products.get_by_sku(key)
+            if product is None:
+                raise HTTPException(status_code=404, detail="Product not found")
+            self._product_cache[key] = product
         return product
 
+    def _get_product_with_stock(
+        self, sku: str, location_id: Optional[int], *, lock: bool = False
+    ) -> tuple[Product, float]:
+        key = sku.strip()
+        product = self._product_cache.get(key)
+        if product is not None and not lock:
+            return product, self._inventory.stock_for_product_id(product.id, location_id=location_id)
+        found = self._inventory.product_with_stock(key, location_id, lock=lock)
+        if found is None:
+            raise HTTPException(status_code=404, detail="Product not found")
+        self._product_cache[key] = found[0]
+        return found
+
     def _movement_datetime(self, provided: Optional[datetime]) -> datetime:
         return provided or datetime.now(timezone.utc)
 
@@ -140,6 +378,8 @@ class InventoryService:
         return utils_month_range(now)
 
     def _warning_if_restock_needed(self, product: Product, stock_after: float) -> Optional[str]:
+        # No query: callers run it before the commit, while product.min_stock
+        # is still loaded, so the commit does not force a product reload.
         min_stock = float(product.min_stock or 0)
         if min_stock > 0 and stock_after < min_stock:
             return "Needs restock"
@@ -165,11 +405,24 @@ class InventoryService:
             val = val * 2.0
         product.default_purchase_cost = float(val)
 
-    def _unique_lot_code(self, base_code: str, *, max_len: int = 64) -> str:
+    def _unique_lot_code(
+        self,
+        base_code: str,
+        *,
+        max_len: int = 64,
+        reserved: Optional[set[str]] = None,
+        existing: Optional[set[str]] = None,
+    ) -> str:
+        """`base_code`, suffixed until it is free; `existing` (from `_existing_lot_codes`) skips the scan."""
         base = self._compact_lot_code(base_code, max_len=int(max_len))
+        if existing is None:
+            existing = self._existing_lot_codes([self._lot_code_prefix(base, max_len=max_len)])
+        taken = set(existing)
+        if reserved:
+            taken |= reserved
         candidate = base
         i = 0
-        while self._db.scalar(select(InventoryLot.id).where(InventoryLot.lot_code == candidate)) is not None:
+        while candidate in taken:
             suffix = chr(ord("A") + (i % 26))
             n = i // 26
             if n > 0:
@@ -179,6 +432,24 @@ class InventoryService:
             i += 1
         return candidate
 
+    @staticmethod
+    def _lot_code_prefix(base: str, *, max_len: int = 64) -> str:
+        # Every candidate _unique_lot_code derives from a compacted `base`
+        # (compacted again or not) keeps this prefix.
+        return base[: max(1, int(max_len) - 9)]
+
+    def _existing_lot_codes(self, prefixes: list[str]) -> set[str]:
+        """Lot codes starting with any of `prefixes`, in one scan."""
+        if not prefixes:
+            return set()
+        return set(
+            self._db.scalars(
+                select(InventoryLot.lot_code).where(
+                    or_(*(InventoryLot.lot_code.startswith(prefix, autoescape=True) for prefix in prefixes))
+                )
+            )
+        )
+
     def _compact_lot_code(self, base: str, *, max_len: int = 64) -> str:
         b = (base or "").strip()
         if len(b) <= int(max_len):
@@ -191,88 +462,221 @@ class InventoryService:
         if quantity <= 0:
             return
 
-        stock = self._inventory.stock_for_product_id(product_id, location_id=location_id)
-        if stock < quantity:
+        # The FIFO match runs in SQL; running short raises before the caller
+        # commits, which rolls the partial allocation back with the movement.
+        # The takes come back at the column scale, so request at that scale too.
+        quantity = round(quantity, _QTY_SCALE)
+        allocated = self._inventory.allocate_fifo(product_id, location_id, movement_id, quantity)
+        if quantity - allocated > 1e-9:
             raise HTTPException(status_code=409, detail="Stock insuficiente")
 
-        remaining = quantity
-        lots = self._inventory.fifo_lots_for_product_id(product_id, location_id=location_id)
-        for lot in lots:
-            if remaining <= 1e-9:
-                break
+    def _transfer_in_from_allocations(
+        self,
+        product: Product,
+        mv_out: InventoryMovement,
+        *,
+        from_code: str,
+        to_code: str,
+        to_loc_id: int,
+        ref: str,
+        note: Optional[str],
+        movement_dt: datetime,
+    ) -> list[int]:
+        """Mirror each lot a transfer_out consumed as a transfer_in movement and lot at the destination."""
+        alloc_rows = self._db.execute(
+            select(
+                MovementAllocation.quantity,
+                MovementAllocation.unit_cost,
+                InventoryLot.lot_code,
+                InventoryLot.received_at,
+            )
+            .select_from(MovementAllocation)
+            .join(InventoryLot, InventoryLot.id == MovementAllocation.lot_id)
+            .where(MovementAllocation.movement_id == mv_out.id)
+            .order_by(InventoryLot.received_at, InventoryLot.id)
+        ).all()
 
-            take = min(float(lot.qty_remaining), remaining)
-            if take <= 1e-9:
+        pairs: list[tuple[InventoryMovement, Optional[str], datetime, float, float]] = []
+        for a_qty, a_unit_cost, src_lot_code, src_received_at in alloc_rows:
+            if float(a_qty or 0) <= 1e-9:
                 continue
-            lot.qty_remaining = float(lot.qty_remaining) - take
-            allocation = MovementAllocation(
-                movement_id=movement_id,
-                lot_id=lot.id,
-                quantity=take,
-                unit_cost=float(lot.unit_cost),
+            src_recv_dt = src_received_at
+            if src_recv_dt is None:
+                src_recv_dt = movement_dt
+
+            recv_iso = None
+            try:
+                recv_iso = src_recv_dt.isoformat()
+            except Exception:
+                recv_iso = None
+
+            mv_in_note = f"Transfer in from {from_code} out_id={mv_out.id} ref={ref}"
+            if src_lot_code:
+                mv_in_note = mv_in_note + f" lot={src_lot_code}"
+            if recv_iso:
+                mv_in_note = mv_in_note + f" received_at={recv_iso}"
+            if note:
+                mv_in_note = mv_in_note + f"; {note}"
+
+            mv_in = InventoryMovement(
+                business_id=self._business_id,
+                product_id=product.id,
+                location_id=to_loc_id,
+                type="transfer_in",
+                quantity=float(a_qty or 0),
+                unit_cost=float(a_unit_cost or 0),
+                unit_price=None,
+                movement_date=movement_dt,
+                note=mv_in_note,
             )
-            self._inventory.add_allocation(allocation)
-            remaining -= take
+            self._inventory.add_movement(mv_in)
+            pairs.append((mv_in, src_lot_code, src_recv_dt, float(a_qty or 0), float(a_unit_cost or 0)))
+        if not pairs:
+            return []
 
-        if remaining > 1e-9:
-            raise HTTPException(status_code=409, detail="Stock insuficiente")
+        # One flush assigns every transfer_in id (batched INSERT ... RETURNING);
+        # the lots that embed those ids then go in as one bulk INSERT.
+        self._db.flush()
+        stamp = _lot_stamp(movement_dt, seconds=True)
+        reserved: set[str] = set()
+        lots: list[dict] = []
+        for mv_in, src_lot_code, src_recv_dt, qty, unit_cost in pairs:
+            base_code = f"TR-{src_lot_code or product.sku}-{to_code}-{stamp}-{mv_in.id}"
+            lot_code = self._unique_lot_code(self._compact_lot_code(base_code), reserved=reserved)
+            reserved.add(lot_code)
+            lots.append(
+                {
+                    "business_id": self._business_id,
+                    "movement_id": mv_in.id,
+                    "product_id": product.id,
+                    "location_id": to_loc_id,
+                    "lot_code": lot_code,
+                    "received_at": src_recv_dt,
+                    "unit_cost": unit_cost,
+                    "qty_received": qty,
+                    "qty_remaining": qty,
+                }
+            )
+        self._inventory.add_lots(lots)
+        return [int(mv_in.id) for mv_in, *_ in pairs]
+
+    def _delete_movement_rows(self, movement_id: int) -> None:
+        """Delete a movement with its lots and every allocation on either, ahead of a FIFO rebuild."""
+        if self._db.get_bind().dialect.name == "postgresql":
+            self._db.execute(
+                text(
+                    "WITH d_alloc AS ("
+                    " DELETE FROM movement_allocations WHERE movement_id = :mid"
+                    " OR lot_id IN (SELECT id FROM inventory_lots WHERE movement_id = :mid)"
+                    "), d_lot AS ("
+                    " DELETE FROM inventory_lots WHERE movement_id = :mid"
+                    ") DELETE FROM inventory_movements WHERE id = :mid"
+                ),
+                {"mid": int(movement_id)},
+            )
+            return
+        lot_ids = select(InventoryLot.id).where(InventoryLot.movement_id == movement_id)
+        self._db.execute(
+            delete(MovementAllocation).where(
+                (MovementAllocation.movement_id == movement_id) | (MovementAllocation.lot_id.in_(lot_ids))
+            )
+        )
+        self._db.execute(delete(InventoryLot).where(InventoryLot.movement_id == movement_id))
+        self._db.execute(delete(InventoryMovement).where(InventoryMovement.id == movement_id))
+
+    def _products_by_ids(self, product_ids: set[int], *, loaded: Optional[Product] = None) -> list[Product]:
+        # One IN query for the products not already in hand (none when an edit
+        # keeps its product).
+        by_id = {loaded.id: loaded} if loaded is not None and loaded.id in product_ids else {}
+        missing = product_ids - by_id.keys()
+        if missing:
+            by_id.update((p.id, p) for p in self._db.scalars(select(Product).where(Product.id.in_(missing))))
+        return [by_id[pid] for pid in sorted(by_id)]
 
     def _rebuild_product_fifo(self, product: Product, lot_code_overrides: Optional[dict[int, str]] = None) -> None:
-        overrides = lot_code_overrides or {}
+        self._rebuild_products_fifo([product], lot_code_overrides)
+
+    def _rebuild_products_fifo(
+        self, products: list[Product], lot_code_overrides: Optional[dict[int, str]] = None
+    ) -> None:
+        """Rebuild lots and allocations of several products with one statement per step."""
+        products_by_id = {product.id: product for product in products}
+        if not products_by_id:
+            return
+        product_ids = list(products_by_id)
 
         central_loc_id = self._central_location_id()
 
-        lot_stmt = select(InventoryLot).where(InventoryLot.product_id == product.id)
+        # Plain rows, not entities: the lots are deleted right below.
+        lot_stmt = select(InventoryLot.movement_id, InventoryLot.lot_code).where(InventoryLot.product_id.in_(product_ids))
         if self._business_id is not None:
             lot_stmt = lot_stmt.where(InventoryLot.business_id == self._business_id)
 
-        existing_codes = {
-            lot.movement_id: lot.lot_code
-            for lot in self._db.scalars(
-                lot_stmt
-            )
-        }
-        existing_codes.update(overrides)
+        existing_codes: dict[int, str] = dict(self._db.execute(lot_stmt).all())
+        existing_codes.update(lot_code_overrides or {})
 
-        mv_id_stmt = select(InventoryMovement.id).where(InventoryMovement.product_id == product.id)
+        mv_id_stmt = select(InventoryMovement.id).where(InventoryMovement.product_id.in_(product_ids))
         if self._business_id is not None:
             mv_id_stmt = mv_id_stmt.where(InventoryMovement.business_id == self._business_id)
 
-        self._db.execute(
-            delete(MovementAllocation).where(
-                (MovementAllocation.movement_id.in_(mv_id_stmt))
-                | (MovementAllocation.lot_id.in_(select(InventoryLot.id).where(InventoryLot.product_id == product.id)))
-            )
+        del_alloc_stmt = delete(MovementAllocation).where(
+            (MovementAllocation.movement_id.in_(mv_id_stmt))
+            | (MovementAllocation.lot_id.in_(select(InventoryLot.id).where(InventoryLot.product_id.in_(product_ids))))
         )
-        del_lot_stmt = delete(InventoryLot).where(InventoryLot.product_id == product.id)
+        del_lot_stmt = delete(InventoryLot).where(InventoryLot.product_id.in_(product_ids))
         if self._business_id is not None:
             del_lot_stmt = del_lot_stmt.where(InventoryLot.business_id == self._business_id)
-        self._db.execute(del_lot_stmt)
+        if self._db.get_bind().dialect.name == "postgresql":
+            # Writable CTE: both deletes in one round-trip (FKs are checked at
+            # the end of the statement).
+            self._db.execute(
+                del_lot_stmt.add_cte(del_alloc_stmt.returning(MovementAllocation.id).cte("del_alloc"))
+            )
+        else:
+            self._db.execute(del_alloc_stmt)
+            self._db.execute(del_lot_stmt)
         self._db.flush()
 
         mv_stmt = (
-            select(InventoryMovement)
-            .where(InventoryMovement.product_id == product.id)
-            .order_by(InventoryMovement.movement_date, InventoryMovement.id)
+            select(
+                InventoryMovement.id,
+                InventoryMovement.product_id,
+                InventoryMovement.type,
+                InventoryMovement.quantity,
+                InventoryMovement.unit_cost,
+                InventoryMovement.movement_date,
+                InventoryMovement.location_id,
+                InventoryMovement.note,
+            )
+            .where(InventoryMovement.product_id.in_(product_ids))
+            .order_by(InventoryMovement.product_id, InventoryMovement.movement_date, InventoryMovement.id)
         )
         if self._business_id is not None:
             mv_stmt = mv_stmt.where(InventoryMovement.business_id == self._business_id)
 
-        movements = list(
-            self._db.scalars(mv_stmt)
-        )
+        # Streamed in batches: nothing else is executed on the session until the
+        # loop below ends, so long product histories never sit fully in memory.
+        movements = self._db.execute(mv_stmt.execution_options(yield_per=1000))
 
-        fifo_lots_by_loc: dict[int, list[InventoryLot]] = {}
+        # Products never share lots, so FIFO queues are per (product, location).
+        # Lots are plain dicts: the walk only touches qty_remaining, and the
+        # final values are bulk-inserted once it ends, outside the unit of work.
+        fifo_lots_by_loc: dict[tuple[int, int], list[dict]] = {}
         used_codes: set[str] = set(existing_codes.values())
+        # Lot ids come back from the bulk insert, so allocations are collected
+        # as (movement_id, lot, quantity) and built afterwards.
+        new_lots: list[dict] = []
+        pending_allocs: list[tuple[int, dict, float]] = []
         for mv in movements:
+            product = products_by_id[mv.product_id]
             qty = float(mv.quantity)
-            mv_loc_id = int(getattr(mv, "location_id", None) or 0) or central_loc_id
-            fifo_lots = fifo_lots_by_loc.setdefault(mv_loc_id, [])
+            mv_loc_id = int(mv.location_id or 0) or central_loc_id
+            fifo_lots = fifo_lots_by_loc.setdefault((product.id, mv_loc_id), [])
             if mv.type in ("purchase", "adjustment", "transfer_in") and qty > 0:
                 code = existing_codes.get(mv.id)
                 if not code:
                     prefix = "ADJ" if mv.type == "adjustment" else product.sku
-                    base = f"{prefix}-{mv.movement_date:%y%m%d%H%M}"
+                    base = f"{prefix}-{_lot_stamp(mv.movement_date)}"
                     code = base
                     i = 0
                     while code in used_codes:
@@ -298,22 +702,18 @@ class InventoryService:
                             received_at_dt = mv.movement_date
                 if mv.type == "adjustment" and (mv.note or "").startswith("Inventario inicial"):
                     received_at_dt = datetime(1970, 1, 1, tzinfo=timezone.utc)
-                lot = InventoryLot(
-                    business_id=self._business_id,
-                    movement_id=mv.id,
-                    product_id=product.id,
-                    location_id=mv_loc_id,
-                    lot_code=code,
-                    received_at=received_at_dt,
-                    unit_cost=float(mv.unit_cost or 0),
-                    qty_received=qty,
-                    qty_remaining=qty,
-                )
-                self._db.add(lot)
-                try:
-                    self._db.flush()
-                except IntegrityError as e:
-                    raise HTTPException(status_code=409, detail="Lote ya existe") from e
+                lot = {
+                    "business_id": self._business_id,
+                    "movement_id": mv.id,
+                    "product_id": product.id,
+                    "location_id": mv_loc_id,
+                    "lot_code": code,
+                    "received_at": received_at_dt,
+                    "unit_cost": float(mv.unit_cost or 0),
+                    "qty_received": qty,
+                    "qty_remaining": qty,
+                }
+                new_lots.append(lot)
                 fifo_lots.append(lot)
                 continue
 
@@ -324,24 +724,18 @@ class InventoryService:
                     target_code = m.group(1).strip()
                     target_lot = None
                     for lot in fifo_lots:
-                        if str(getattr(lot, "lot_code", "")) == target_code:
+                        if lot["lot_code"] == target_code:
                             target_lot = lot
                             break
                     if target_lot is None:
                         raise HTTPException(status_code=409, detail="Lot not found for supplier return")
 
                     remaining = abs(qty)
-                    take = min(float(target_lot.qty_remaining), remaining)
+                    take = min(target_lot["qty_remaining"], remaining)
                     if take <= 0:
                         raise HTTPException(status_code=409, detail="Insufficient stock")
-                    target_lot.qty_remaining = float(target_lot.qty_remaining) - take
-                    alloc = MovementAllocation(
-                        movement_id=mv.id,
-                        lot_id=target_lot.id,
-                        quantity=take,
-                        unit_cost=float(target_lot.unit_cost),
-                    )
-                    self._db.add(alloc)
+                    target_lot["qty_remaining"] -= take
+                    pending_allocs.append((mv.id, target_lot, take))
                     remaining -= take
                     if remaining > 0:
                         raise HTTPException(status_code=409, detail="Insufficient stock")
@@ -360,17 +754,11 @@ class InventoryService:
             for lot in fifo_lots:
                 if remaining <= 0:
                     break
-                take = min(float(lot.qty_remaining), remaining)
+                take = min(lot["qty_remaining"], remaining)
                 if take <= 0:
                     continue
-                lot.qty_remaining = float(lot.qty_remaining) - take
-                alloc = MovementAllocation(
-                    movement_id=mv.id,
-                    lot_id=lot.id,
-                    quantity=take,
-                    unit_cost=float(lot.unit_cost),
-                )
-                self._db.add(alloc)
+                lot["qty_remaining"] -= take
+                pending_allocs.append((mv.id, lot, take))
                 remaining -= take
 
             if remaining > 0:
@@ -384,51 +772,134 @@ class InventoryService:
                     ),
                 )
 
-    def reset_purchases_and_sales(self) -> None:
-        movement_ids = select(InventoryMovement.id).where(
-            InventoryMovement.type.in_(("purchase", "sale"))
+        try:
+            lot_ids = self._inventory.add_lots(new_lots)
+        except IntegrityError as e:
+            raise HTTPException(status_code=409, detail="Lote ya existe") from e
+        for lot, lot_id in zip(new_lots, lot_ids):
+            lot["id"] = lot_id
+        self._inventory.add_allocations(
+            [
+                {
+                    "movement_id": movement_id,
+                    "lot_id": lot["id"],
+                    "quantity": take,
+                    "unit_cost": lot["unit_cost"],
+                }
+                for movement_id, lot, take in pending_allocs
+            ]
         )
-        purchase_ids = select(InventoryMovement.id).where(InventoryMovement.type == "purchase")
-        if self._business_id is not None:
-            movement_ids = movement_ids.where(InventoryMovement.business_id == self._business_id)
-            purchase_ids = purchase_ids.where(InventoryMovement.business_id == self._business_id)
-        purchase_lot_ids = select(InventoryLot.id).where(InventoryLot.movement_id.in_(purchase_ids))
 
-        self._db.execute(
-            delete(MovementAllocation).where(
-                (MovementAllocation.movement_id.in_(movement_ids))
-                | (MovementAllocation.lot_id.in_(purchase_lot_ids))
+    def reset_purchases_and_sales(self) -> None:
+        if self._db.get_bind().dialect.name == "postgresql":
+            self._reset_purchases_and_sales_cte()
+            self._db.commit()
+            return
+
+        # Resolve the ids once; the DELETEs below then take literal id lists
+        # instead of re-running the same subqueries.
+        mv_rows = self._db.execute(
+            select(InventoryMovement.id, InventoryMovement.type).where(
+                and_(
+                    InventoryMovement.type.in_(("purchase", "sale")),
+                    True if self._business_id is None else (InventoryMovement.business_id == self._business_id),
+                )
             )
-        )
-        self._db.execute(delete(InventoryLot).where(InventoryLot.id.in_(purchase_lot_ids)))
-        self._db.execute(delete(InventoryMovement).where(InventoryMovement.id.in_(movement_ids)))
+        ).all()
+        movement_ids = [int(mid) for mid, _ in mv_rows]
+        purchase_ids = [int(mid) for mid, mtype in mv_rows if mtype == "purchase"]
+
+        step = _ID_CHUNK_SIZE
+        lot_ids: list[int] = []
+        for k in range(0, len(purchase_ids), step):
+            lot_ids.extend(
+                self._db.scalars(
+                    select(InventoryLot.id).where(InventoryLot.movement_id.in_(purchase_ids[k : k + step]))
+                )
+            )
+
+        for k in range(0, len(movement_ids), step):
+            self._db.execute(
+                delete(MovementAllocation).where(MovementAllocation.movement_id.in_(movement_ids[k : k + step]))
+            )
+        for k in range(0, len(lot_ids), step):
+            chunk = lot_ids[k : k + step]
+            self._db.execute(delete(MovementAllocation).where(MovementAllocation.lot_id.in_(chunk)))
+            self._db.execute(delete(InventoryLot).where(InventoryLot.id.in_(chunk)))
+        for k in range(0, len(movement_ids), step):
+            self._db.execute(delete(InventoryMovement).where(InventoryMovement.id.in_(movement_ids[k : k + step])))
         self._db.commit()
 
-    def create_expense(self, amount: float, concept: str, expense_date: Optional[datetime]) -> None:
-        exp = OperatingExpense(
+    def _reset_purchases_and_sales_cte(self) -> None:
+        # Writable CTEs: allocations, lots and movements go in one statement and
+        # one round-trip (FKs are checked at the end of the statement).
+        business_filter = True if self._business_id is None else (InventoryMovement.business_id == self._business_id)
+        mv_ids = select(InventoryMovement.id).where(InventoryMovement.type.in_(("purchase", "sale")), business_filter)
+        purchase_ids = select(InventoryMovement.id).where(InventoryMovement.type == "purchase", business_filter)
+        lot_ids = select(InventoryLot.id).where(InventoryLot.movement_id.in_(purchase_ids))
+        del_alloc = (
+            delete(MovementAllocation)
+            .where(MovementAllocation.movement_id.in_(mv_ids) | MovementAllocation.lot_id.in_(lot_ids))
+            .returning(MovementAllocation.id)
+            .cte("del_alloc")
+        )
+        del_lot = (
+            delete(InventoryLot)
+            .where(InventoryLot.movement_id.in_(purchase_ids))
+            .returning(InventoryLot.id)
+            .cte("del_lot")
+        )
+        self._db.execute(
+            delete(InventoryMovement).where(InventoryMovement.id.in_(mv_ids)).add_cte(del_alloc).add_cte(del_lot)
+        )
+
+    def _expense_row(self, amount: float, concept: str, expense_date: Optional[datetime]) -> OperatingExpense:
+        return OperatingExpense(
             business_id=self._business_id,
             amount=float(amount),
             concept=concept.strip(),
             expense_date=self._movement_datetime(expense_date),
         )
-        self._db.add(exp)
-        self._db.commit()
 
-    def create_extraction(
+    def _extraction_row(
         self,
         party: str,
         amount: float,
         concept: str,
         extraction_date: Optional[datetime],
-    ) -> None:
-        row = MoneyExtraction(
+    ) -> MoneyExtraction:
+        return MoneyExtraction(
             business_id=self._business_id,
             party=(party or "").strip(),
             amount=float(amount),
             concept=concept.strip(),
             extraction_date=self._movement_datetime(extraction_date),
         )
-        self._db.add(row)
+
+    def create_expense(self, amount: float, concept: str, expense_date: Optional[datetime]) -> None:
+        self._db.add(self._expense_row(amount, concept, expense_date))
+        self._db.commit()
+
+    def create_expenses_bulk(self, items: list[tuple[float, str, Optional[datetime]]]) -> None:
+        with self._db.no_autoflush:
+            self._db.add_all([self._expense_row(amount, concept, dt) for amount, concept, dt in items])
+        self._db.commit()
+
+    def create_extraction(
+        self,
+        party: str,
+        amount: float,
+        concept: str,
+        extraction_date: Optional[datetime],
+    ) -> None:
+        self._db.add(self._extraction_row(party, amount, concept, extraction_date))
+        self._db.commit()
+
+    def create_extractions_bulk(self, items: list[tuple[str, float, str, Optional[datetime]]]) -> None:
+        with self._db.no_autoflush:
+            self._db.add_all(
+                [self._extraction_row(party, amount, concept, dt) for party, amount, concept, dt in items]
+            )
         self._db.commit()
 
     def get_extraction(self, extraction_id: int) -> MoneyExtraction:
@@ -464,8 +935,15 @@ class InventoryService:
         start: Optional[datetime] = None,
         end: Optional[datetime] = None,
         limit: int = 200,
-    ) -> list[MoneyExtraction]:
-        stmt = select(MoneyExtraction)
+    ) -> list[Row]:
+        # Listing rows only: columns, not entities (no identity map or loader state).
+        stmt = select(
+            MoneyExtraction.id,
+            MoneyExtraction.party,
+            MoneyExtraction.amount,
+            MoneyExtraction.concept,
+            MoneyExtraction.extraction_date,
+        )
         if self._business_id is not None:
             stmt = stmt.where(MoneyExtraction.business_id == self._business_id)
         if start is not None:
@@ -473,7 +951,7 @@ class InventoryService:
         if end is not None:
             stmt = stmt.where(MoneyExtraction.extraction_date < end)
         stmt = stmt.order_by(MoneyExtraction.extraction_date.desc(), MoneyExtraction.id.desc()).limit(limit)
-        return list(self._db.scalars(stmt))
+        return list(self._db.connection().execute(stmt))
 
     def total_extractions_by_party(
         self,
@@ -493,6 +971,26 @@ class InventoryService:
         rows = self._db.execute(stmt).all()
         return {(party or ""): float(total or 0) for party, total in rows}
 
+    def _run_report_queries(self, queries: dict[str, Callable[["InventoryService"], Any]]) -> dict[str, Any]:
+        """Run independent read-only report queries, concurrently when enabled.
+
+        Concurrent runs use one short-lived session per query (a Session is not
+        thread-safe), so they only see committed data.
+        """
+        bind = self._db.get_bind()
+        if not _PARALLEL_REPORT_QUERIES or bind.dialect.name == "sqlite" or len(queries) < 2:
+            return {key: fn(self) for key, fn in queries.items()}
+
+        business_id = self._business_id
+
+        def run(fn: Callable[["InventoryService"], Any]) -> Any:
+            with Session(bind=bind) as db:
+                return fn(InventoryService(db, business_id=business_id))
+
+        with ThreadPoolExecutor(max_workers=min(len(queries), _PARALLEL_REPORT_WORKERS)) as pool:
+            futures = {key: pool.submit(run, fn) for key, fn in queries.items()}
+            return {key: fut.result() for key, fut in futures.items()}
+
     def monthly_dividends_report(
         self,
         now: Optional[datetime] = None,
@@ -540,49 +1038,27 @@ class InventoryService:
                 opening_as_of_dt = None
 
         # Period metrics (month by default, or user-provided range).
-        sales_total = float(
-            self._db.scalar(
-                select(
-                    func.coalesce(
-                        func.sum(
-                            func.abs(InventoryMovement.quantity)
-                            * func.coalesce(InventoryMovement.unit_price, 0)
-                        ),
-                        0,
-                    )
-                ).where(
-                    and_(
-                        InventoryMovement.type == "sale",
-                        InventoryMovement.movement_date >= period_start,
-                        InventoryMovement.movement_date < period_end,
-                        True if self._business_id is None else (InventoryMovement.business_id == self._business_id),
-                    )
-                )
+        sales_stmt = select(func.coalesce(func.sum(InventoryMovement.line_revenue), 0)).where(
+            and_(
+                InventoryMovement.type == "sale",
+                InventoryMovement.movement_date >= period_start,
+                InventoryMovement.movement_date < period_end,
+                True if self._business_id is None else (InventoryMovement.business_id == self._business_id),
             )
-            or 0
         )
-        cogs_total = float(
-            self._db.scalar(
-                select(func.coalesce(func.sum(MovementAllocation.quantity * MovementAllocation.unit_cost), 0))
-                .select_from(MovementAllocation)
-                .join(InventoryMovement, InventoryMovement.id == MovementAllocation.movement_id)
-                .where(
-                    and_(
-                        InventoryMovement.type == "sale",
-                        InventoryMovement.movement_date >= period_start,
-                        InventoryMovement.movement_date < period_end,
-                        True if self._business_id is None else (InventoryMovement.business_id == self._business_id),
-                    )
+        cogs_stmt = (
+            select(func.coalesce(func.sum(MovementAllocation.quantity * MovementAllocation.unit_cost), 0))
+            .select_from(MovementAllocation)
+            .join(InventoryMovement, InventoryMovement.id == MovementAllocation.movement_id)
+            .where(
+                and_(
+                    InventoryMovement.type == "sale",
+                    InventoryMovement.movement_date >= period_start,
+                    InventoryMovement.movement_date < period_end,
+                    True if self._business_id is None else (InventoryMovement.business_id == self._business_id),
                 )
             )
-            or 0
         )
-        expenses_total = float(self.total_expenses(start=period_start, end=period_end) or 0)
-        gross_total = float(sales_total - cogs_total)
-        net_total = float(gross_total - expenses_total)
-        share_each = (net_total / float(len(partners))) if partners else 0.0
-
-        extraction_totals_period = self.total_extractions_by_party(start=period_start, end=period_end)
 
         # Accumulated pending: opening_pending + totals since opening_pending_as_of (or all time if not set).
         cum_filters = [
@@ -593,47 +1069,43 @@ class InventoryService:
         if opening_as_of_dt is not None:
             cum_filters.append(InventoryMovement.movement_date >= opening_as_of_dt)
 
-        cum_sales_total = float(
-            self._db.scalar(
-                select(
-                    func.coalesce(
-                        func.sum(
-                            func.abs(InventoryMovement.quantity)
-                            * func.coalesce(InventoryMovement.unit_price, 0)
-                        ),
-                        0,
-                    )
-                ).where(and_(*cum_filters))
-            )
-            or 0
+        cum_sales_stmt = select(func.coalesce(func.sum(InventoryMovement.line_revenue), 0)).where(and_(*cum_filters))
+        cum_cogs_stmt = (
+            select(func.coalesce(func.sum(MovementAllocation.quantity * MovementAllocation.unit_cost), 0))
+            .select_from(MovementAllocation)
+            .join(InventoryMovement, InventoryMovement.id == MovementAllocation.movement_id)
+            .where(and_(*cum_filters))
         )
 
-        cum_cogs_filters = [
-            InventoryMovement.type == "sale",
-            InventoryMovement.movement_date < as_of_dt,
-            True if self._business_id is None else (InventoryMovement.business_id == self._business_id),
-        ]
-        if opening_as_of_dt is not None:
-            cum_cogs_filters.append(InventoryMovement.movement_date >= opening_as_of_dt)
-
-        cum_cogs_total = float(
-            self._db.scalar(
-                select(func.coalesce(func.sum(MovementAllocation.quantity * MovementAllocation.unit_cost), 0))
-                .select_from(MovementAllocation)
-                .join(InventoryMovement, InventoryMovement.id == MovementAllocation.movement_id)
-                .where(
-                    and_(*cum_cogs_filters)
-                )
-            )
-            or 0
+        totals = self._run_report_queries(
+            {
+                "sales": lambda svc: svc._db.scalar(sales_stmt),
+                "cogs": lambda svc: svc._db.scalar(cogs_stmt),
+                "expenses": lambda svc: svc.total_expenses(start=period_start, end=period_end),
+                "extractions_period": lambda svc: svc.total_extractions_by_party(start=period_start, end=period_end),
+                "cum_sales": lambda svc: svc._db.scalar(cum_sales_stmt),
+                "cum_cogs": lambda svc: svc._db.scalar(cum_cogs_stmt),
+                "cum_expenses": lambda svc: svc.total_expenses(start=opening_as_of_dt, end=as_of_dt),
+                "extractions_all": lambda svc: svc.total_extractions_by_party(start=opening_as_of_dt, end=as_of_dt),
+            }
         )
 
-        cum_expenses_start = opening_as_of_dt
-        cum_expenses_total = float(self.total_expenses(start=cum_expenses_start, end=as_of_dt) or 0)
-        cum_net_total = float((cum_sales_total - cum_cogs_total) - cum_expenses_total)
-        cum_share_each = (cum_net_total / float(len(partners))) if partners else 0.0
+        sales_total = float(totals["sales"] or 0)
+        cogs_total = float(totals["cogs"] or 0)
+        expenses_total = float(totals["expenses"] or 0)
+        gross_total = sales_total - cogs_total
+        net_total = gross_total - expenses_total
+        share_each = (net_total / len(partners)) if partners else 0.0
+
+        extraction_totals_period = totals["extractions_period"]
+        cum_sales_total = float(totals["cum_sales"] or 0)
+        cum_cogs_total = float(totals["cum_cogs"] or 0)
+
+        cum_expenses_total = float(totals["cum_expenses"] or 0)
+        cum_net_total = (cum_sales_total - cum_cogs_total) - cum_expenses_total
+        cum_share_each = (cum_net_total / len(partners)) if partners else 0.0
 
-        extraction_totals_all = self.total_extractions_by_party(start=opening_as_of_dt, end=as_of_dt)
+        extraction_totals_all = totals["extractions_all"]
 
         opening_pending = getattr(config.dividends, "opening_pending", None) or {}
         opening_map: dict[str, float] = {}
@@ -647,17 +1119,18 @@ class InventoryService:
                 except Exception:
                     continue
 
-        extractions: dict[str, float] = {business_label: float(extraction_totals_period.get(business_label, 0) or 0)}
+        # total_extractions_by_party and opening_map already hold floats.
+        extractions: dict[str, float] = {business_label: extraction_totals_period.get(business_label, 0.0)}
         pending: dict[str, float] = {}
-        business_ext_all = float(extraction_totals_all.get(business_label, 0) or 0)
-        pending[business_label] = float(opening_map.get(business_label, 0) or 0) + float(
+        business_ext_all = extraction_totals_all.get(business_label, 0.0)
+        pending[business_label] = opening_map.get(business_label, 0.0) + (
             (cum_cogs_total + cum_expenses_total) - business_ext_all
         )
 
         for p in partners:
-            extractions[p] = float(extraction_totals_period.get(p, 0) or 0)
-            p_ext_all = float(extraction_totals_all.get(p, 0) or 0)
-            pending[p] = float(opening_map.get(p, 0) or 0) + float(cum_share_each - p_ext_all)
+            extractions[p] = extraction_totals_period.get(p, 0.0)
+            p_ext_all = extraction_totals_all.get(p, 0.0)
+            pending[p] = opening_map.get(p, 0.0) + (cum_share_each - p_ext_all)
 
         return {
             "month_start": period_start,
@@ -759,14 +1232,7 @@ class InventoryService:
                 )
 
         try:
-            if lot_ids:
-                self._db.execute(delete(MovementAllocation).where(MovementAllocation.lot_id.in_(lot_ids)))
-                self._db.execute(delete(InventoryLot).where(InventoryLot.id.in_(lot_ids)))
-
-            self._db.execute(delete(MovementAllocation).where(MovementAllocation.movement_id == mv.id))
-            self._db.execute(delete(InventoryLot).where(InventoryLot.movement_id == mv.id))
-            self._db.execute(delete(InventoryMovement).where(InventoryMovement.id == mv.id))
-            self._db.flush()
+            self._delete_movement_rows(mv.id)
             self._rebuild_product_fifo(product)
             self._sync_default_purchase_cost_from_history(product)
             self._db.commit()
@@ -824,17 +1290,17 @@ class InventoryService:
         try:
             self._db.flush()
             self._rebuild_product_fifo(product)
+            loc_id = int(getattr(mv, "location_id", None) or 0) or self._central_location_id()
+            movement_read = _movement_read(mv)
+            stock_after = self._inventory.stock_for_product_id(product.id, location_id=loc_id)
+            warning = self._warning_if_restock_needed(product, stock_after)
             self._db.commit()
         except HTTPException:
             self._db.rollback()
             raise
 
-        self._db.refresh(mv)
-        loc_id = int(getattr(mv, "location_id", None) or 0) or self._central_location_id()
-        stock_after = self._inventory.stock_for_product_id(product.id, location_id=loc_id)
-        warning = self._warning_if_restock_needed(product, stock_after)
         return MovementResult(
-            movement=MovementRead.model_validate(mv),
+            movement=movement_read,
             stock_after=stock_after,
             warning=warning,
         )
@@ -864,17 +1330,17 @@ class InventoryService:
         try:
             self._db.flush()
             self._rebuild_product_fifo(product)
+            loc_id = int(getattr(mv, "location_id", None) or 0) or self._central_location_id()
+            movement_read = _movement_read(mv)
+            stock_after = self._inventory.stock_for_product_id(product.id, location_id=loc_id)
+            warning = self._warning_if_restock_needed(product, stock_after)
             self._db.commit()
         except HTTPException:
             self._db.rollback()
             raise
 
-        self._db.refresh(mv)
-        loc_id = int(getattr(mv, "location_id", None) or 0) or self._central_location_id()
-        stock_after = self._inventory.stock_for_product_id(product.id, location_id=loc_id)
-        warning = self._warning_if_restock_needed(product, stock_after)
         return MovementResult(
-            movement=MovementRead.model_validate(mv),
+            movement=movement_read,
             stock_after=stock_after,
             warning=warning,
         )
@@ -1146,7 +1612,7 @@ class InventoryService:
                 ),
             )
 
-        effective_ref = (ref or "").strip() or f"TP-{from_code}-{to_code}-{mv_dt:%y%m%d%H%M%S}"  # stable grouping key
+        effective_ref = (ref or "").strip() or f"TP-{from_code}-{to_code}-{_lot_stamp(mv_dt, seconds=True)}"  # stable grouping key
 
         clean_note = (note or "").strip()
         base_note = f"Transfer {from_code}->{to_code} ref={effective_ref}"
@@ -1164,83 +1630,29 @@ class InventoryService:
             self._consume_fifo(product.id, from_loc_id, mv_out.id, float(quantity))
             self._db.flush()
 
-            alloc_rows = list(
-                self._db.execute(
-                    select(
-                        MovementAllocation.quantity,
-                        MovementAllocation.unit_cost,
-                        InventoryLot.lot_code,
-                        InventoryLot.received_at,
-                    )
-                    .select_from(MovementAllocation)
-                    .join(InventoryLot, InventoryLot.id == MovementAllocation.lot_id)
-                    .where(MovementAllocation.movement_id == mv_out.id)
-                    .order_by(InventoryLot.received_at, InventoryLot.id)
-                ).all()
+            self._transfer_in_from_allocations(
+                product,
+                mv_out,
+                from_code=from_code,
+                to_code=to_code,
+                to_loc_id=to_loc_id,
+                ref=effective_ref,
+                note=clean_note,
+                movement_dt=mv_dt,
             )
 
-            for a_qty, a_unit_cost, src_lot_code, src_received_at in alloc_rows:
-                if float(a_qty or 0) <= 1e-9:
-                    continue
-                src_recv_dt = src_received_at
-                if src_recv_dt is None:
-                    src_recv_dt = mv_dt
-
-                recv_iso = None
-                try:
-                    recv_iso = src_recv_dt.isoformat()
-                except Exception:
-                    recv_iso = None
-
-                mv_in_note = f"Transfer in from {from_code} out_id={mv_out.id} ref={effective_ref}"
-                if src_lot_code:
-                    mv_in_note = mv_in_note + f" lot={src_lot_code}"
-                if recv_iso:
-                    mv_in_note = mv_in_note + f" received_at={recv_iso}"
-                if clean_note:
-                    mv_in_note = mv_in_note + f"; {clean_note}"
-
-                mv_in = InventoryMovement(
-                    business_id=self._business_id,
-                    product_id=product.id,
-                    location_id=to_loc_id,
-                    type="transfer_in",
-                    quantity=float(a_qty or 0),
-                    unit_cost=float(a_unit_cost or 0),
-                    unit_price=None,
-                    movement_date=mv_dt,
-                    note=mv_in_note,
-                )
-                self._inventory.add_movement(mv_in)
-                self._db.flush()
-
-                base_code = f"TR-{src_lot_code or product.sku}-{to_code}-{mv_dt:%y%m%d%H%M%S}-{mv_in.id}"
-                lot_code = self._unique_lot_code(self._compact_lot_code(base_code))
-                lot = InventoryLot(
-                    business_id=self._business_id,
-                    movement_id=mv_in.id,
-                    product_id=product.id,
-                    location_id=to_loc_id,
-                    lot_code=lot_code,
-                    received_at=src_recv_dt,
-                    unit_cost=float(a_unit_cost or 0),
-                    qty_received=float(a_qty or 0),
-                    qty_remaining=float(a_qty or 0),
-                )
-                self._inventory.add_lot(lot)
-
             self._db.flush()
             self._rebuild_product_fifo(product)
+            movement_read = _movement_read(mv_out)
+            stock_after = self._inventory.stock_for_product_id(product.id, location_id=from_loc_id)
+            warning = self._warning_if_restock_needed(product, stock_after)
             self._db.commit()
         except HTTPException:
             self._db.rollback()
             raise
 
-        self._db.refresh(mv_out)
-        stock_after = self._inventory.stock_for_product_id(product.id, location_id=from_loc_id)
-        warning = self._warning_if_restock_needed(product, stock_after)
         return MovementResult(
-            movement=MovementRead.model_validate(mv_out),
+            movement=movement_read,
             stock_after=stock_after,
             warning=warning,
         )
@@ -1324,9 +1736,7 @@ class InventoryService:
             raise HTTPException(status_code=404, detail="Product not found")
 
         try:
-            self._db.execute(delete(MovementAllocation).where(MovementAllocation.movement_id == mv.id))
-            self._db.execute(delete(InventoryMovement).where(InventoryMovement.id == mv.id))
-            self._db.flush()
+            self._delete_movement_rows(mv.id)
             self._rebuild_product_fifo(product)
             self._db.commit()
         except HTTPException:
@@ -1425,8 +1835,14 @@ class InventoryService:
         start: Optional[datetime] = None,
         end: Optional[datetime] = None,
         limit: int = 100,
-    ) -> list[OperatingExpense]:
-        stmt = select(OperatingExpense)
+    ) -> list[Row]:
+        # Listing rows only: columns, not entities (no identity map or loader state).
+        stmt = select(
+            OperatingExpense.id,
+            OperatingExpense.amount,
+            OperatingExpense.concept,
+            OperatingExpense.expense_date,
+        )
         if self._business_id is not None:
             stmt = stmt.where(OperatingExpense.business_id == self._business_id)
         if start is not None:
@@ -1434,16 +1850,17 @@ class InventoryService:
         if end is not None:
             stmt = stmt.where(OperatingExpense.expense_date < end)
         stmt = stmt.order_by(OperatingExpense.expense_date.desc(), OperatingExpense.id.desc()).limit(limit)
-        return list(self._db.scalars(stmt))
+        return list(self._db.connection().execute(stmt))
+
+    def _expenses_filter(self, start: Optional[datetime], end: Optional[datetime]):
+        return and_(
+            True if self._business_id is None else (OperatingExpense.business_id == self._business_id),
+            True if start is None else (OperatingExpense.expense_date >= start),
+            True if end is None else (OperatingExpense.expense_date < end),
+        )
 
     def total_expenses(self, start: Optional[datetime] = None, end: Optional[datetime] = None) -> float:
-        stmt = select(func.coalesce(func.sum(OperatingExpense.amount), 0))
-        if self._business_id is not None:
-            stmt = stmt.where(OperatingExpense.business_id == self._business_id)
-        if start is not None:
-            stmt = stmt.where(OperatingExpense.expense_date >= start)
-        if end is not None:
-            stmt = stmt.where(OperatingExpense.expense_date < end)
+        stmt = select(func.coalesce(func.sum(OperatingExpense.amount), 0)).where(self._expenses_filter(start, end))
         return float(self._db.scalar(stmt) or 0)
 
     def inventory_value_total(self, location_id: Optional[int] = None) -> float:
@@ -1488,18 +1905,16 @@ class InventoryService:
         return float(total or 0)
 
     def sales_by_product(self, start: datetime, end: datetime, location_id: Optional[int] = None) -> tuple[float, list[dict]]:
+        sales_sum = func.sum(InventoryMovement.line_revenue)
+        sales_col = _float_sum(InventoryMovement.line_revenue).label("sales")
         rows = self._db.execute(
             select(
                 Product.sku,
                 Product.name,
-                func.coalesce(func.sum(func.abs(InventoryMovement.quantity)), 0).label("qty"),
-                func.coalesce(
-                    func.sum(
-                        func.abs(InventoryMovement.quantity)
-                        * func.coalesce(InventoryMovement.unit_price, 0)
-                    ),
-                    0,
-                ).label("sales"),
+                _float_sum(func.abs(InventoryMovement.quantity)).label("qty"),
+                sales_col,
+                # Grand total over all groups, computed in the same round-trip.
+                cast(func.coalesce(func.sum(sales_sum).over(), 0), Float).label("total_sales"),
             )
             .select_from(InventoryMovement)
             .join(Product, Product.id == InventoryMovement.product_id)
@@ -1513,22 +1928,12 @@ class InventoryService:
                 )
             )
             .group_by(Product.id)
-            .order_by(func.coalesce(func.sum(func.abs(InventoryMovement.quantity) * func.coalesce(InventoryMovement.unit_price, 0)), 0).desc())
+            .order_by(sales_col.desc())
         ).all()
 
-        items: list[dict] = []
-        total_sales = 0.0
-        for sku, name, qty, sales in rows:
-            sales_f = float(sales or 0)
-            total_sales += sales_f
-            items.append(
-                {
-                    "sku": sku,
-                    "name": name,
-                    "qty": float(qty or 0),
-                    "sales": sales_f,
-                }
-            )
+        # Measures arrive as floats from SQL; rows only need shaping.
+        items = [{"sku": sku, "name": name, "qty": qty, "sales": sales} for sku, name, qty, sales, _total in rows]
+        total_sales = rows[0].total_sales if rows else 0.0
         return total_sales, items
 
     def sales_metrics_table(
@@ -1548,12 +1953,7 @@ class InventoryService:
         anchor_dt = (end_dt - timedelta(seconds=1)) if end_dt is not None else now_dt
         month_start, month_end = self._month_range(anchor_dt)
 
-        range_start = month_start
-        for _ in range(max(months - 1, 0)):
-            if range_start.month == 1:
-                range_start = range_start.replace(year=range_start.year - 1, month=12)
-            else:
-                range_start = range_start.replace(month=range_start.month - 1)
+        range_start = add_months(month_start, -max(months - 1, 0))
 
         range_end = month_end
         range_days = max(1, int((range_end - range_start).days))
@@ -1568,7 +1968,7 @@ class InventoryService:
 
         if period_cond is None:
             qty_period_expr = func.sum(func.abs(InventoryMovement.quantity))
-            sales_period_expr = func.sum(func.abs(InventoryMovement.quantity) * func.coalesce(InventoryMovement.unit_price, 0))
+            sales_period_expr = func.sum(InventoryMovement.line_revenue)
         else:
             qty_period_expr = func.sum(
                 case(
@@ -1583,48 +1983,25 @@ class InventoryService:
                 case(
                     (
                         period_cond,
-                        func.abs(InventoryMovement.quantity) * func.coalesce(InventoryMovement.unit_price, 0),
+                        InventoryMovement.line_revenue,
                     ),
                     else_=0,
                 )
             )
 
-        # Rolling window totals for planning (e.g. last 12 months).
-        window_cond = and_(InventoryMovement.movement_date >= range_start, InventoryMovement.movement_date < range_end)
-        qty_range_expr = func.sum(
-            case(
-                (
-                    window_cond,
-                    func.abs(InventoryMovement.quantity),
-                ),
-                else_=0,
-            )
-        )
-        sales_range_expr = func.sum(
-            case(
-                (
-                    window_cond,
-                    func.abs(InventoryMovement.quantity) * func.coalesce(InventoryMovement.unit_price, 0),
-                ),
-                else_=0,
-            )
-        )
-        sale_days_expr = func.count(func.distinct(case((window_cond, func.date(InventoryMovement.movement_date)), else_=None)))
-
-        stock_sq = (
-            select(
-                InventoryLot.product_id.label("product_id"),
-                func.coalesce(func.sum(func.coalesce(InventoryLot.qty_remaining, 0)), 0).label("stock_qty"),
-            )
-            .select_from(InventoryLot)
+        # Correlated per product (an index lookup on inventory_lots.product_id) so
+        # only products sold in the window are summed, not every lot up front.
+        stock_qty_sq = (
+            select(func.coalesce(func.sum(func.coalesce(InventoryLot.qty_remaining, 0)), 0))
             .where(
                 and_(
+                    InventoryLot.product_id == Product.id,
                     True if self._business_id is None else (InventoryLot.business_id == self._business_id),
                     True if location_id is None else (InventoryLot.location_id == location_id),
                 )
             )
-            .group_by(InventoryLot.product_id)
-            .subquery()
+            .correlate(Product)
+            .scalar_subquery()
         )
 
         # For performance, narrow scan when a period filter is provided.
@@ -1644,16 +2021,11 @@ class InventoryService:
                 Product.name,
                 func.coalesce(qty_period_expr, 0).label("qty_period"),
                 func.coalesce(sales_period_expr, 0).label("sales_period"),
-                func.coalesce(qty_range_expr, 0).label("qty_range"),
-                func.coalesce(sales_range_expr, 0).label("sales_range"),
-                func.coalesce(sale_days_expr, 0).label("sale_days"),
                 func.coalesce(Product.min_stock, 0).label("min_stock"),
-                func.coalesce(Product.lead_time_days, 0).label("lead_time_days"),
-                func.coalesce(stock_sq.c.stock_qty, 0).label("stock_qty"),
+                stock_qty_sq.label("stock_qty"),
             )
             .select_from(InventoryMovement)
             .join(Product, Product.id == InventoryMovement.product_id)
-            .outerjoin(stock_sq, stock_sq.c.product_id == Product.id)
             .where(
                 and_(
                     InventoryMovement.type == "sale",
@@ -1667,8 +2039,6 @@ class InventoryService:
                 Product.sku,
                 Product.name,
                 Product.min_stock,
-                Product.lead_time_days,
-                stock_sq.c.stock_qty,
             )
             .order_by(func.coalesce(sales_period_expr, 0).desc())
         ).all()
@@ -1704,7 +2074,7 @@ class InventoryService:
             daily_rows = self._db.execute(
                 select(
                     Product.sku,
-                    func.date(InventoryMovement.movement_date).label("day"),
+                    utc_day(InventoryMovement.movement_date).label("day"),
                     func.coalesce(func.sum(func.abs(InventoryMovement.quantity)), 0).label("qty"),
                 )
                 .select_from(InventoryMovement)
@@ -1719,10 +2089,10 @@ class InventoryService:
                         True if location_id is None else (InventoryMovement.location_id == location_id),
                     )
                 )
-                .group_by(Product.sku, func.date(InventoryMovement.movement_date))
+                .group_by(Product.sku, utc_day(InventoryMovement.movement_date))
             ).all()
 
-            weekly_by_sku: dict[str, dict[datetime, float]] = {}
+            weekly_by_sku: defaultdict[str, defaultdict[date, float]] = defaultdict(lambda: defaultdict(float))
             for sku, day_raw, qty in daily_rows:
                 sku_s = str(sku)
                 try:
@@ -1732,15 +2102,8 @@ class InventoryService:
                         day_d = datetime.fromisoformat(str(day_raw)).date()
                 except Exception:
                     continue
-                week_start_date = day_d - timedelta(days=int(day_d.weekday()))
-                week_start_dt = datetime(
-                    week_start_date.year,
-                    week_start_date.month,
-                    week_start_date.day,
-                    tzinfo=timezone.utc,
-                )
-                m = weekly_by_sku.setdefault(sku_s, {})
-                m[week_start_dt] = float(m.get(week_start_dt, 0.0)) + float(qty or 0)
+                # Days are already UTC calendar days: key weeks by plain date.
+                weekly_by_sku[sku_s][day_d - timedelta(days=day_d.weekday())] += float(qty or 0)
 
             try:
                 start_date = start_window.date()
@@ -1750,36 +2113,27 @@ class InventoryService:
             end_date = (anchor_dt - timedelta(days=1)).date() if anchor_dt else start_date
             end_week_date = end_date - timedelta(days=int(end_date.weekday()))
 
-            week_starts: list[datetime] = []
-            cur = datetime(start_week_date.year, start_week_date.month, start_week_date.day, tzinfo=timezone.utc)
-            end_dt_week = datetime(end_week_date.year, end_week_date.month, end_week_date.day, tzinfo=timezone.utc)
-            while cur <= end_dt_week:
-                week_starts.append(cur)
-                cur = cur + timedelta(days=7)
+            # Weeks with no sales contribute zeros, so mean/variance only need the
+            # weeks that have sales plus the total week count.
+            n_weeks = (end_week_date - start_week_date).days // 7 + 1 if end_week_date >= start_week_date else 0
 
             for sku_s in skus:
-                wmap = weekly_by_sku.get(sku_s, {})
-                series = [float(wmap.get(ws, 0.0)) for ws in week_starts]
-                n_weeks = len(series)
                 if n_weeks <= 0:
                     weekly_stats_by_sku[sku_s] = (0.0, 0.0, 0)
                     continue
-                mean_w = float(sum(series)) / float(n_weeks)
+                wmap = weekly_by_sku.get(sku_s, {})
+                values = [q for ws, q in wmap.items() if start_week_date <= ws <= end_week_date]
+                mean_w = sum(values) / n_weeks
                 if n_weeks <= 1:
                     std_w = 0.0
                 else:
-                    var = float(sum((x - mean_w) ** 2 for x in series)) / float(n_weeks)
-                    std_w = float(math.sqrt(var))
-                weekly_stats_by_sku[sku_s] = (mean_w, std_w, int(n_weeks))
+                    sq = sum((x - mean_w) ** 2 for x in values) + (n_weeks - len(values)) * mean_w * mean_w
+                    std_w = math.sqrt(sq / n_weeks)
+                weekly_stats_by_sku[sku_s] = (mean_w, std_w, n_weeks)
 
+        sqrt_lead_time_weeks = math.sqrt(lead_time_weeks)
         out: list[dict] = []
-        for sku, name, qty_period, sales_period, qty_range, sales_range, sale_days, min_stock, lead_time_days, stock_qty in rows:
-            qty_p = float(qty_period or 0)
-            sales_p = float(sales_period or 0)
-            qty_r = float(qty_range or 0)
-            sales_r = float(sales_range or 0)
-            sale_days_i = int(sale_days or 0)
-
+        for sku, name, qty_period, sales_period, min_stock, stock_qty in rows:
             stock_qty_f = float(stock_qty or 0)
             min_stock_f = float(min_stock or 0)
 
@@ -1787,73 +2141,80 @@ class InventoryService:
             mean_w, std_w, n_weeks = weekly_stats_by_sku.get(sku_s, (0.0, 0.0, 0))
             safety_stock = 0.0
             reorder_point = 0.0
-            reorder_shortage = 0.0
-            if float(mean_w) > 0:
-                std_eff = float(std_w)
-                if int(n_weeks) < 4:
-                    std_eff = float(max(std_eff, float(mean_w)))
-                safety_stock_calc = float(service_z) * float(math.sqrt(lead_time_weeks)) * float(std_eff)
-                safety_stock = float(max(1.0, float(math.ceil(safety_stock_calc))))
-                reorder_point = float((float(mean_w) * float(lead_time_weeks)) + float(safety_stock))
+            if mean_w > 0:
+                std_eff = max(std_w, mean_w) if n_weeks < 4 else std_w
+                safety_stock = max(1.0, float(math.ceil(service_z * sqrt_lead_time_weeks * std_eff)))
+                reorder_point = mean_w * lead_time_weeks + safety_stock
 
             # Effective ROP uses product.min_stock as a floor.
-            reorder_point = float(max(float(reorder_point or 0.0), float(min_stock_f or 0.0)))
-            reorder_shortage = float(max(0.0, float(reorder_point) - float(stock_qty_f)))
+            reorder_point = max(reorder_point, min_stock_f)
 
             out.append(
                 {
-                    "sku": str(sku),
+                    "sku": sku_s,
                     "name": str(name or ""),
-                    "qty_period": qty_p,
-                    "sales_period": sales_p,
-                    "stock_qty": float(stock_qty_f),
-                    "min_stock": float(min_stock_f),
+                    "qty_period": float(qty_period or 0),
+                    "sales_period": float(sales_period or 0),
+                    "stock_qty": stock_qty_f,
+                    "min_stock": min_stock_f,
                     "avg_weekly_sales": float(mean_w),
                     "std_weekly_sales": float(std_w),
-                    "safety_stock": float(safety_stock),
+                    "safety_stock": safety_stock,
                     "reorder_point": float(reorder_point),
-                    "reorder_shortage": float(reorder_shortage),
+                    "reorder_shortage": max(0.0, reorder_point - stock_qty_f),
                 }
             )
 
         return out
 
     def daily_sales_series(self, start: datetime, end: datetime, location_id: Optional[int] = None) -> list[dict]:
-        rows = self._db.execute(
-            select(
-                func.date(InventoryMovement.movement_date).label("day"),
-                func.coalesce(
-                    func.sum(
-                        func.abs(InventoryMovement.quantity)
-                        * func.coalesce(InventoryMovement.unit_price, 0)
-                    ),
-                    0,
-                ).label("sales"),
+        sales_col = _float_sum(InventoryMovement.line_revenue).label("sales")
+        sale_filter = and_(
+            InventoryMovement.type == "sale",
+            InventoryMovement.movement_date >= start,
+            InventoryMovement.movement_date < end,
+            True if self._business_id is None else (InventoryMovement.business_id == self._business_id),
+            True if location_id is None else (InventoryMovement.location_id == location_id),
+        )
+
+        if self._db.get_bind().dialect.name == "postgresql":
+            # Dense series straight from the DB: one row per day, gaps included.
+            if start.date() >= end.date():
+                return []
+            gs = (
+                func.generate_series(start.date(), end.date() - timedelta(days=1), text("interval '1 day'"))
+                .table_valued("day")
+                .alias("gs")
             )
-            .select_from(InventoryMovement)
-            .where(
-                and_(
-                    InventoryMovement.type == "sale",
-                    InventoryMovement.movement_date >= start,
-                    InventoryMovement.movement_date < end,
-                    True if self._business_id is None else (InventoryMovement.business_id == self._business_id),
-                    True if location_id is None else (InventoryMovement.location_id == location_id),
+            day_col = cast(gs.c.day, Date)
+            rows = self._db.execute(
+                select(day_col.label("day"), sales_col)
+                .select_from(gs)
+                .outerjoin(
+                    InventoryMovement,
+                    and_(utc_day(InventoryMovement.movement_date) == day_col, sale_filter),
                 )
-            )
-            .group_by(func.date(InventoryMovement.movement_date))
-            .order_by(func.date(InventoryMovement.movement_date))
+                .group_by(day_col)
+                .order_by(day_col)
+            ).all()
+            return [{"day": day.isoformat(), "sales": sales} for day, sales in rows]
+
+        rows = self._db.execute(
+            select(utc_day(InventoryMovement.movement_date).label("day"), sales_col)
+            .select_from(InventoryMovement)
+            .where(sale_filter)
+            .group_by(utc_day(InventoryMovement.movement_date))
+            .order_by(utc_day(InventoryMovement.movement_date))
         ).all()
 
-        by_day: dict[str, float] = {}
-        for day, sales in rows:
-            by_day[str(day)] = float(sales or 0)
+        by_day: dict[str, float] = {str(day): sales for day, sales in rows}
 
         out: list[dict] = []
         cur = start.date()
         end_date = end.date()
         while cur < end_date:
             key = cur.isoformat()
-            out.append({"day": key, "sales": float(by_day.get(key, 0.0))})
+            out.append({"day": key, "sales": by_day.get(key, 0.0)})
             cur = cur + timedelta(days=1)
 
         return out
@@ -1882,78 +2243,71 @@ class InventoryService:
         concept, total = row
         return {"concept": concept, "total": float(total or 0)}
 
-    def monthly_profit_report(
+    def monthly_profit_by_product(
         self,
         now: Optional[datetime] = None,
         location_id: Optional[int] = None,
         *,
         start: Optional[datetime] = None,
         end: Optional[datetime] = None,
-    ) -> tuple[dict, list[dict]]:
+    ) -> list[dict]:
+        """Per-product items of `monthly_profit_report`, without the summary (and its expenses query)."""
         now_dt = now or datetime.now(timezone.utc)
         if start is None or end is None:
             month_start, month_end = self._month_range(now_dt)
             start = month_start if start is None else start
             end = month_end if end is None else end
+        return self._profit_by_product(start, end, location_id)
+
+    def _profit_by_product(self, start: datetime, end: datetime, location_id: Optional[int]) -> list[dict]:
+        # Column-only rows, unpacked positionally: run on the session's Connection
+        # so they skip the ORM result layer.
+        rows = self._db.connection().execute(self._profit_by_product_stmt(start, end, location_id)).all()
+        return self._profit_items(rows)
 
-        sales_rows = self._db.execute(
+    def _profit_by_product_stmt(self, start: datetime, end: datetime, location_id: Optional[int]):
+        sale_filter = and_(
+            InventoryMovement.type == "sale",
+            InventoryMovement.movement_date >= start,
+            InventoryMovement.movement_date < end,
+            True if self._business_id is None else (InventoryMovement.business_id == self._business_id),
+            True if location_id is None else (InventoryMovement.location_id == location_id),
+        )
+        # Allocations are pre-aggregated per movement so joining them does not
+        # repeat a sale line once per lot it consumed; only the period's sales
+        # are aggregated, not the whole allocation table.
+        cogs_sq = (
+            select(
+                MovementAllocation.movement_id.label("movement_id"),
+                func.sum(MovementAllocation.quantity * MovementAllocation.unit_cost).label("cogs"),
+            )
+            .join(InventoryMovement, InventoryMovement.id == MovementAllocation.movement_id)
+            .where(sale_filter)
+            .group_by(MovementAllocation.movement_id)
+            .subquery()
+        )
+        sales_col = _float_sum(InventoryMovement.line_revenue).label("sales")
+        return (
             select(
                 Product.id,
                 Product.sku,
                 Product.name,
-                func.coalesce(func.sum(func.abs(InventoryMovement.quantity)), 0).label("qty"),
-                func.coalesce(
-                    func.sum(
-                        func.abs(InventoryMovement.quantity)
-                        * func.coalesce(InventoryMovement.unit_price, 0)
-                    ),
-                    0,
-                ).label("sales"),
+                _float_sum(func.abs(InventoryMovement.quantity)).label("qty"),
+                sales_col,
+                _float_sum(cogs_sq.c.cogs).label("cogs"),
             )
             .select_from(InventoryMovement)
             .join(Product, Product.id == InventoryMovement.product_id)
-            .where(
-                and_(
-                    InventoryMovement.type == "sale",
-                    InventoryMovement.movement_date >= start,
-                    InventoryMovement.movement_date < end,
-                    True if self._business_id is None else (InventoryMovement.business_id == self._business_id),
-                    True if location_id is None else (InventoryMovement.location_id == location_id),
-                )
-            )
-            .group_by(Product.id)
-        ).all()
-
-        cogs_rows = self._db.execute(
-            select(
-                Product.id,
-                func.coalesce(func.sum(MovementAllocation.quantity * MovementAllocation.unit_cost), 0).label(
-                    "cogs"
-                ),
-            )
-            .select_from(MovementAllocation)
-            .join(InventoryMovement, InventoryMovement.id == MovementAllocation.movement_id)
-            .join(Product, Product.id == InventoryMovement.product_id)
-            .where(
-                and_(
-                    InventoryMovement.type == "sale",
-                    InventoryMovement.movement_date >= start,
-                    InventoryMovement.movement_date < end,
-                    True if self._business_id is None else (InventoryMovement.business_id == self._business_id),
-                    True if location_id is None else (InventoryMovement.location_id == location_id),
-                )
-            )
+            .outerjoin(cogs_sq, cogs_sq.c.movement_id == InventoryMovement.id)
+            .where(sale_filter)
             .group_by(Product.id)
-        ).all()
-
-        cogs_by_product = {int(pid): float(cogs or 0) for pid, cogs in cogs_rows}
+            .order_by(sales_col.desc(), Product.id)
+        )
 
+    @staticmethod
+    def _profit_items(rows) -> list[dict]:
         items: list[dict] = []
-        sales_total = 0.0
-        cogs_total = 0.0
-        for pid, sku, name, qty, sales in sales_rows:
-            sales_f = float(sales or 0)
-            cogs_f = float(cogs_by_product.get(int(pid), 0))
+        for pid, sku, name, qty, sales_f, cogs_f in rows:
             gross = sales_f - cogs_f
             cost_pct = (cogs_f / sales_f * 100.0) if sales_f else 0.0
             gross_pct = (gross / sales_f * 100.0) if sales_f else 0.0
@@ -1961,7 +2315,7 @@ class InventoryService:
                 {
                     "sku": sku,
                     "name": name,
-                    "qty": float(qty or 0),
+                    "qty": qty,
                     "sales": sales_f,
                     "cogs": cogs_f,
                     "gross": gross,
@@ -1969,13 +2323,54 @@ class InventoryService:
                     "gross_pct": gross_pct,
                 }
             )
-            sales_total += sales_f
-            cogs_total += cogs_f
+        return items
+
+    def monthly_profit_report(
+        self,
+        now: Optional[datetime] = None,
+        location_id: Optional[int] = None,
+        *,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+    ) -> tuple[dict, list[dict]]:
+        now_dt = now or datetime.now(timezone.utc)
+        if start is None or end is None:
+            month_start, month_end = self._month_range(now_dt)
+            start = month_start if start is None else start
+            end = month_end if end is None else end
 
-        items.sort(key=lambda r: r["sales"], reverse=True)
+        # The period's expenses ride along as a one-row aggregate outer-joined to
+        # the per-product rows: one round trip, and still one row (with NULL
+        # product columns) when nothing was sold.
+        profit_sq = self._profit_by_product_stmt(start, end, location_id).subquery("profit")
+        expenses_sq = (
+            select(_float_sum(OperatingExpense.amount).label("expenses"))
+            .where(self._expenses_filter(start, end))
+            .subquery("expenses")
+        )
+        rows = self._db.connection().execute(
+            select(
+                expenses_sq.c.expenses,
+                profit_sq.c.id,
+                profit_sq.c.sku,
+                profit_sq.c.name,
+                profit_sq.c.qty,
+                profit_sq.c.sales,
+                profit_sq.c.cogs,
+            )
+            .select_from(expenses_sq)
+            .outerjoin(profit_sq, true())
+            .order_by(profit_sq.c.sales.desc(), profit_sq.c.id)
+        ).all()
+        expenses_total = float(rows[0][0] or 0)
+        items = self._profit_items(row[1:] for row in rows if row[1] is not None)
+        sales_total = 0.0
+        cogs_total = 0.0
+        for item in items:
+            sales_total += item["sales"]
+            cogs_total += item["cogs"]
 
         gross_total = sales_total - cogs_total
-        expenses_total = self.total_expenses(start=start, end=end)
         net_total = gross_total - expenses_total
 
         summary = {
@@ -2008,43 +2403,15 @@ class InventoryService:
             start = month_start if start is None else start
             end = month_end if end is None else end
 
-        src_mv = aliased(InventoryMovement)
-        loc = aliased(Location)
-
-        rows = self._db.execute(
-            select(
-                InventoryMovement.id.label("sale_movement_id"),
-                InventoryMovement.movement_date,
-                loc.code.label("location_code"),
-                loc.name.label("location_name"),
-                Product.sku,
-                Product.name,
-                Product.category,
-                InventoryLot.id.label("lot_id"),
-                InventoryLot.movement_id.label("source_movement_id"),
-                src_mv.type.label("source_movement_type"),
-                InventoryLot.lot_code,
-                MovementAllocation.unit_cost,
-                InventoryMovement.unit_price,
-                MovementAllocation.quantity,
-            )
-            .select_from(MovementAllocation)
-            .join(InventoryMovement, InventoryMovement.id == MovementAllocation.movement_id)
-            .outerjoin(loc, loc.id == InventoryMovement.location_id)
-            .join(Product, Product.id == InventoryMovement.product_id)
-            .join(InventoryLot, InventoryLot.id == MovementAllocation.lot_id)
-            .join(src_mv, src_mv.id == InventoryLot.movement_id)
-            .where(
-                and_(
-                    InventoryMovement.type == "sale",
-                    InventoryMovement.movement_date >= start,
-                    InventoryMovement.movement_date < end,
-                    True if self._business_id is None else (InventoryMovement.business_id == self._business_id),
-                    True if location_id is None else (InventoryMovement.location_id == location_id),
-                )
-            )
-            .order_by(InventoryMovement.movement_date.desc(), InventoryMovement.id.desc())
-        ).all()
+        # Column-only report rows: executing on the session's Connection skips the
+        # ORM result layer (same transaction, about a third less CPU per row).
+        # Rows are streamed in batches and turned into items as they arrive, so
+        # the raw result set and the item dicts are never both held in full.
+        rows = self._db.connection().execute(
+            _profit_items_stmt(location_id is not None),
+            {"start": start, "end": end, "business_id": self._business_id, "location_id": location_id},
+            execution_options={"yield_per": 1000},
+        )
 
         items: list[dict] = []
         qty_total = 0.0
@@ -2067,12 +2434,9 @@ class InventoryService:
             unit_cost,
             unit_price,
             qty,
+            sales,
+            cogs,
         ) in rows:
-            qty_f = float(qty or 0)
-            unit_price_f = float(unit_price or 0)
-            unit_cost_f = float(unit_cost or 0)
-            sales = qty_f * unit_price_f
-            cogs = qty_f * unit_cost_f
             profit = sales - cogs
             margin_pct = (profit / sales * 100.0) if sales else 0.0
 
@@ -2089,16 +2453,16 @@ class InventoryService:
                     "source_movement_id": int(source_movement_id) if source_movement_id is not None else None,
                     "source_movement_type": str(source_movement_type or ""),
                     "lot_code": lot_code,
-                    "unit_cost": unit_cost_f,
-                    "unit_price": unit_price_f,
-                    "qty": qty_f,
+                    "unit_cost": unit_cost,
+                    "unit_price": unit_price,
+                    "qty": qty,
                     "cogs": cogs,
                     "sales": sales,
                     "profit": profit,
                     "margin_pct": margin_pct,
                 }
             )
-            qty_total += qty_f
+            qty_total += qty
             sales_total += sales
             cogs_total += cogs
             profit_total += profit
@@ -2115,6 +2479,55 @@ class InventoryService:
 
         return summary, items
 
+    def _monthly_totals(
+        self, start: datetime, end: datetime, location_id: Optional[int]
+    ) -> tuple[dict[str, float], dict[str, float], dict[str, float]]:
+        # One row per month and measure; the month key is computed in SQL.
+        params = {"start": start, "end": end, "business_id": self._business_id, "location_id": location_id}
+        movements_stmt, cogs_stmt = _monthly_totals_stmts(location_id is not None)
+        totals = self._run_report_queries(
+            {
+                "movements": lambda svc: svc._db.connection().execute(movements_stmt, params).all(),
+                "cogs": lambda svc: dict(svc._db.connection().execute(cogs_stmt, params).all()),
+            }
+        )
+        purchases_by: dict[str, float] = {}
+        sales_by: dict[str, float] = {}
+        for key, purchases, sales in totals["movements"]:
+            purchases_by[key] = purchases
+            sales_by[key] = sales
+        return purchases_by, sales_by, totals["cogs"]
+
+    def _monthly_totals_from_view(
+        self, start: datetime, end: datetime, location_id: Optional[int]
+    ) -> tuple[dict[str, float], dict[str, float], dict[str, float]]:
+        mf = _monthly_financials.c
+        rows = self._db.connection().execute(
+            select(
+                mf.year_month,
+                _float_sum(mf.purchases_value),
+                _float_sum(mf.sales_value),
+                _float_sum(mf.cogs_value),
+            )
+            .where(
+                and_(
+                    mf.year_month >= start.strftime("%Y-%m"),
+                    mf.year_month < end.strftime("%Y-%m"),
+                    True if self._business_id is None else (mf.business_id == self._business_id),
+                    True if location_id is None else (mf.location_id == location_id),
+                )
+            )
+            .group_by(mf.year_month)
+        ).all()
+        purchases_by: dict[str, float] = {}
+        sales_by: dict[str, float] = {}
+        cogs_by: dict[str, float] = {}
+        for key, purchases, sales, cogs in rows:
+            purchases_by[key] = purchases
+            sales_by[key] = sales
+            cogs_by[key] = cogs
+        return purchases_by, sales_by, cogs_by
+
     def monthly_overview(
         self,
         months: int = 12,
@@ -2128,108 +2541,32 @@ class InventoryService:
             now_dt = now_dt.replace(tzinfo=timezone.utc)
         now_dt = now_dt.astimezone(timezone.utc)
 
-        month_start, _ = self._month_range(now_dt)
+        month_start, range_end = self._month_range(now_dt)
 
-        range_start = month_start
-        for _ in range(max(months - 1, 0)):
-            if range_start.month == 1:
-                range_start = range_start.replace(year=range_start.year - 1, month=12)
-            else:
-                range_start = range_start.replace(month=range_start.month - 1)
-
-        _month_start, month_end = self._month_range(now_dt)
-        range_end = month_end
-        _range_days = max(1, int((range_end - range_start).days))
+        range_start = add_months(month_start, -max(months - 1, 0))
 
         date_start = start_dt if start_dt is not None else range_start
         date_end = end_dt if end_dt is not None else range_end
 
-        purchases_by: dict[str, float] = {}
-        sales_by: dict[str, float] = {}
-        cogs_by: dict[str, float] = {}
-
-        purchase_rows = self._db.execute(
-            select(
-                InventoryMovement.movement_date,
-                InventoryMovement.quantity,
-                InventoryMovement.unit_cost,
-            ).where(
-                and_(
-                    InventoryMovement.type == "purchase",
-                    InventoryMovement.movement_date >= date_start,
-                    InventoryMovement.movement_date < date_end,
-                    True if self._business_id is None else (InventoryMovement.business_id == self._business_id),
-                    True if location_id is None else (InventoryMovement.location_id == location_id),
-                )
-            )
-        ).all()
-        for movement_date, qty, unit_cost in purchase_rows:
-            dt = movement_date
-            if dt is None:
-                continue
-            if dt.tzinfo is None:
-                dt = dt.replace(tzinfo=timezone.utc)
-            key = dt.astimezone(timezone.utc).strftime("%Y-%m")
-            purchases_by[key] = purchases_by.get(key, 0.0) + float(qty or 0) * float(unit_cost or 0)
-
-        sale_rows = self._db.execute(
-            select(
-                InventoryMovement.movement_date,
-                InventoryMovement.quantity,
-                InventoryMovement.unit_price,
-            ).where(
-                and_(
-                    InventoryMovement.type == "sale",
-                    InventoryMovement.movement_date >= date_start,
-                    InventoryMovement.movement_date < date_end,
-                    True if self._business_id is None else (InventoryMovement.business_id == self._business_id),
-                    True if location_id is None else (InventoryMovement.location_id == location_id),
-                )
-            )
-        ).all()
-        for movement_date, qty, unit_price in sale_rows:
-            dt = movement_date
-            if dt is None:
-                continue
-            if dt.tzinfo is None:
-                dt = dt.replace(tzinfo=timezone.utc)
-            key = dt.astimezone(timezone.utc).strftime("%Y-%m")
-            sales_by[key] = sales_by.get(key, 0.0) + abs(float(qty or 0)) * float(unit_price or 0)
-
-        cogs_rows = self._db.execute(
-            select(
-                InventoryMovement.movement_date,
-                MovementAllocation.quantity,
-                MovementAllocation.unit_cost,
-            )
-            .select_from(MovementAllocation)
-            .join(InventoryMovement, InventoryMovement.id == MovementAllocation.movement_id)
-            .where(
-                and_(
-                    InventoryMovement.type == "sale",
-                    InventoryMovement.movement_date >= date_start,
-                    InventoryMovement.movement_date < date_end,
-                    True if self._business_id is None else (InventoryMovement.business_id == self._business_id),
-                    True if location_id is None else (InventoryMovement.location_id == location_id),
-                )
-            )
-        ).all()
-        for movement_date, qty, unit_cost in cogs_rows:
-            dt = movement_date
-            if dt is None:
-                continue
-            if dt.tzinfo is None:
-                dt = dt.replace(tzinfo=timezone.utc)
-            key = dt.astimezone(timezone.utc).strftime("%Y-%m")
-            cogs_by[key] = cogs_by.get(key, 0.0) + float(qty or 0) * float(unit_cost or 0)
+        if (
+            _MONTHLY_FINANCIALS_ENABLED
+            and start_dt is None
+            and end_dt is None
+            and self._db.get_bind().dialect.name == "postgresql"
+        ):
+            purchases_by, sales_by, cogs_by = self._monthly_totals_from_view(range_start, range_end, location_id)
+        else:
+            purchases_by, sales_by, cogs_by = self._monthly_totals(date_start, date_end, location_id)
 
         series: list[dict] = []
-        cursor = range_start
-        for _ in range(months):
-            key = cursor.strftime("%Y-%m")
-            sales = float(sales_by.get(key, 0))
-            purchases = float(purchases_by.get(key, 0))
-            cogs = float(cogs_by.get(key, 0))
+        # Months as a running integer (year * 12 + month - 1): no datetime
+        # arithmetic or strftime per step.
+        first_bucket = range_start.year * 12 + range_start.month - 1
+        for bucket in range(first_bucket, first_bucket + months):
+            key = f"{bucket // 12:04d}-{bucket % 12 + 1:02d}"
+            sales = sales_by.get(key, 0.0)
+            purchases = purchases_by.get(key, 0.0)
+            cogs = cogs_by.get(key, 0.0)
             gross = sales - cogs
             series.append(
                 {
@@ -2239,10 +2576,6 @@ class InventoryService:
                     "gross_profit": gross,
                 }
             )
-            if cursor.month == 12:
-                cursor = cursor.replace(year=cursor.year + 1, month=1)
-            else:
-                cursor = cursor.replace(month=cursor.month + 1)
 
         return series
 
@@ -2279,28 +2612,26 @@ class InventoryService:
         if lot_code:
             overrides[mv.id] = lot_code
 
-        affected_ids = {old_product_id, product.id}
+        affected = self._products_by_ids({old_product_id, product.id}, loaded=product)
         try:
-            for pid in affected_ids:
-                prod = self._db.get(Product, pid)
-                if prod is None:
-                    continue
-                self._rebuild_product_fifo(prod, lot_code_overrides=overrides if pid == product.id else None)
+            # Overrides are keyed by movement id, which only the new product has.
+            self._rebuild_products_fifo(affected, lot_code_overrides=overrides)
+            for prod in affected:
                 self._sync_default_purchase_cost_from_history(prod)
+            # Backfill a missing location in the same commit as the rebuild, and
+            # take the read model before the commit expires the movement.
+            loc_id = int(mv.location_id or 0) or self._central_location_id()
+            mv.location_id = loc_id
+            movement_read = _movement_read(mv)
+            stock_after = self._inventory.stock_for_product_id(product.id, location_id=loc_id)
+            warning = self._warning_if_restock_needed(product, stock_after)
             self._db.commit()
         except HTTPException:
             self._db.rollback()
             raise
 
-        self._db.refresh(mv)
-        loc_id = int(getattr(mv, "location_id", None) or 0) or self._central_location_id()
-        if mv.location_id is None:
-            mv.location_id = loc_id
-            self._db.commit()
-        stock_after = self._inventory.stock_for_product_id(product.id, location_id=loc_id)
-        warning = self._warning_if_restock_needed(product, stock_after)
         return MovementResult(
-            movement=MovementRead.model_validate(mv),
+            movement=movement_read,
             stock_after=stock_after,
             warning=warning,
         )
@@ -2333,27 +2664,20 @@ class InventoryService:
 
         self._db.flush()
 
-        affected_ids = {old_product_id, product.id}
         try:
-            for pid in affected_ids:
-                prod = self._db.get(Product, pid)
-                if prod is None:
-                    continue
-                self._rebuild_product_fifo(prod)
+            self._rebuild_products_fifo(self._products_by_ids({old_product_id, product.id}, loaded=product))
+            loc_id = int(mv.location_id or 0) or self._default_pos_location_id()
+            mv.location_id = loc_id
+            movement_read = _movement_read(mv)
+            stock_after = self._inventory.stock_for_product_id(product.id, location_id=loc_id)
+            warning = self._warning_if_restock_needed(product, stock_after)
             self._db.commit()
         except HTTPException:
             self._db.rollback()
             raise
 
-        self._db.refresh(mv)
-        loc_id = int(getattr(mv, "location_id", None) or 0) or self._default_pos_location_id()
-        if mv.location_id is None:
-            mv.location_id = loc_id
-            self._db.commit()
-        stock_after = self._inventory.stock_for_product_id(product.id, location_id=loc_id)
-        warning = self._warning_if_restock_needed(product, stock_after)
         return MovementResult(
-            movement=MovementRead.model_validate(mv),
+            movement=movement_read,
             stock_after=stock_after,
             warning=warning,
         )
@@ -2393,7 +2717,7 @@ class InventoryService:
         if payload.lot_code:
             lot_code = payload.lot_code
         else:
-            base = f"{product.sku}-{movement_dt:%y%m%d%H%M}"
+            base = f"{product.sku}-{_lot_stamp(movement_dt)}"
             lot_code = self._unique_lot_code(base)
         lot = InventoryLot(
             business_id=self._business_id,
@@ -2409,21 +2733,111 @@ class InventoryService:
         self._inventory.add_lot(lot)
 
         self._sync_default_purchase_cost_from_history(product)
+        # Every field of the read model was set here or by the flush (id), so it
+        # is taken before the commit expires the movement: no reload SELECT.
+        movement_read = _movement_read(movement)
         try:
+            # Stock is read inside the write transaction: no new transaction
+            # after the commit, and no other write can slip in between.
+            self._db.flush()
+            stock_after = self._inventory.stock_for_product_id(product.id, location_id=central_loc_id)
+            warning = self._warning_if_restock_needed(product, stock_after)
             self._db.commit()
         except IntegrityError as e:
             self._db.rollback()
             raise HTTPException(status_code=409, detail="Lote ya existe") from e
-        self._db.refresh(movement)
 
-        stock_after = self._inventory.stock_for_product_id(product.id, location_id=central_loc_id)
-        warning = self._warning_if_restock_needed(product, stock_after)
         return MovementResult(
-            movement=MovementRead.model_validate(movement),
+            movement=movement_read,
             stock_after=stock_after,
             warning=warning,
         )
 
+    def purchase_bulk(self, payloads: list[PurchaseCreate]) -> None:
+        """Record many purchases with one flush per table and a single commit.
+
+        Everything is validated before the first write, so one bad line
+        rejects the whole batch.
+        """
+        products = self._products.get_by_skus(p.sku for p in payloads)
+        self._product_cache.update(products)
+        lines: list[tuple[PurchaseCreate, Product, float]] = []
+        for payload in payloads:
+            if payload.quantity <= 0:
+                raise HTTPException(status_code=422, detail="quantity must be > 0")
+            product = products.get(payload.sku.strip())
+            if product is None:
+                raise HTTPException(status_code=404, detail="Product not found")
+            unit_cost = payload.unit_cost
+            if unit_cost is None:
+                unit_cost = product.default_purchase_cost
+            if unit_cost is None:
+                raise HTTPException(status_code=422, detail="unit_cost is required")
+            if unit_cost < 0:
+                raise HTTPException(status_code=422, detail="unit_cost must be >= 0")
+            lines.append((payload, product, unit_cost))
+        if not lines:
+            return
+
+        central_loc_id = self._central_location_id()
+        movements: list[InventoryMovement] = []
+        for payload, product, unit_cost in lines:
+            movements.append(
+                InventoryMovement(
+                    business_id=self._business_id,
+                    product_id=product.id,
+                    location_id=central_loc_id,
+                    type="purchase",
+                    quantity=payload.quantity,
+                    unit_cost=unit_cost,
+                    unit_price=None,
+                    movement_date=self._movement_datetime(payload.movement_date),
+                    note=payload.note,
+                )
+            )
+        # The ORM batches each table's INSERTs (RETURNING the new ids).
+        self._db.add_all(movements)
+        self._db.flush()
+
+        # Generated codes are checked against one scan over every prefix the
+        # batch needs instead of one scan per line.
+        bases = {
+            i: self._compact_lot_code(f"{product.sku}-{_lot_stamp(movement.movement_date)}")
+            for i, ((payload, product, _), movement) in enumerate(zip(lines, movements))
+            if not payload.lot_code
+        }
+        existing_codes = self._existing_lot_codes(sorted({self._lot_code_prefix(b) for b in bases.values()}))
+        batch_codes: set[str] = set()
+        lots: list[InventoryLot] = []
+        for i, ((payload, product, unit_cost), movement) in enumerate(zip(lines, movements)):
+            if payload.lot_code:
+                lot_code = payload.lot_code
+            else:
+                lot_code = self._unique_lot_code(bases[i], reserved=batch_codes, existing=existing_codes)
+            batch_codes.add(lot_code)
+            lots.append(
+                InventoryLot(
+                    business_id=self._business_id,
+                    movement_id=movement.id,
+                    product_id=product.id,
+                    location_id=central_loc_id,
+                    lot_code=lot_code,
+                    received_at=movement.movement_date,
+                    unit_cost=unit_cost,
+                    qty_received=payload.quantity,
+                    qty_remaining=payload.quantity,
+                )
+            )
+        self._db.add_all(lots)
+
+        for product in {p.id: p for _, p, _ in lines}.values():
+            self._sync_default_purchase_cost_from_history(product)
+        try:
+            self._db.commit()
+        except IntegrityError as e:
+            self._db.rollback()
+            raise HTTPException(status_code=409, detail="Lote ya existe") from e
+
     def supplier_return_by_lot(self, payload: SupplierReturnLotCreate) -> MovementResult:
         if payload.quantity <= 0:
             raise HTTPException(status_code=422, detail="quantity must be > 0")
@@ -2473,13 +2887,15 @@ class InventoryService:
         )
         self._inventory.add_allocation(alloc)
 
-        self._db.commit()
-        self._db.refresh(movement)
-
+        movement_read = _movement_read(movement)
+        # Sessions do not autoflush: the lot decrement must reach the stock read.
+        self._db.flush()
         stock_after = self._inventory.stock_for_product_id(product.id, location_id=lot_loc_id)
         warning = self._warning_if_restock_needed(product, stock_after)
+        self._db.commit()
+
         return MovementResult(
-            movement=MovementRead.model_validate(movement),
+            movement=movement_read,
             stock_after=stock_after,
             warning=warning,
         )
@@ -2510,7 +2926,7 @@ class InventoryService:
         from_loc_id = self._location_id_for_code(from_code)
         to_loc_id = self._location_id_for_code(to_code)
 
-        transfer_ref = f"TP-{from_code}-{to_code}-{movement_dt:%y%m%d%H%M%S}"  # stable grouping key
+        transfer_ref = f"TP-{from_code}-{to_code}-{_lot_stamp(movement_dt, seconds=True)}"  # stable grouping key
 
         results: list[TransferLineResult] = []
 
@@ -2563,73 +2979,17 @@ class InventoryService:
                 self._consume_fifo(product.id, from_loc_id, mv_out.id, qty)
                 self._db.flush()
 
-                alloc_rows = list(
-                    self._db.execute(
-                        select(
-                            MovementAllocation.quantity,
-                            MovementAllocation.unit_cost,
-                            InventoryLot.lot_code,
-                            InventoryLot.received_at,
-                        )
-                        .select_from(MovementAllocation)
-                        .join(InventoryLot, InventoryLot.id == MovementAllocation.lot_id)
-                        .where(MovementAllocation.movement_id == mv_out.id)
-                        .order_by(InventoryLot.received_at, InventoryLot.id)
-                    ).all()
+                in_ids = self._transfer_in_from_allocations(
+                    product,
+                    mv_out,
+                    from_code=from_code,
+                    to_code=to_code,
+                    to_loc_id=to_loc_id,
+                    ref=transfer_ref,
+                    note=payload.note,
+                    movement_dt=movement_dt,
                 )
 
-                in_ids: list[int] = []
-                for a_qty, a_unit_cost, src_lot_code, src_received_at in alloc_rows:
-                    if float(a_qty or 0) <= 1e-9:
-                        continue
-                    src_recv_dt = src_received_at
-                    if src_recv_dt is None:
-                        src_recv_dt = movement_dt
-
-                    recv_iso = None
-                    try:
-                        recv_iso = src_recv_dt.isoformat()
-                    except Exception:
-                        recv_iso = None
-
-                    mv_in_note = f"Transfer in from {from_code} out_id={mv_out.id} ref={transfer_ref}"
-                    if src_lot_code:
-                        mv_in_note = mv_in_note + f" lot={src_lot_code}"
-                    if recv_iso:
-                        mv_in_note = mv_in_note + f" received_at={recv_iso}"
-                    if payload.note:
-                        mv_in_note = mv_in_note + f"; {payload.note}"
-
-                    mv_in = InventoryMovement(
-                        business_id=self._business_id,
-                        product_id=product.id,
-                        location_id=to_loc_id,
-                        type="transfer_in",
-                        quantity=float(a_qty or 0),
-                        unit_cost=float(a_unit_cost or 0),
-                        unit_price=None,
-                        movement_date=movement_dt,
-                        note=mv_in_note,
-                    )
-                    self._inventory.add_movement(mv_in)
-                    self._db.flush()
-
-                    base_code = f"TR-{src_lot_code or product.sku}-{to_code}-{movement_dt:%y%m%d%H%M%S}-{mv_in.id}"
-                    lot_code = self._unique_lot_code(self._compact_lot_code(base_code))
-                    lot = InventoryLot(
-                        business_id=self._business_id,
-                        movement_id=mv_in.id,
-                        product_id=product.id,
-                        location_id=to_loc_id,
-                        lot_code=lot_code,
-                        received_at=src_recv_dt,
-                        unit_cost=float(a_unit_cost or 0),
-                        qty_received=float(a_qty or 0),
-                        qty_remaining=float(a_qty or 0),
-                    )
-                    self._inventory.add_lot(lot)
-                    in_ids.append(int(mv_in.id))
-
                 results.append(
                     TransferLineResult(
                         sku=product.sku,
@@ -2653,7 +3013,13 @@ class InventoryService:
         if payload.quantity <= 0:
             raise HTTPException(status_code=422, detail="quantity must be > 0")
 
-        product = self._get_product(payload.sku)
+        cfg = self._config()
+        selected_code = str(payload.location_code or "").strip() or str(cfg.locations.default_pos)
+        loc_id = self._location_id_for_code(selected_code)
+
+        # Sales of the same product queue on its row, so each one checks and
+        # consumes the stock the previous one left.
+        product, stock_before = self._get_product_with_stock(payload.sku, loc_id, lock=True)
         unit_price = payload.unit_price
         if unit_price is None:
             unit_price = product.default_sale_price
@@ -2664,11 +3030,6 @@ class InventoryService:
 
         movement_dt = self._movement_datetime(payload.movement_date)
 
-        cfg = self._config()
-        selected_code = str(payload.location_code or "").strip() or str(cfg.locations.default_pos)
-        loc_id = self._location_id_for_code(selected_code)
-
-        stock_before = self._inventory.stock_for_product_id(product.id, location_id=loc_id)
         if stock_before < payload.quantity:
             if float(stock_before or 0) <= 0:
                 raise HTTPException(
@@ -2698,13 +3059,14 @@ class InventoryService:
 
         self._db.flush()
         self._consume_fifo(product.id, loc_id, movement.id, payload.quantity)
+        movement_read = _movement_read(movement)
+        # FIFO consumed exactly the sold quantity from this location.
+        stock_after = float(stock_before) - float(payload.quantity)
+        warning = self._warning_if_restock_needed(product, stock_after)
         self._db.commit()
-        self._db.refresh(movement)
 
-        stock_after = self._inventory.stock_for_product_id(product.id, location_id=loc_id)
-        warning = self._warning_if_restock_needed(product, stock_after)
         return MovementResult(
-            movement=MovementRead.model_validate(movement),
+            movement=movement_read,
             stock_after=stock_after,
             warning=warning,
         )
@@ -2713,16 +3075,18 @@ class InventoryService:
         if payload.quantity_delta == 0:
             raise HTTPException(status_code=422, detail="quantity_delta must be != 0")
 
-        product = self._get_product(payload.sku)
+        loc_id = self._central_location_id()
+        if payload.location_code:
+            loc_id = self._location_id_for_code(payload.location_code)
+
+        product, stock_before = self._get_product_with_stock(
+            payload.sku, loc_id, lock=payload.quantity_delta < 0
+        )
         movement_dt = self._movement_datetime(payload.movement_date)
         is_initial_inventory = bool(
             payload.note and str(payload.note).startswith("Inventario inicial")
         )
 
-        loc_id = self._central_location_id()
-        if payload.location_code:
-            loc_id = self._location_id_for_code(payload.location_code)
-
         if payload.quantity_delta > 0:
             if payload.unit_cost is None:
                 raise HTTPException(
@@ -2746,7 +3110,7 @@ class InventoryService:
 
             self._db.flush()
 
-            lot_code = f"ADJ-{product.sku}-{movement_dt:%y%m%d%H%M%S}-{movement.id}"
+            lot_code = f"ADJ-{product.sku}-{_lot_stamp(movement_dt, seconds=True)}-{movement.id}"
             received_at_dt = movement_dt
             if is_initial_inventory:
                 received_at_dt = datetime(1970, 1, 1, tzinfo=timezone.utc)
@@ -2762,15 +3126,18 @@ class InventoryService:
                 qty_remaining=payload.quantity_delta,
             )
             self._inventory.add_lot(lot)
+            movement_read = _movement_read(movement)
+            # The lot INSERT goes out with the commit's flush; stock_after
+            # follows from the stock read with the product.
+            stock_after = float(stock_before) + float(payload.quantity_delta)
+            warning = self._warning_if_restock_needed(product, stock_after)
             try:
                 self._db.commit()
             except IntegrityError as e:
                 self._db.rollback()
                 raise HTTPException(status_code=409, detail="Lote ya existe") from e
-            self._db.refresh(movement)
         else:
             qty_to_remove = -payload.quantity_delta
-            stock_before = self._inventory.stock_for_product_id(product.id, location_id=loc_id)
             if stock_before < qty_to_remove:
                 raise HTTPException(status_code=409, detail="Insufficient stock")
 
@@ -2788,23 +3155,22 @@ class InventoryService:
             self._inventory.add_movement(movement)
             self._db.flush()
             self._consume_fifo(product.id, loc_id, movement.id, qty_to_remove)
+            movement_read = _movement_read(movement)
+            stock_after = float(stock_before) - float(qty_to_remove)
+            warning = self._warning_if_restock_needed(product, stock_after)
             self._db.commit()
-            self._db.refresh(movement)
 
-        stock_after = self._inventory.stock_for_product_id(product.id, location_id=loc_id)
-        warning = self._warning_if_restock_needed(product, stock_after)
         return MovementResult(
-            movement=MovementRead.model_validate(movement),
+            movement=movement_read,
             stock_after=stock_after,
             warning=warning,
         )
 
     def stock(self, sku: str, location_code: Optional[str] = None) -> StockRead:
-        product = self._get_product(sku)
         loc_id = self._central_location_id() if not location_code else self._location_id_for_code(location_code)
-        qty = self._inventory.stock_for_product_id(product.id, location_id=loc_id)
+        product, qty = self._get_product_with_stock(sku, loc_id)
         min_stock = float(product.min_stock or 0)
-        return StockRead(
+        return StockRead.model_construct(
             sku=product.sku,
             name=product.name,
             unit_of_measure=product.unit_of_measure,
@@ -2815,15 +3181,18 @@ class InventoryService:
         )
 
     def stock_for_location(self, sku: str, location_code: str) -> float:
-        product = self._get_product(sku)
         loc_id = self._location_id_for_code(location_code)
-        return self._inventory.stock_for_product_id(product.id, location_id=loc_id)
+        return self._get_product_with_stock(sku, loc_id)[1]
 
     def stock_list(self, query: str = "", location_code: Optional[str] = None) -> list[StockRead]:
         loc_id = None
         if location_code:
             loc_id = self._location_id_for_code(location_code)
-        base_rows = list(self._inventory.stock_list(query=query, location_id=loc_id))
+        now_dt = datetime.now(timezone.utc)
+        # The 30-day average daily sales ride along in the stock query.
+        base_rows = list(
+            self._inventory.stock_list(query=query, location_id=loc_id, sales_since=now_dt - timedelta(days=30))
+        )
         skus = [sku for sku, *_ in base_rows if sku]
 
         # Safety stock / reorder point configuration.
@@ -2832,11 +3201,8 @@ class InventoryService:
         lead_time_days_cfg = float(getattr(getattr(cfg, "inventory", None), "replenishment_lead_time_days", 25.0) or 25.0)
         lead_time_weeks = float(lead_time_days_cfg) / 7.0
 
-        avg_daily_by_sku: dict[str, float] = {}
         weekly_stats_by_sku: dict[str, tuple[float, float, int]] = {}
         if skus:
-            now_dt = datetime.now(timezone.utc)
-
             # Rolling window: use all sales history until it reaches 1 year; after that, last 12 months.
             one_year_ago = now_dt - timedelta(days=365)
             earliest_sale_filters = [
@@ -2863,7 +3229,7 @@ class InventoryService:
             daily_rows = self._db.execute(
                 select(
                     Product.sku,
-                    func.date(InventoryMovement.movement_date).label("day"),
+                    utc_day(InventoryMovement.movement_date).label("day"),
                     func.coalesce(func.sum(func.abs(InventoryMovement.quantity)), 0).label("qty"),
                 )
                 .select_from(InventoryMovement)
@@ -2878,10 +3244,10 @@ class InventoryService:
                         True if loc_id is None else (InventoryMovement.location_id == loc_id),
                     )
                 )
-                .group_by(Product.sku, func.date(InventoryMovement.movement_date))
+                .group_by(Product.sku, utc_day(InventoryMovement.movement_date))
             ).all()
 
-            weekly_by_sku: dict[str, dict[datetime, float]] = {}
+            weekly_by_sku: defaultdict[str, defaultdict[date, float]] = defaultdict(lambda: defaultdict(float))
             for sku, day_raw, qty in daily_rows:
                 sku_s = str(sku)
                 try:
@@ -2892,15 +3258,8 @@ class InventoryService:
                         day_d = datetime.fromisoformat(str(day_raw)).date()
                 except Exception:
                     continue
-                week_start_date = day_d - timedelta(days=int(day_d.weekday()))
-                week_start_dt = datetime(
-                    week_start_date.year,
-                    week_start_date.month,
-                    week_start_date.day,
-                    tzinfo=timezone.utc,
-                )
-                m = weekly_by_sku.setdefault(sku_s, {})
-                m[week_start_dt] = float(m.get(week_start_dt, 0.0)) + float(qty or 0)
+                # Days are already UTC calendar days: key weeks by plain date.
+                weekly_by_sku[sku_s][day_d - timedelta(days=day_d.weekday())] += float(qty or 0)
 
             # Build weekly series (including zero weeks) and compute mean/std per SKU.
             try:
@@ -2911,80 +3270,48 @@ class InventoryService:
             end_date = (now_dt - timedelta(days=1)).date() if now_dt else start_date
             end_week_date = end_date - timedelta(days=int(end_date.weekday()))
 
-            week_starts: list[datetime] = []
-            cur = datetime(start_week_date.year, start_week_date.month, start_week_date.day, tzinfo=timezone.utc)
-            end_dt_week = datetime(end_week_date.year, end_week_date.month, end_week_date.day, tzinfo=timezone.utc)
-            while cur <= end_dt_week:
+            week_starts: list[date] = []
+            cur = start_week_date
+            while cur <= end_week_date:
                 week_starts.append(cur)
                 cur = cur + timedelta(days=7)
 
             for sku_s in skus:
                 wmap = weekly_by_sku.get(str(sku_s), {})
-                series = [float(wmap.get(ws, 0.0)) for ws in week_starts]
+                series = [wmap.get(ws, 0.0) for ws in week_starts]
                 n_weeks = len(series)
                 if n_weeks <= 0:
                     weekly_stats_by_sku[str(sku_s)] = (0.0, 0.0, 0)
                     continue
-                mean_w = float(sum(series)) / float(n_weeks)
+                mean_w = sum(series) / n_weeks
                 if n_weeks <= 1:
                     std_w = 0.0
                 else:
-                    var = float(sum((x - mean_w) ** 2 for x in series)) / float(n_weeks)
-                    std_w = float(math.sqrt(var))
-                weekly_stats_by_sku[str(sku_s)] = (mean_w, std_w, int(n_weeks))
-
-            start = now_dt - timedelta(days=30)
-            where_parts = [
-                InventoryMovement.type == "sale",
-                InventoryMovement.movement_date >= start,
-                Product.sku.in_(skus),
-            ]
-            if self._business_id is not None:
-                where_parts.append(InventoryMovement.business_id == self._business_id)
-            if loc_id is not None:
-                where_parts.append(InventoryMovement.location_id == loc_id)
-
-            rows = self._db.execute(
-                select(
-                    Product.sku,
-                    func.coalesce(func.sum(func.abs(InventoryMovement.quantity)), 0).label("qty"),
-                )
-                .select_from(InventoryMovement)
-                .join(Product, Product.id == InventoryMovement.product_id)
-                .where(
-                    and_(*where_parts)
-                )
-                .group_by(Product.sku)
-            ).all()
-            for sku, qty_sold in rows:
-                avg_daily_by_sku[str(sku)] = float(qty_sold or 0) / 30.0
+                    std_w = math.sqrt(sum((x - mean_w) ** 2 for x in series) / n_weeks)
+                weekly_stats_by_sku[str(sku_s)] = (mean_w, std_w, n_weeks)
 
+        sqrt_lead_time_weeks = math.sqrt(lead_time_weeks)
         out: list[StockRead] = []
-        for sku, name, category, uom, qty, min_stock, lead_time_days, min_purchase_cost, default_purchase_cost, default_sale_price in base_rows:
-            avg_daily = float(avg_daily_by_sku.get(str(sku), 0.0))
+        # The repository already returns floats/ints with NULLs defaulted, so
+        # rows are built without a second conversion or validation pass.
+        for sku, name, category, uom, qty, min_stock, lead_time_days, min_purchase_cost, default_purchase_cost, default_sale_price, avg_daily in base_rows:
             reorder_in_days: Optional[int] = None
             if avg_daily > 0:
-                days_cover = float(qty or 0) / avg_daily
-                reorder_in_days = max(0, int(days_cover - float(lead_time_days or 0)))
+                reorder_in_days = max(0, int(qty / avg_daily - lead_time_days))
 
-            mean_w, std_w, n_weeks = weekly_stats_by_sku.get(str(sku), (0.0, 0.0, 0))
+            mean_w, std_w, n_weeks = weekly_stats_by_sku.get(sku, (0.0, 0.0, 0))
             safety_stock = 0.0
             reorder_point = 0.0
-            reorder_shortage = 0.0
             if mean_w > 0:
-                std_eff = float(std_w)
-                if int(n_weeks) < 4:
-                    std_eff = float(max(std_eff, float(mean_w)))
-                safety_stock_calc = float(service_z) * float(math.sqrt(lead_time_weeks)) * float(std_eff)
-                safety_stock = float(max(1.0, float(math.ceil(safety_stock_calc))))
-                reorder_point = float((float(mean_w) * float(lead_time_weeks)) + float(safety_stock))
+                std_eff = max(std_w, mean_w) if n_weeks < 4 else std_w
+                safety_stock = max(1.0, float(math.ceil(service_z * sqrt_lead_time_weeks * std_eff)))
+                reorder_point = mean_w * lead_time_weeks + safety_stock
 
-            min_stock_f = float(min_stock or 0)
-            reorder_point = float(max(float(reorder_point or 0.0), float(min_stock_f or 0.0)))
-            reorder_shortage = float(max(0.0, float(reorder_point) - float(qty or 0)))
+            reorder_point = max(reorder_point, min_stock)
+            reorder_shortage = max(0.0, reorder_point - qty)
 
             out.append(
-                StockRead(
+                StockRead.model_construct(
                     sku=sku,
                     name=name,
                     category=category,
@@ -2992,14 +3319,14 @@ class InventoryService:
                     quantity=qty,
                     min_stock=min_stock,
                     needs_restock=reorder_shortage > 0,
-                    lead_time_days=int(lead_time_days or 0),
+                    lead_time_days=lead_time_days,
                     avg_daily_sales=avg_daily,
                     reorder_in_days=reorder_in_days,
-                    avg_weekly_sales=float(mean_w),
-                    std_weekly_sales=float(std_w),
-                    safety_stock=float(safety_stock),
-                    reorder_point=float(reorder_point),
-                    reorder_shortage=float(reorder_shortage),
+                    avg_weekly_sales=mean_w,
+                    std_weekly_sales=std_w,
+                    safety_stock=safety_stock,
+                    reorder_point=reorder_point,
+                    reorder_shortage=reorder_shortage,
                     min_purchase_cost=min_purchase_cost,
                     default_purchase_cost=default_purchase_cost,
                     default_sale_price=default_sale_price,
@@ -3057,6 +3384,7 @@ class InventoryService:
         start_date: Optional[datetime] = None,
         end_date: Optional[datetime] = None,
         limit: Optional[int] = 100,
+        before: Optional[tuple[datetime, int]] = None,
     ) -> list[tuple]:
         return self._inventory.movement_history(
             sku=sku,
@@ -3066,4 +3394,5 @@ class InventoryService:
             start_date=start_date,
             end_date=end_date,
             limit=limit,
+            before=before,
         )
@@ -4,6 +4,7 @@ import os
 import secrets
 import unicodedata
 from datetime import datetime, timezone
+from functools import lru_cache
 from typing import Tuple
 
 
@@ -15,17 +16,30 @@ def get_session_secret() -> str:
     return secret
 
 
+@lru_cache(maxsize=64)
+def _utc_month_bounds(year: int, month: int) -> Tuple[datetime, datetime]:
+    start = datetime(year, month, 1, tzinfo=timezone.utc)
+    if month == 12:
+        end = start.replace(year=year + 1, month=1)
+    else:
+        end = start.replace(month=month + 1)
+    return start, end
+
+
 def month_range(now: datetime) -> Tuple[datetime, datetime]:
     """Calcula el rango del mes actual (inicio y fin)."""
     if now.tzinfo is None:
         now = now.replace(tzinfo=timezone.utc)
     now = now.astimezone(timezone.utc)
-    start = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-    if start.month == 12:
-        end = start.replace(year=start.year + 1, month=1)
-    else:
-        end = start.replace(month=start.month + 1)
-    return start, end
+    # Los límites solo dependen del año y mes en UTC; datetime es inmutable,
+    # así que el resultado se puede reutilizar entre llamadas.
+    return _utc_month_bounds(now.year, now.month)
+
+
+def add_months(month_start: datetime, months: int) -> datetime:
+    """Desplaza un inicio de mes `months` meses (negativo hacia atrás), sin bucles."""
+    bucket = month_start.year * 12 + month_start.month - 1 + months
+    return month_start.replace(year=bucket // 12, month=bucket % 12 + 1)
 
 
 def normalize_text(value: str) -> str:
@@ -6,7 +6,15 @@ import pytest
 from fastapi import HTTPException
 from sqlalchemy.orm import Session
 
-from app.auth import authenticate, get_user_by_username, hash_password
+from app.auth import (
+    AuthUser,
+    authenticate,
+    get_admin_user_by_username,
+    get_user_auth,
+    get_user_by_username,
+    hash_password,
+    invalidate_user,
+)
 from app.models import Business, User
 from app.security import (
     can_access_full_dashboard,
@@ -19,6 +27,7 @@ from app.security import (
     is_admin,
     is_operator,
     is_owner,
+    remember_session_user,
     require_active_business_id,
     require_admin_api,
     require_user_api,
@@ -41,7 +50,8 @@ def _mk_user(db: Session, *, username: str, role: str, business_id: int | None,
 
 
 def _req(session: dict | None = None):
-    return SimpleNamespace(session=session if session is not None else {})
+    data = session if session is not None else {}
+    return SimpleNamespace(scope={"session": data}, session=data)
 
 
 def test_get_user_by_username_and_authenticate(db_session: Session, business_id: int) -> None:
@@ -136,3 +146,110 @@ def test_require_active_business_id_and_code(db_session: Session, business_id: i
 
     with pytest.raises(HTTPException):
         require_active_business_id(db_session, _req({}))
+
+
+def test_get_user_auth_returns_lightweight_row(db_session: Session, business_id: int) -> None:
+    user = _mk_user(db_session, username="light", role="owner", business_id=business_id)
+
+    row = get_user_auth(db_session, "light")
+
+    assert isinstance(row, AuthUser)
+    assert row.id == user.id
+    assert row.role == "owner"
+    assert row.business_id == business_id
+    assert row.is_active is True
+    assert not hasattr(row, "password_hash")
+    assert get_user_auth(db_session, "missing") is None
+
+
+def test_get_admin_user_by_username_filters_role_and_active(db_session: Session, business_id: int) -> None:
+    _mk_user(db_session, username="boss", role="Admin", business_id=business_id)
+    _mk_user(db_session, username="owner9", role="owner", business_id=business_id)
+    _mk_user(db_session, username="oldadmin", role="admin", business_id=business_id, active=False)
+
+    assert get_admin_user_by_username(db_session, "boss") is not None
+    assert get_admin_user_by_username(db_session, "owner9") is None
+    assert get_admin_user_by_username(db_session, "oldadmin") is None
+
+    with pytest.raises(HTTPException) as exc:
+        require_admin_api(_req({"username": "oldadmin"}), db_session)
+    assert exc.value.status_code == 401
+
+
+def test_role_helpers_accept_auth_rows(db_session: Session, business_id: int) -> None:
+    _mk_user(db_session, username="OwnerMixed", role="OWNER", business_id=business_id)
+
+    row = get_user_auth(db_session, "OwnerMixed")
+
+    assert is_owner(row) and not is_admin(row) and not is_operator(row)
+    assert can_access_full_dashboard(row)
+    assert not can_manage_users(row)
+    assert not is_admin(None)
+
+
+def test_user_role_flag_follows_role_changes(db_session: Session, business_id: int) -> None:
+    user = _mk_user(db_session, username="RoleSwap", role="owner", business_id=business_id)
+    assert is_owner(user)
+
+    user.role = "operator"
+
+    assert is_operator(user) and not is_owner(user)
+
+
+def test_require_active_business_id_uses_session_for_pinned_roles(db_session: Session, business_id: int) -> None:
+    user = _mk_user(db_session, username="pinned", role="operator", business_id=business_id)
+    session: dict = {}
+    remember_session_user(session, user)
+
+    assert require_active_business_id(db_session, _req(session)) == business_id
+
+    # The session alone is not enough: a user that is not in this database
+    # gets no business.
+    session["username"] = "ghost"
+    with pytest.raises(HTTPException):
+        require_active_business_id(db_session, _req(session))
+
+    # Sessions from an older schema fall back to the user lookup.
+    session["username"] = "pinned"
+    session["schema_version"] = 0
+    assert require_active_business_id(db_session, _req(session)) == business_id
+
+
+def test_require_active_business_id_follows_reassigned_user(db_session: Session, business_id: int) -> None:
+    other = Business(code="b-moved", name="Moved")
+    db_session.add(other)
+    db_session.commit()
+    user = _mk_user(db_session, username="moved", role="owner", business_id=business_id)
+    session: dict = {}
+    remember_session_user(session, user)
+
+    user.business_id = other.id
+    db_session.commit()
+    invalidate_user("moved")
+
+    assert require_active_business_id(db_session, _req(session)) == other.id
+
+
+def test_require_active_business_id_rejects_deactivated_user(db_session: Session, business_id: int) -> None:
+    user = _mk_user(db_session, username="gone", role="operator", business_id=business_id)
+    session: dict = {}
+    remember_session_user(session, user)
+
+    user.is_active = False
+    db_session.commit()
+    invalidate_user("gone")
+
+    with pytest.raises(HTTPException):
+        require_active_business_id(db_session, _req(session))
+
+
+def test_get_user_auth_caches_until_invalidated(db_session: Session, business_id: int) -> None:
+    user = _mk_user(db_session, username="cached", role="operator", business_id=business_id)
+    assert get_user_auth(db_session, "cached").is_active is True
+
+    user.is_active = False
+    db_session.commit()
+    assert get_user_auth(db_session, "cached").is_active is True
+
+    invalidate_user("cached")
+    assert get_user_auth(db_session, "cached").is_active is False
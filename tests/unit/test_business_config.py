@@ -159,3 +159,15 @@ enabled_types = X
     assert cfg.sales_documents.enabled_types == ["F", "P"]
 
 
+def test_cached_config_skips_filesystem_until_recheck(monkeypatch, tmp_path) -> None:
+    cfg_file = tmp_path / "business_config.conf"
+    _write(cfg_file, "[currency]\ncode = USD\n")
+    monkeypatch.setenv("BUSINESS_CONFIG_PATH", str(cfg_file))
+    business_config._cached_configs.clear()
+
+    assert load_business_config().currency.code == "USD"
+    cfg_file.unlink()
+    assert load_business_config().currency.code == "USD"
+
+    monkeypatch.setattr(business_config, "_CONFIG_RECHECK_SECONDS", 0.0)
+    assert load_business_config().currency.code == "EUR"
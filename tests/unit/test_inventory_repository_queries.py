@@ -2,6 +2,8 @@ from __future__ import annotations
 
 from datetime import datetime, timedelta, timezone
 
+import pytest
+from sqlalchemy import func, select
 from sqlalchemy.orm import Session
 
 from app.models import AuditLog, InventoryLot, InventoryMovement, Location, MovementAllocation, Product
@@ -89,6 +91,12 @@ def test_stock_list_recent_and_history(db_session: Session, business_id: int) ->
 
     assert len(stock_rows) == 1
     assert stock_rows[0][0] == "SKU-H1"
+    assert stock_rows[0][4] == 3.0
+    assert stock_rows[0][7] == 2.5
+    assert repo.stock_list(query="zapato") == []
+    assert stock_rows[0][-1] == 0.0
+    (with_sales,) = repo.stock_list(query="camiseta", sales_since=t0)
+    assert with_sales[-1] == pytest.approx(1 / 30.0)
     assert len(purchase_rows) == 1
     assert len(sales_rows) == 1
     assert len(history_rows) >= 2
@@ -136,6 +144,26 @@ def test_recent_filters_by_date(db_session: Session, business_id: int) -> None:
     assert len(feb) == 1
 
 
+def test_movement_history_keyset_pages(db_session: Session, business_id: int) -> None:
+    repo = InventoryRepository(db_session, business_id=business_id)
+    p = _create_product(db_session, business_id, "SKU-PAGE", "Paginas")
+    same_dt = datetime(2026, 3, 1, tzinfo=timezone.utc)
+    db_session.add_all(
+        [
+            InventoryMovement(business_id=business_id, product_id=p.id, type="purchase", quantity=1, unit_cost=1, movement_date=dt)
+            for dt in (same_dt, same_dt, same_dt - timedelta(days=1))
+        ]
+    )
+    db_session.commit()
+
+    first = repo.movement_history(sku="SKU-PAGE", limit=2)
+    rest = repo.movement_history(sku="SKU-PAGE", limit=2, before=(first[-1][1], first[-1][0]))
+    everything = repo.movement_history(sku="SKU-PAGE", limit=None)
+
+    assert [r[0] for r in first + rest] == [r[0] for r in everything]
+    assert len(rest) == 1
+
+
 def test_recent_sales_filters_by_location_id(db_session: Session, business_id: int) -> None:
     repo = InventoryRepository(db_session, business_id=business_id)
     p = _create_product(db_session, business_id, "SKU-LOC", "Zapato")
@@ -181,3 +209,122 @@ def test_recent_sales_filters_by_location_id(db_session: Session, business_id: i
     assert central_sales[0][8] == "Almacen central"
     assert pos_sales[0][8] == "Punto 1"
 
+
+def test_fifo_lots_up_to_stops_at_covering_lot(db_session: Session, business_id: int) -> None:
+    repo = InventoryRepository(db_session, business_id=business_id)
+    p = _create_product(db_session, business_id, "SKU-F1", "Lotes")
+    base = datetime(2026, 1, 1, tzinfo=timezone.utc)
+    for i, qty in enumerate((2, 3, 4)):
+        mv = InventoryMovement(business_id=business_id, product_id=p.id, type="purchase", quantity=qty, unit_cost=1.0)
+        db_session.add(mv)
+        db_session.flush()
+        db_session.add(
+            InventoryLot(
+                business_id=business_id,
+                movement_id=mv.id,
+                product_id=p.id,
+                lot_code=f"F{i}",
+                received_at=base + timedelta(days=i),
+                unit_cost=1.0,
+                qty_received=qty,
+                qty_remaining=qty,
+            )
+        )
+    db_session.commit()
+
+    assert [lot.lot_code for lot in repo.fifo_lots_for_product_id(p.id)] == ["F0", "F1", "F2"]
+    assert [lot.lot_code for lot in repo.fifo_lots_for_product_id(p.id, up_to=2)] == ["F0"]
+    assert [lot.lot_code for lot in repo.fifo_lots_for_product_id(p.id, up_to=4)] == ["F0", "F1"]
+
+
+def test_add_lots_returns_ids_in_row_order(db_session: Session, business_id: int) -> None:
+    repo = InventoryRepository(db_session, business_id=business_id)
+    p = _create_product(db_session, business_id, "SKU-B1", "Bulk")
+    mv = InventoryMovement(business_id=business_id, product_id=p.id, type="purchase", quantity=5, unit_cost=1.0)
+    db_session.add(mv)
+    db_session.flush()
+    base = datetime(2026, 1, 1, tzinfo=timezone.utc)
+    rows = [
+        {
+            "business_id": business_id,
+            "movement_id": mv.id,
+            "product_id": p.id,
+            "location_id": None,
+            "lot_code": code,
+            "received_at": base,
+            "unit_cost": 1.0,
+            "qty_received": 5,
+            "qty_remaining": 5,
+        }
+        for code in ("B2", "B1")
+    ]
+
+    ids = repo.add_lots(rows)
+
+    assert [db_session.get(InventoryLot, lot_id).lot_code for lot_id in ids] == ["B2", "B1"]
+    assert repo.add_lots([]) == []
+
+
+def test_product_with_stock_reads_product_and_live_lots(db_session: Session, business_id: int) -> None:
+    repo = InventoryRepository(db_session, business_id=business_id)
+    p = _create_product(db_session, business_id, "SKU-PS", "Con stock")
+    mv = InventoryMovement(business_id=business_id, product_id=p.id, type="purchase", quantity=5, unit_cost=1.0)
+    db_session.add(mv)
+    db_session.flush()
+    base = datetime(2026, 1, 1, tzinfo=timezone.utc)
+    repo.add_lots(
+        [
+            {
+                "business_id": business_id,
+                "movement_id": mv.id,
+                "product_id": p.id,
+                "location_id": None,
+                "lot_code": code,
+                "received_at": base,
+                "unit_cost": 1.0,
+                "qty_received": 5,
+                "qty_remaining": remaining,
+            }
+            for code, remaining in (("PS1", 0), ("PS2", 3))
+        ]
+    )
+
+    product, stock = repo.product_with_stock(" SKU-PS ")
+
+    assert product.id == p.id
+    assert stock == 3.0
+    assert repo.product_with_stock("SKU-NONE") is None
+
+
+def test_allocate_fifo_takes_lots_in_order_and_reports_shortage(db_session: Session, business_id: int) -> None:
+    repo = InventoryRepository(db_session, business_id=business_id)
+    p = _create_product(db_session, business_id, "SKU-A1", "Asignar")
+    base = datetime(2026, 1, 1, tzinfo=timezone.utc)
+    for i, (qty, cost) in enumerate(((2, 1.0), (3, 2.0))):
+        mv = InventoryMovement(business_id=business_id, product_id=p.id, type="purchase", quantity=qty, unit_cost=cost)
+        db_session.add(mv)
+        db_session.flush()
+        db_session.add(
+            InventoryLot(
+                business_id=business_id,
+                movement_id=mv.id,
+                product_id=p.id,
+                lot_code=f"A{i}",
+                received_at=base + timedelta(days=i),
+                unit_cost=cost,
+                qty_received=qty,
+                qty_remaining=qty,
+            )
+        )
+    sale = InventoryMovement(business_id=business_id, product_id=p.id, type="sale", quantity=-9)
+    db_session.add(sale)
+    db_session.commit()
+
+    assert repo.allocate_fifo(p.id, None, sale.id, 3) == 3
+    assert repo.allocate_fifo(p.id, None, sale.id, 6) == 2
+
+    allocs = db_session.execute(
+        select(MovementAllocation.quantity, MovementAllocation.unit_cost).order_by(MovementAllocation.id)
+    ).all()
+    assert [tuple(a) for a in allocs] == [(2, 1.0), (1, 2.0), (2, 2.0)]
+    assert db_session.scalar(select(func.sum(InventoryLot.qty_remaining))) == 0
@@ -1,12 +1,29 @@
 from __future__ import annotations
 
+from datetime import datetime, timedelta, timezone
+
 import pytest
 from fastapi import HTTPException
+from sqlalchemy import event, select, text, update
 from sqlalchemy.orm import Session
 
-from app.models import Location, Product
-from app.schemas import PurchaseCreate, SaleCreate, TransferCreate, TransferLineCreate
-from app.services.inventory_service import InventoryService
+from app.models import (
+    InventoryLot,
+    InventoryMovement,
+    Location,
+    MoneyExtraction,
+    MovementAllocation,
+    OperatingExpense,
+    Product,
+)
+from app.schemas import MovementRead, PurchaseCreate, SaleCreate, SupplierReturnLotCreate, TransferCreate, TransferLineCreate
+from app.services.inventory_service import (
+    _FINANCIALS_DIRTY,
+    InventoryService,
+    _lot_stamp,
+    _movement_read,
+    _track_financials_execute,
+)
 
 
 def _create_product(db: Session, business_id: int) -> Product:
@@ -78,6 +95,26 @@ def test_warning_if_restock_needed(db_session: Session, business_id: int) -> Non
     assert service._warning_if_restock_needed(product, 3) is None
 
 
+def test_get_product_is_cached_per_service(db_session: Session, business_id: int) -> None:
+    service = InventoryService(db_session, business_id=business_id)
+    product = _create_product(db_session, business_id)
+
+    assert service._get_product(" SKU-TST ") is product
+
+    statements: list[str] = []
+
+    def _record(_conn, _cursor, statement, *_args) -> None:
+        statements.append(statement)
+
+    bind = db_session.get_bind()
+    event.listen(bind, "before_cursor_execute", _record)
+    try:
+        assert service._get_product("SKU-TST") is product
+    finally:
+        event.remove(bind, "before_cursor_execute", _record)
+    assert not any(stmt.lstrip().upper().startswith("SELECT") for stmt in statements)
+
+
 def test_location_id_for_existing_code(db_session: Session, business_id: int) -> None:
     service = InventoryService(db_session, business_id=business_id)
     loc = Location(business_id=business_id, code="POS1", name="Punto")
@@ -102,6 +139,18 @@ def test_sale_supports_central_location(db_session: Session, business_id: int) -
     assert result.stock_after == 3
 
 
+def test_supplier_return_reports_stock_after_the_return(db_session: Session, business_id: int) -> None:
+    service = InventoryService(db_session, business_id=business_id)
+    _create_locations(db_session, business_id)
+    _create_product(db_session, business_id)
+    service.purchase(PurchaseCreate(sku="SKU-TST", quantity=5, unit_cost=1.0, lot_code="RET1"))
+    lot_id = db_session.scalar(select(InventoryLot.id).where(InventoryLot.lot_code == "RET1"))
+
+    result = service.supplier_return_by_lot(SupplierReturnLotCreate(lot_id=lot_id, quantity=2))
+
+    assert result.stock_after == 3
+
+
 def test_sale_fails_if_location_has_no_enough_stock_even_with_stock_elsewhere(db_session: Session, business_id: int) -> None:
     service = InventoryService(db_session, business_id=business_id)
     _central, pos1 = _create_locations(db_session, business_id)
@@ -125,3 +174,383 @@ def test_sale_fails_if_location_has_no_enough_stock_even_with_stock_elsewhere(db
     assert service.stock_for_location("SKU-TST", "POS1") == 2
     assert pos1.id > 0
 
+
+def test_delete_sale_rebuilds_fifo_lots_and_allocations(db_session: Session, business_id: int) -> None:
+    service = InventoryService(db_session, business_id=business_id)
+    _create_locations(db_session, business_id)
+    product = _create_product(db_session, business_id)
+
+    service.purchase(PurchaseCreate(sku="SKU-TST", quantity=3, unit_cost=1.0, lot_code="L1"))
+    service.purchase(PurchaseCreate(sku="SKU-TST", quantity=4, unit_cost=2.0, lot_code="L2"))
+    first = service.sale(SaleCreate(sku="SKU-TST", quantity=2, location_code="CENTRAL"))
+    second = service.sale(SaleCreate(sku="SKU-TST", quantity=2, location_code="CENTRAL"))
+
+    service.delete_sale_movement(first.movement.id)
+
+    lots = {
+        lot.lot_code: lot
+        for lot in db_session.scalars(select(InventoryLot).where(InventoryLot.product_id == product.id))
+    }
+    assert set(lots) == {"L1", "L2"}
+    assert lots["L1"].qty_remaining == 1
+    assert lots["L2"].qty_remaining == 4
+    allocs = list(db_session.scalars(select(MovementAllocation)))
+    assert [(a.movement_id, a.lot_id, a.quantity) for a in allocs] == [(second.movement.id, lots["L1"].id, 2)]
+
+
+def test_unique_lot_code_skips_existing_codes(db_session: Session, business_id: int) -> None:
+    service = InventoryService(db_session, business_id=business_id)
+    _create_locations(db_session, business_id)
+    _create_product(db_session, business_id)
+    service.purchase(PurchaseCreate(sku="SKU-TST", quantity=1, unit_cost=1.0, lot_code="LOT_1"))
+    service.purchase(PurchaseCreate(sku="SKU-TST", quantity=1, unit_cost=1.0, lot_code="LOT_1-A"))
+
+    assert service._unique_lot_code("LOT_1") == "LOT_1-B"
+    assert service._unique_lot_code("LOT%1") == "LOT%1"
+
+
+def test_monthly_profit_report_counts_multi_lot_sale_once(
+    db_session: Session, business_id: int, now_utc: datetime
+) -> None:
+    service = InventoryService(db_session, business_id=business_id)
+    _create_locations(db_session, business_id)
+    _create_product(db_session, business_id)
+    service.purchase(PurchaseCreate(sku="SKU-TST", quantity=2, unit_cost=1.0, movement_date=now_utc))
+    service.purchase(PurchaseCreate(sku="SKU-TST", quantity=2, unit_cost=3.0, movement_date=now_utc))
+    service.sale(SaleCreate(sku="SKU-TST", quantity=3, unit_price=5.0, location_code="CENTRAL", movement_date=now_utc))
+
+    summary, items = service.monthly_profit_report(now_utc)
+
+    assert [(i["sku"], i["qty"], i["sales"], i["cogs"]) for i in items] == [("SKU-TST", 3.0, 15.0, 5.0)]
+    assert summary["gross_total"] == 10.0
+    assert service.monthly_profit_by_product(now_utc) == items
+
+
+def test_monthly_profit_report_includes_expenses_without_sales(
+    db_session: Session, business_id: int, now_utc: datetime
+) -> None:
+    service = InventoryService(db_session, business_id=business_id)
+    service.create_expense(4.0, "Alquiler", now_utc)
+
+    summary, items = service.monthly_profit_report(now_utc)
+
+    assert items == []
+    assert summary["expenses_total"] == 4.0
+    assert summary["net_total"] == -4.0
+
+
+def test_monthly_profit_items_report_splits_sale_by_lot(
+    db_session: Session, business_id: int, now_utc: datetime
+) -> None:
+    service = InventoryService(db_session, business_id=business_id)
+    _create_locations(db_session, business_id)
+    _create_product(db_session, business_id)
+    service.purchase(PurchaseCreate(sku="SKU-TST", quantity=1, unit_cost=1.0, lot_code="L1", movement_date=now_utc))
+    service.purchase(PurchaseCreate(sku="SKU-TST", quantity=2, unit_cost=3.0, lot_code="L2", movement_date=now_utc))
+    service.sale(SaleCreate(sku="SKU-TST", quantity=2, unit_price=4.0, location_code="CENTRAL", movement_date=now_utc))
+
+    summary, items = service.monthly_profit_items_report(now_utc)
+
+    assert sorted((i["lot_code"], i["qty"], i["sales"], i["cogs"], i["profit"]) for i in items) == [
+        ("L1", 1.0, 4.0, 1.0, 3.0),
+        ("L2", 1.0, 4.0, 3.0, 1.0),
+    ]
+    assert all(isinstance(i[k], float) for i in items for k in ("qty", "unit_cost", "unit_price", "sales", "cogs"))
+    assert summary["profit_total"] == 4.0
+    assert summary["margin_pct"] == 50.0
+
+
+def test_update_purchase_to_other_product_rebuilds_both(db_session: Session, business_id: int) -> None:
+    service = InventoryService(db_session, business_id=business_id)
+    _create_locations(db_session, business_id)
+    _create_product(db_session, business_id)
+    other = Product(business_id=business_id, sku="SKU-OTRO", name="Otro", unit_of_measure="ud")
+    db_session.add(other)
+    db_session.commit()
+    purchase = service.purchase(PurchaseCreate(sku="SKU-TST", quantity=2, unit_cost=1.0, lot_code="L1"))
+
+    service.update_purchase(purchase.movement.id, "SKU-OTRO", 3, 2.0, None, "L9", None)
+
+    lots = list(db_session.scalars(select(InventoryLot)))
+    assert [(lot.product_id, lot.lot_code, lot.qty_remaining) for lot in lots] == [(other.id, "L9", 3)]
+    assert service.stock_for_location("SKU-TST", "CENTRAL") == 0
+
+
+def test_stock_list_reports_recent_daily_sales(db_session: Session, business_id: int) -> None:
+    service = InventoryService(db_session, business_id=business_id)
+    _create_locations(db_session, business_id)
+    _create_product(db_session, business_id)
+    service.purchase(PurchaseCreate(sku="SKU-TST", quantity=10, unit_cost=1.0))
+    service.sale(SaleCreate(sku="SKU-TST", quantity=3, location_code="CENTRAL"))
+
+    (row,) = service.stock_list(location_code="CENTRAL")
+
+    assert row.sku == "SKU-TST"
+    assert row.avg_daily_sales == pytest.approx(0.1)
+    assert row.reorder_in_days == 70
+
+
+def test_consume_fifo_requests_quantity_at_column_scale(
+    db_session: Session, business_id: int, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    service = InventoryService(db_session, business_id=business_id)
+    requested: list[float] = []
+
+    def _allocate(product_id, location_id, movement_id, quantity):
+        requested.append(quantity)
+        # As on PostgreSQL: the returned takes are stored as numeric(14, 4).
+        return round(quantity, 4)
+
+    monkeypatch.setattr(service._inventory, "allocate_fifo", _allocate)
+
+    service._consume_fifo(1, 1, 1, 1.33333333)
+
+    assert requested == [1.3333]
+
+
+def test_purchase_bulk_creates_lots_with_distinct_codes(db_session: Session, business_id: int, now_utc: datetime) -> None:
+    service = InventoryService(db_session, business_id=business_id)
+    _create_locations(db_session, business_id)
+    product = _create_product(db_session, business_id)
+
+    service.purchase_bulk(
+        [
+            PurchaseCreate(sku="SKU-TST", quantity=2, unit_cost=1.5, movement_date=now_utc),
+            PurchaseCreate(sku="SKU-TST", quantity=3, unit_cost=1.0, movement_date=now_utc),
+        ]
+    )
+
+    lots = list(db_session.scalars(select(InventoryLot).order_by(InventoryLot.id)))
+    assert [lot.qty_remaining for lot in lots] == [2, 3]
+    assert len({lot.lot_code for lot in lots}) == 2
+    assert service.stock_for_location("SKU-TST", "CENTRAL") == 5
+    assert product.default_purchase_cost == 1.0
+
+    with pytest.raises(HTTPException) as exc:
+        service.purchase_bulk([PurchaseCreate(sku="SKU-TST", quantity=1), PurchaseCreate(sku="NOPE", quantity=1)])
+    assert exc.value.status_code == 404
+    assert service.stock_for_location("SKU-TST", "CENTRAL") == 5
+
+    # Same minute as the committed lots: the generated code must skip theirs.
+    service.purchase_bulk([PurchaseCreate(sku="SKU-TST", quantity=1, unit_cost=1.0, movement_date=now_utc)])
+    assert len(set(db_session.scalars(select(InventoryLot.lot_code)))) == 3
+
+
+def test_delete_purchase_removes_its_lot(db_session: Session, business_id: int) -> None:
+    service = InventoryService(db_session, business_id=business_id)
+    _create_locations(db_session, business_id)
+    _create_product(db_session, business_id)
+    kept = service.purchase(PurchaseCreate(sku="SKU-TST", quantity=3, unit_cost=1.0, lot_code="KEEP"))
+    dropped = service.purchase(PurchaseCreate(sku="SKU-TST", quantity=4, unit_cost=2.0, lot_code="DROP"))
+
+    service.delete_purchase_movement(dropped.movement.id)
+
+    lots = list(db_session.scalars(select(InventoryLot)))
+    assert [(lot.movement_id, lot.lot_code, lot.qty_remaining) for lot in lots] == [(kept.movement.id, "KEEP", 3)]
+    assert db_session.get(InventoryMovement, dropped.movement.id) is None
+
+
+def test_sales_by_product_orders_items_and_totals_in_sql(
+    db_session: Session, business_id: int, now_utc: datetime
+) -> None:
+    service = InventoryService(db_session, business_id=business_id)
+    _create_locations(db_session, business_id)
+    _create_product(db_session, business_id)
+    db_session.add(
+        Product(business_id=business_id, sku="SKU-TOP", name="Top", min_stock=0, unit_of_measure="ud", lead_time_days=0)
+    )
+    db_session.commit()
+    for sku in ("SKU-TST", "SKU-TOP"):
+        service.purchase(PurchaseCreate(sku=sku, quantity=5, unit_cost=1.0, movement_date=now_utc))
+    service.sale(SaleCreate(sku="SKU-TST", quantity=1, unit_price=2.0, location_code="CENTRAL", movement_date=now_utc))
+    service.sale(SaleCreate(sku="SKU-TOP", quantity=2, unit_price=4.0, location_code="CENTRAL", movement_date=now_utc))
+
+    start, end = service._month_range(now_utc)
+    total, items = service.sales_by_product(start, end)
+
+    assert total == 10.0 and isinstance(total, float)
+    assert [(i["sku"], i["sales"]) for i in items] == [("SKU-TOP", 8.0), ("SKU-TST", 2.0)]
+    assert all(isinstance(i["qty"], float) and isinstance(i["sales"], float) for i in items)
+    days = service.daily_sales_series(start, end)
+    assert sum(d["sales"] for d in days) == 10.0
+    assert all(isinstance(d["sales"], float) for d in days)
+    assert service.sales_by_product(end, end + (end - start)) == (0.0, [])
+
+
+def test_consume_fifo_bulk_writes_keep_loaded_lots_in_sync(db_session: Session, business_id: int) -> None:
+    service = InventoryService(db_session, business_id=business_id)
+    central, _pos1 = _create_locations(db_session, business_id)
+    product = _create_product(db_session, business_id)
+    service.purchase(PurchaseCreate(sku="SKU-TST", quantity=2, unit_cost=1.0, lot_code="A"))
+    service.purchase(PurchaseCreate(sku="SKU-TST", quantity=2, unit_cost=3.0, lot_code="B"))
+    mv = InventoryMovement(business_id=business_id, product_id=product.id, location_id=central.id, type="sale", quantity=-3)
+    db_session.add(mv)
+    db_session.flush()
+
+    service._consume_fifo(product.id, central.id, mv.id, 1.0)
+    service._consume_fifo(product.id, central.id, mv.id, 2.0)
+
+    lots = {lot.lot_code: lot.qty_remaining for lot in db_session.scalars(select(InventoryLot))}
+    assert lots == {"A": 0, "B": 1}
+    allocs = [(a.quantity, a.unit_cost) for a in db_session.scalars(select(MovementAllocation).order_by(MovementAllocation.id))]
+    assert allocs == [(1, 1), (1, 1), (1, 3)]
+    assert not db_session.dirty
+
+
+def test_sales_metrics_table_weekly_stats(db_session: Session, business_id: int) -> None:
+    service = InventoryService(db_session, business_id=business_id)
+    _create_locations(db_session, business_id)
+    _create_product(db_session, business_id)
+    now = datetime(2026, 6, 17, 15, 0, tzinfo=timezone.utc)
+    service.purchase(PurchaseCreate(sku="SKU-TST", quantity=100, unit_cost=1.0, movement_date=now - timedelta(days=200)))
+    for days, qty in [(3, 2), (10, 5), (17, 1), (40, 4), (90, 3), (150, 6), (0, 1)]:
+        service.sale(
+            SaleCreate(
+                sku="SKU-TST",
+                quantity=qty,
+                unit_price=2.0,
+                location_code="CENTRAL",
+                movement_date=now - timedelta(days=days, hours=1),
+            )
+        )
+
+    (row,) = service.sales_metrics_table(now)
+
+    assert row["qty_period"] == 22.0
+    assert row["stock_qty"] == 78.0
+    assert row["avg_weekly_sales"] == pytest.approx(22 / 23)
+    assert row["std_weekly_sales"] == pytest.approx(1.7564356414542743)
+    assert row["safety_stock"] == 5.0
+    assert row["reorder_point"] == pytest.approx(8.416149068322982)
+    assert row["reorder_shortage"] == 0.0
+
+
+def test_daily_sales_series_fills_days_without_sales(db_session: Session, business_id: int) -> None:
+    service = InventoryService(db_session, business_id=business_id)
+    _create_locations(db_session, business_id)
+    _create_product(db_session, business_id)
+    day0 = datetime(2026, 3, 2, tzinfo=timezone.utc)
+    service.purchase(PurchaseCreate(sku="SKU-TST", quantity=5, unit_cost=1.0, movement_date=day0))
+    service.sale(
+        SaleCreate(sku="SKU-TST", quantity=2, unit_price=3.0, location_code="CENTRAL", movement_date=day0 + timedelta(days=1, hours=23))
+    )
+
+    series = service.daily_sales_series(day0, day0 + timedelta(days=3))
+
+    assert series == [
+        {"day": "2026-03-02", "sales": 0.0},
+        {"day": "2026-03-03", "sales": 6.0},
+        {"day": "2026-03-04", "sales": 0.0},
+    ]
+
+
+def test_monthly_overview_groups_by_utc_month(db_session: Session, business_id: int) -> None:
+    service = InventoryService(db_session, business_id=business_id)
+    _create_locations(db_session, business_id)
+    _create_product(db_session, business_id)
+    feb = datetime(2026, 2, 27, tzinfo=timezone.utc)
+    service.purchase(PurchaseCreate(sku="SKU-TST", quantity=4, unit_cost=2.0, movement_date=feb))
+    service.sale(SaleCreate(sku="SKU-TST", quantity=1, unit_price=5.0, location_code="CENTRAL", movement_date=feb))
+    service.sale(
+        SaleCreate(sku="SKU-TST", quantity=2, unit_price=5.0, location_code="CENTRAL", movement_date=feb + timedelta(days=3))
+    )
+
+    series = service.monthly_overview(months=2, now=datetime(2026, 3, 15, tzinfo=timezone.utc))
+
+    assert [(r["month"], r["sales"], r["purchases"], r["gross_profit"]) for r in series] == [
+        ("2026-02", 5.0, 8.0, 3.0),
+        ("2026-03", 10.0, 0.0, 6.0),
+    ]
+
+
+def test_reset_purchases_and_sales_keeps_other_movements(db_session: Session, business_id: int) -> None:
+    service = InventoryService(db_session, business_id=business_id)
+    _create_locations(db_session, business_id)
+    product = _create_product(db_session, business_id)
+    service.purchase(PurchaseCreate(sku="SKU-TST", quantity=5, unit_cost=1.0))
+    service.sale(SaleCreate(sku="SKU-TST", quantity=2, location_code="CENTRAL"))
+    db_session.add(InventoryMovement(business_id=business_id, product_id=product.id, type="adjustment", quantity=1))
+    db_session.commit()
+
+    service.reset_purchases_and_sales()
+
+    assert [m.type for m in db_session.scalars(select(InventoryMovement))] == ["adjustment"]
+    assert list(db_session.scalars(select(InventoryLot))) == []
+    assert list(db_session.scalars(select(MovementAllocation))) == []
+
+
+def test_bulk_create_expenses_and_extractions(db_session: Session, business_id: int, now_utc: datetime) -> None:
+    service = InventoryService(db_session, business_id=business_id)
+
+    service.create_expenses_bulk([(10.0, " Alquiler ", now_utc), (5.5, "Luz", now_utc)])
+    service.create_extractions_bulk([("Liandy", 3.0, "Retiro", now_utc)])
+
+    expenses = list(db_session.scalars(select(OperatingExpense).order_by(OperatingExpense.id)))
+    assert [(e.amount, e.concept, e.business_id) for e in expenses] == [
+        (10.0, "Alquiler", business_id),
+        (5.5, "Luz", business_id),
+    ]
+    (extraction,) = db_session.scalars(select(MoneyExtraction))
+    assert (extraction.party, extraction.amount) == ("Liandy", 3.0)
+
+
+def test_list_expenses_and_extractions_return_column_rows(
+    db_session: Session, business_id: int, now_utc: datetime
+) -> None:
+    service = InventoryService(db_session, business_id=business_id)
+    service.create_expenses_bulk([(10.0, "Alquiler", now_utc - timedelta(days=1)), (5.5, "Luz", now_utc)])
+    service.create_extractions_bulk([("Liandy", 3.0, "Retiro", now_utc)])
+
+    expenses = service.list_expenses(limit=10)
+    (extraction,) = service.list_extractions(limit=10)
+
+    assert [(e.concept, e.amount) for e in expenses] == [("Luz", 5.5), ("Alquiler", 10.0)]
+    assert (extraction.party, extraction.concept, extraction.amount) == ("Liandy", "Retiro", 3.0)
+    assert extraction.id is not None and extraction.extraction_date is not None
+
+
+def test_lot_stamp_matches_strftime() -> None:
+    dt = datetime(2007, 3, 4, 5, 6, 7, tzinfo=timezone.utc)
+
+    assert _lot_stamp(dt) == f"{dt:%y%m%d%H%M}"
+    assert _lot_stamp(dt, seconds=True) == f"{dt:%y%m%d%H%M%S}"
+
+
+def test_movement_read_matches_validation() -> None:
+    mv = InventoryMovement(
+        id=7,
+        product_id=3,
+        location_id=None,
+        type="purchase",
+        quantity=4,
+        unit_cost=2,
+        unit_price=None,
+        movement_date=datetime(2026, 1, 2, tzinfo=timezone.utc),
+        note=None,
+    )
+
+    assert _movement_read(mv).model_dump() == MovementRead.model_validate(mv).model_dump()
+
+
+def test_track_financials_execute_only_flags_financial_tables(db_session: Session) -> None:
+    class _State:
+        def __init__(self, statement, *, is_update: bool = False):
+            self.statement = statement
+            self.session = db_session
+            self.is_insert = False
+            self.is_update = is_update
+            self.is_delete = False
+
+    _track_financials_execute(_State(update(Product).values(name="x"), is_update=True))
+    _track_financials_execute(_State(text("UPDATE products SET name = 'x'")))
+    _track_financials_execute(_State(select(InventoryMovement)))
+    assert _FINANCIALS_DIRTY not in db_session.info
+
+    _track_financials_execute(_State(update(InventoryLot).values(qty_remaining=0), is_update=True))
+    assert _FINANCIALS_DIRTY not in db_session.info
+
+    _track_financials_execute(_State(text("DELETE FROM movement_allocations WHERE movement_id = 1")))
+    assert db_session.info.pop(_FINANCIALS_DIRTY) is True
+
+    _track_financials_execute(_State(update(InventoryMovement).values(note="x"), is_update=True))
+    assert db_session.info.pop(_FINANCIALS_DIRTY) is True
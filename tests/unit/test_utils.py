@@ -1,8 +1,8 @@
 from __future__ import annotations
 
-from datetime import datetime, timezone
+from datetime import datetime, timedelta, timezone
 
-from app.utils import get_session_secret, month_range, normalize_text, query_match
+from app.utils import add_months, get_session_secret, month_range, normalize_text, query_match
 
 
 def test_month_range_from_naive_datetime_uses_utc_boundaries() -> None:
@@ -17,6 +17,12 @@ def test_month_range_december_rollover() -> None:
     assert end == datetime(2027, 1, 1, 0, 0, 0, tzinfo=timezone.utc)
 
 
+def test_month_range_uses_utc_month_of_offset_datetime() -> None:
+    start, end = month_range(datetime(2026, 8, 1, 1, 30, tzinfo=timezone(timedelta(hours=2))))
+    assert start == datetime(2026, 7, 1, 0, 0, 0, tzinfo=timezone.utc)
+    assert end == datetime(2026, 8, 1, 0, 0, 0, tzinfo=timezone.utc)
+
+
 def test_normalize_text_removes_accents() -> None:
     assert normalize_text("Almacén") == "Almacen"
     assert normalize_text("Almacén Central") == "Almacen Central"
@@ -41,3 +47,9 @@ def test_get_session_secret_generates_when_missing(monkeypatch) -> None:
     assert isinstance(secret, str)
     assert len(secret) == 64
 
+
+def test_add_months_crosses_year_boundaries() -> None:
+    start = datetime(2026, 2, 1, tzinfo=timezone.utc)
+    assert add_months(start, -2) == datetime(2025, 12, 1, tzinfo=timezone.utc)
+    assert add_months(start, 11) == datetime(2027, 1, 1, tzinfo=timezone.utc)
+    assert add_months(start, 0) == start